@@ -8,7 +8,6 @@ import os
 import signal
 import sys
 import time
-import httpx
 from typing import Optional
 from mihomo_sync.logger import setup_logger
 from mihomo_sync.config import ConfigManager
@@ -18,7 +17,7 @@ from mihomo_sync.modules.state_monitor import StateMonitor
 from mihomo_sync.modules.mihomo_config_parser import MihomoConfigParser
 from mihomo_sync.modules.rule_generation_orchestrator import RuleGenerationOrchestrator
 from mihomo_sync.modules.rule_merger import RuleMerger
-from mihomo_sync.modules.rule_downloader import RuleDownloader
+from mihomo_sync.modules.download_client import DownloadClient
 
 
 class MihomoMosdnsSyncService:
@@ -34,12 +33,18 @@ class MihomoMosdnsSyncService:
         self.state_monitor: Optional[StateMonitor] = None
         self.rule_orchestrator: Optional[RuleGenerationOrchestrator] = None
         self.rule_merger: Optional[RuleMerger] = None
-        # 注意：RuleDownloader现在由RuleGenerationOrchestrator内部管理
+        # 规则下载客户端在服务的整个生命周期内共享，连接跨多次生成复用
+        self.download_client: Optional[DownloadClient] = None
         self.shutdown_event = asyncio.Event()
         self.start_time = None
 
-    async def initialize(self, httpx_client=None):
-        """初始化服务的所有组件。"""
+    async def initialize(self, download_client: Optional[DownloadClient] = None):
+        """
+        初始化服务的所有组件。
+
+        Args:
+            download_client: 规则下载客户端（可选），未提供时按配置创建
+        """
         self.logger.info("正在初始化Mihomo-Mosdns同步服务")
         self.start_time = time.time()
         
@@ -96,13 +101,18 @@ class MihomoMosdnsSyncService:
             
             # 初始化新的规则处理组件
             self.rule_merger = RuleMerger()
-            # 现在RuleDownloader由RuleGenerationOrchestrator内部管理，不需要单独初始化
+            self.download_client = download_client or RuleGenerationOrchestrator.create_download_client(
+                self.config_manager
+            )
             self.rule_orchestrator = RuleGenerationOrchestrator(
                 api_client=self.api_client,
                 config=self.config_manager,
                 mihomo_config_parser=self.mihomo_config_parser,
-                mihomo_config_path=self.config_manager.get_mihomo_config_path()
+                mihomo_config_path=self.config_manager.get_mihomo_config_path(),
+                download_client=self.download_client
             )
+            # 迁移旧版中间目录布局（旧版本每次生成都会删除并重建整个中间目录）
+            self.rule_orchestrator.migrate_workspace_layout()
             
             self.logger.debug("规则处理组件初始化完成")
             
@@ -118,6 +128,10 @@ class MihomoMosdnsSyncService:
                 orchestrator=self.rule_orchestrator,
                 merger=self.rule_merger
             )
+            # 后台重新验证发现远程规则集内容变化时，再生成一次规则
+            self.rule_orchestrator.set_content_changed_callback(
+                lambda: self.state_monitor.trigger_generation("后台重新验证发现远程规则集内容变化")
+            )
             
             self.logger.debug(
                 "状态监控器初始化完成",
@@ -241,14 +255,14 @@ class MihomoMosdnsSyncService:
         
         return True
 
-    async def start(self, httpx_client=None):
+    async def start(self, download_client: Optional[DownloadClient] = None):
         """启动同步服务。"""
         start_time = time.time()
         self.logger.info("正在启动同步服务")
         
         try:
             # 初始化服务
-            await self.initialize(httpx_client)
+            await self.initialize(download_client)
             
             # 执行健康检查
             if not await self.health_check():
@@ -260,6 +274,8 @@ class MihomoMosdnsSyncService:
                 loop = asyncio.get_running_loop()
                 for sig in (signal.SIGTERM, signal.SIGINT):
                     loop.add_signal_handler(sig, self._signal_handler, sig)
+                # SIGUSR1：忽略提供者的interval，强制刷新远程规则集并重新生成
+                loop.add_signal_handler(signal.SIGUSR1, self._refresh_handler)
             
             # 检查所需组件是否已初始化
             if self.state_monitor is None:
@@ -314,6 +330,14 @@ class MihomoMosdnsSyncService:
         )
         self.shutdown_event.set()
 
+    def _refresh_handler(self):
+        """处理强制刷新信号：下一次生成重新验证所有远程规则集，并立即触发一次生成。"""
+        self.logger.info("收到信号 SIGUSR1，将强制刷新远程规则集")
+        if self.rule_orchestrator is None or self.state_monitor is None:
+            return
+        self.rule_orchestrator.request_refresh()
+        asyncio.get_running_loop().create_task(self.state_monitor.trigger_generation())
+
     async def cleanup(self):
         """清理资源。"""
         self.logger.info("正在清理资源")
@@ -324,6 +348,16 @@ class MihomoMosdnsSyncService:
             await self.api_client.close()
             self.logger.debug("API客户端已关闭")
         
+        # 等待旧工作空间的后台删除完成
+        if self.rule_orchestrator:
+            await self.rule_orchestrator.close()
+            self.logger.debug("规则生成协调器已关闭")
+        
+        # 关闭规则下载客户端及其连接池
+        if self.download_client:
+            await self.download_client.close()
+            self.logger.debug("规则下载客户端已关闭")
+        
         cleanup_duration = time.time() - cleanup_start_time
         self.logger.info(
             "清理完成",
@@ -335,10 +369,9 @@ class MihomoMosdnsSyncService:
 
 async def main():
     """主异步函数。"""
-    async with httpx.AsyncClient() as client:
-        service = MihomoMosdnsSyncService()
-        exit_code = await service.start(client)
-        return exit_code
+    service = MihomoMosdnsSyncService()
+    exit_code = await service.start()
+    return exit_code
 
 
 if __name__ == "__main__":
@@ -75,6 +75,18 @@ class ConfigManager:
         """Get the API retry configuration dictionary."""
         return self._config.get('api_retry_config')
 
+    def get_download_client_config(self):
+        """Get the rule download client configuration dictionary (http2, pool limits, keep-alive expiry, concurrency caps, Retry-After limit)."""
+        return self._config.get('download_client') or {}
+
+    def get_download_cache_compression(self):
+        """Get the on-disk compression of downloaded rule files (none, gzip or zstd)."""
+        return str(self._config.get('download_cache_compression') or 'none').lower()
+
+    def get_download_mirrors_config(self):
+        """Get the rule download mirror configuration (prefix groups, alternate URLs, hedging thresholds)."""
+        return self._config.get('download_mirrors') or {}
+
     def get_polling_interval(self):
         """Get the monitoring polling interval in seconds."""
         return self._config.get('polling_interval')
@@ -91,6 +103,54 @@ class ConfigManager:
         """Get the path to the cache directory."""
         return self._config.get('cache_dir_path', '')
 
+    def get_intermediate_debug_dump(self):
+        """Get whether to dump per-provider intermediate files for debugging."""
+        return bool(self._config.get('intermediate_debug_dump', False))
+
+    def get_generation_memory_budget_mb(self):
+        """Get the memory budget (MB) for the sort buffer and ruleset parsing; 0 keeps everything in memory."""
+        return max(int(self._config.get('generation_memory_budget_mb', 0) or 0), 0)
+
+    def get_exclusive_policy_outputs(self):
+        """Get whether to drop domain entries shadowed by earlier rules (first match wins)."""
+        return bool(self._config.get('exclusive_policy_outputs', False))
+
+    def get_optimize_domain_matchers(self):
+        """Get whether to rewrite regexp/keyword entries into equivalent hashed full:/domain: matchers."""
+        return bool(self._config.get('optimize_domain_matchers', False))
+
+    def get_compact_domain_outputs(self):
+        """Get whether to drop domain entries covered by a broader domain: entry of the same policy."""
+        return bool(self._config.get('compact_domain_outputs', False))
+
+    def get_collapse_ip_outputs(self):
+        """Get whether to merge IP outputs into a minimal CIDR cover in numeric order."""
+        return bool(self._config.get('collapse_ip_outputs', False))
+
+    def get_resolve_ip_conflicts(self):
+        """Get whether to remove cross-policy IP overlaps by first-match rule order."""
+        return bool(self._config.get('resolve_ip_conflicts', False))
+
+    def get_ip_conflict_report_path(self):
+        """Get the path of the IP conflict report (JSON)."""
+        return self._config.get('ip_conflict_report_path', '')
+
+    def get_geosite_path(self):
+        """Get the path to Mihomo's geosite.dat; empty means GeoSite.dat next to the Mihomo config."""
+        return self._config.get('geosite_path', '')
+
+    def get_geoip_path(self):
+        """Get the path to Mihomo's Country.mmdb or geoip.dat; empty means the database next to the Mihomo config."""
+        return self._config.get('geoip_path', '')
+
+    def get_default_provider_interval(self):
+        """Get the cache TTL in seconds for rule providers that declare no interval (0 = always revalidate)."""
+        return float(self._config.get('default_provider_interval', 0) or 0)
+
+    def get_stale_while_revalidate(self):
+        """Get whether generation uses cached rule providers immediately and revalidates them in the background."""
+        return bool(self._config.get('stale_while_revalidate', False))
+
     def get_mosdns_reload_command(self):
         """Get the command to reload the Mosdns service."""
         return self._config.get('mosdns_reload_command')
@@ -0,0 +1,108 @@
+import gzip
+import io
+from typing import BinaryIO
+
+try:
+    import zstandard
+except ImportError:  # zstandard为可选依赖
+    zstandard = None
+
+try:
+    from compression import zstd as stdlib_zstd  # Python 3.14+
+except ImportError:
+    stdlib_zstd = None
+
+
+# 缓存文件的压缩方式
+COMPRESSION_NONE = "none"
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_ZSTD = "zstd"
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+# 判断压缩方式所需读取的文件开头字节数
+MAGIC_SIZE = len(_ZSTD_MAGIC)
+_GZIP_LEVEL = 6
+_ZSTD_LEVEL = 10
+
+
+def is_supported(method: str) -> bool:
+    """当前环境是否可以用该方式压缩和解压缓存文件。"""
+    if method == COMPRESSION_ZSTD:
+        return zstandard is not None or stdlib_zstd is not None
+    return method in (COMPRESSION_NONE, COMPRESSION_GZIP)
+
+
+def detect_compression(head: bytes) -> str:
+    """
+    根据文件开头的魔数判断压缩方式。
+
+    Args:
+        head: 文件开头的MAGIC_SIZE个字节
+
+    Returns:
+        str: COMPRESSION_* 之一
+    """
+    if head.startswith(_ZSTD_MAGIC):
+        return COMPRESSION_ZSTD
+    if head.startswith(_GZIP_MAGIC):
+        return COMPRESSION_GZIP
+    return COMPRESSION_NONE
+
+
+def open_decompressed(file_path: str) -> BinaryIO:
+    """
+    以二进制方式打开文件，压缩过的文件返回流式解压的读取器，未压缩的文件原样返回。
+
+    解压按读取进度逐块进行，不会把整个文件读入内存。
+
+    Args:
+        file_path: 文件路径
+
+    Returns:
+        BinaryIO: 可读的二进制流，由调用方关闭
+
+    Raises:
+        RuntimeError: 文件为zstd压缩但没有可用的zstd实现
+    """
+    raw = open(file_path, "rb")
+    try:
+        method = detect_compression(raw.read(MAGIC_SIZE))
+        raw.seek(0)
+        # GzipFile和标准库的ZstdFile关闭时不会关闭传入的文件对象，改为由它们自己按路径打开文件
+        if method == COMPRESSION_GZIP:
+            raw.close()
+            return gzip.open(file_path, "rb")
+        if method == COMPRESSION_ZSTD:
+            if zstandard is not None:
+                return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True))
+            if stdlib_zstd is not None:
+                raw.close()
+                return stdlib_zstd.ZstdFile(file_path, "rb")
+            raise RuntimeError(f"文件为zstd压缩，但未安装zstandard: {file_path}")
+    except BaseException:
+        raw.close()
+        raise
+    return raw
+
+
+def open_compressor(raw: BinaryIO, method: str) -> BinaryIO:
+    """
+    返回把写入的数据压缩后写到raw的流；关闭它会写出压缩流的结尾，但不会关闭raw。
+
+    Args:
+        raw: 以二进制写方式打开的文件
+        method: COMPRESSION_GZIP 或 COMPRESSION_ZSTD
+
+    Returns:
+        BinaryIO: 可写的二进制流
+    """
+    if method == COMPRESSION_GZIP:
+        # 固定mtime，相同内容压缩后的字节也相同
+        return gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=_GZIP_LEVEL, mtime=0)
+    if method == COMPRESSION_ZSTD:
+        if zstandard is not None:
+            return zstandard.ZstdCompressor(level=_ZSTD_LEVEL).stream_writer(raw, closefd=False)
+        if stdlib_zstd is not None:
+            return stdlib_zstd.ZstdFile(raw, "wb", level=_ZSTD_LEVEL)
+    raise ValueError(f"不支持的缓存压缩方式: {method}")
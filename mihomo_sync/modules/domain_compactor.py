@@ -0,0 +1,93 @@
+import logging
+import time
+from typing import Dict, List, Set, Tuple
+
+from mihomo_sync.modules.rule_store import KIND_DOMAIN, KIND_FULL, RuleColumn, RuleStore, filter_column, split_line
+
+
+class DomainCompactor:
+    """
+    按策略压缩域名规则，去除已被更宽泛的 domain: 条目覆盖的条目。
+
+    每个domain/full条目转换为反转标签键（标签之间用"\\x00"分隔，domain以"\\x00"结尾，
+    full以"\\x00\\x01"结尾）。排序后某个domain条目覆盖的所有条目恰好是紧随其后、
+    以它的键为前缀的一段连续区间，因此只需一次扫描并维护当前的覆盖键。
+    """
+
+    CONTENT_TYPE = "domain"
+
+    _DOMAIN_END = b"\x00"
+    _FULL_END = b"\x00\x01"
+
+    def __init__(self):
+        """
+        初始化DomainCompactor。
+        """
+        self.logger = logging.getLogger(__name__)
+
+    def compact(self, store: RuleStore) -> Dict[str, int]:
+        """
+        压缩已冻结的RuleStore中各策略的域名规则，并替换对应的规则列。
+
+        Args:
+            store: 已冻结的规则存储
+
+        Returns:
+            dict: {策略: 删除的条目数}
+        """
+        start_time = time.time()
+        removed_counts: Dict[str, int] = {}
+        columns: Dict[str, List[Tuple[str, RuleColumn]]] = {}
+
+        for policy in store.policies():
+            removed = self._find_covered(store, policy)
+            removed_counts[policy] = len(removed)
+            filtered = (
+                (name, filter_column(column, removed))
+                for name, column in store.iter_provider_columns(policy, self.CONTENT_TYPE)
+            )
+            columns[policy] = [(name, column) for name, column in filtered if len(column)]
+        store.replace_columns(self.CONTENT_TYPE, columns)
+
+        duration = time.time() - start_time
+        self.logger.info(
+            f"域名规则压缩完成，共删除 {sum(removed_counts.values())} 条被覆盖的条目",
+            extra={
+                "删除条目数": removed_counts,
+                "耗时_秒": round(duration, 3)
+            }
+        )
+        return removed_counts
+
+    def _find_covered(self, store: RuleStore, policy: str) -> Set[bytes]:
+        """
+        找出某策略中被其他domain条目覆盖的规则行。
+
+        Returns:
+            set: 被覆盖的完整规则行
+        """
+        keys = []
+        for line in store.iter_lines(policy, self.CONTENT_TYPE):
+            kind, value = split_line(line)
+            if not value:
+                continue
+            if kind == KIND_DOMAIN:
+                keys.append(b"\x00".join(value.split(b".")[::-1]) + self._DOMAIN_END)
+            elif kind == KIND_FULL:
+                keys.append(b"\x00".join(value.split(b".")[::-1]) + self._FULL_END)
+        keys.sort()
+
+        removed = set()
+        cover = None
+        for key in keys:
+            if cover is not None and key.startswith(cover):
+                removed.add(self._key_to_line(key))
+            elif not key.endswith(self._FULL_END):
+                cover = key
+        return removed
+
+    def _key_to_line(self, key: bytes) -> bytes:
+        """将反转标签键还原为Mosdns规则行。"""
+        if key.endswith(self._FULL_END):
+            return b"full:" + b".".join(key[:-2].split(b"\x00")[::-1])
+        return b"domain:" + b".".join(key[:-1].split(b"\x00")[::-1])
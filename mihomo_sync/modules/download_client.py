@@ -0,0 +1,137 @@
+import logging
+from typing import Any, Dict, Optional
+
+import httpx
+
+try:
+    import h2  # noqa: F401  httpx的HTTP/2支持依赖h2
+    HTTP2_AVAILABLE = True
+except ImportError:  # h2为可选依赖，缺失时只使用HTTP/1.1
+    HTTP2_AVAILABLE = False
+
+# httpx解码br和zstd响应分别依赖brotli（或brotlicffi）和zstandard，只声明能解码的编码
+try:
+    import brotli  # noqa: F401
+    BROTLI_AVAILABLE = True
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        BROTLI_AVAILABLE = True
+    except ImportError:
+        BROTLI_AVAILABLE = False
+
+try:
+    import zstandard  # noqa: F401
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+
+def build_accept_encoding() -> str:
+    """按压缩率从高到低列出可解码的传输编码，如 "zstd, br;q=0.9, gzip;q=0.8"。"""
+    encodings = [name for name, available in (("zstd", ZSTD_AVAILABLE), ("br", BROTLI_AVAILABLE), ("gzip", True))
+                 if available]
+    return ", ".join(
+        name if index == 0 else f"{name};q={1 - index / 10:.1f}" for index, name in enumerate(encodings)
+    )
+
+
+class _TracingTransport(httpx.AsyncHTTPTransport):
+    """为每个请求挂上httpcore的trace回调，统计新建连接、TLS握手和请求使用的协议。"""
+
+    def __init__(self, stats: Dict[str, int], **kwargs: Any):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self._stats["requests"] += 1
+        request.extensions["trace"] = self._trace
+        return await super().handle_async_request(request)
+
+    async def _trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            self._stats["connections"] += 1
+        elif event_name == "connection.start_tls.complete":
+            self._stats["tls_handshakes"] += 1
+        elif event_name == "http2.send_request_headers.started":
+            self._stats["http2_requests"] += 1
+        elif event_name == "http11.send_request_headers.started":
+            self._stats["http11_requests"] += 1
+
+
+class DownloadClient:
+    """
+    服务生命周期内共享的规则下载HTTP客户端。
+
+    每次生成都新建 httpx.AsyncClient 时，对同一镜像站的每次同步都要重新做DNS解析和TLS握手；
+    这里只在首次使用时创建一个客户端并在服务退出时关闭，连接在keep-alive期限内跨生成复用。
+    安装了h2时启用HTTP/2，服务端支持时同一主机的并发下载复用一条连接。
+    请求声明可解码的压缩传输编码（zstd、br、gzip），响应体在读取时流式解压。
+    通过trace回调统计请求数、新建连接数和TLS握手数，用于确认连接确实被复用。
+    """
+
+    def __init__(self, http2: bool = True, max_connections: int = 16, max_keepalive_connections: int = 8,
+                 keepalive_expiry: float = 300.0):
+        """
+        初始化DownloadClient。
+
+        Args:
+            http2: 是否在安装了h2时启用HTTP/2
+            max_connections: 连接池的最大连接数
+            max_keepalive_connections: 保持空闲的最大连接数
+            keepalive_expiry: 空闲连接的保持时间（秒），应覆盖两次生成之间的典型间隔
+        """
+        self.logger = logging.getLogger(__name__)
+        self.http2 = http2 and HTTP2_AVAILABLE
+        if http2 and not HTTP2_AVAILABLE:
+            self.logger.info("未安装h2，规则下载使用HTTP/1.1（pip install -e .[http2] 可启用HTTP/2）")
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self._stats = {
+            "requests": 0,
+            "connections": 0,
+            "tls_handshakes": 0,
+            "http2_requests": 0,
+            "http11_requests": 0,
+        }
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """共享的 httpx.AsyncClient，首次访问时创建。"""
+        if self._client is None or self._client.is_closed:
+            transport = _TracingTransport(self._stats, http2=self.http2, limits=self.limits)
+            self._client = httpx.AsyncClient(
+                transport=transport, headers={"Accept-Encoding": build_accept_encoding()}
+            )
+            self.logger.debug(
+                "已创建规则下载客户端",
+                extra={
+                    "http2": self.http2,
+                    "max_connections": self.limits.max_connections,
+                    "keepalive_expiry": self.limits.keepalive_expiry,
+                    "accept_encoding": build_accept_encoding()
+                }
+            )
+        return self._client
+
+    def stats(self) -> Dict[str, int]:
+        """
+        获取累计的连接复用统计。
+
+        Returns:
+            dict: 请求数、新建连接数、TLS握手数、各协议的请求数，以及复用已有连接的请求数
+        """
+        stats = dict(self._stats)
+        stats["reused_requests"] = max(stats["requests"] - stats["connections"], 0)
+        return stats
+
+    async def close(self) -> None:
+        """关闭客户端及其连接池，并记录累计的连接复用统计。"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            self.logger.info("规则下载客户端已关闭", extra={"连接统计": self.stats()})
+        self._client = None
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """
+    解析Retry-After响应头。
+
+    Args:
+        value: 秒数（如 "120"）或HTTP日期（如 "Wed, 21 Oct 2015 07:28:00 GMT"）
+        now: 当前时间戳，默认取当前时间
+
+    Returns:
+        float: 需要等待的秒数（不小于0），无法解析时返回None
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+    return max(retry_at - (time.time() if now is None else now), 0.0)
+
+
+class DownloadScheduler:
+    """
+    规则下载的并发调度器。
+
+    所有请求共用一个全局并发上限，同一主机的请求另有单独的上限，这样大多数提供者共用的
+    镜像站不会被瞬间打满。某个主机返回429/503时，该主机进入冷却期（优先使用Retry-After），
+    冷却期内它的请求只占用该主机自己的名额排队等待，不占用全局名额，其他主机的下载不受影响。
+    """
+
+    def __init__(self, max_concurrency: int = 8, per_host_concurrency: int = 4):
+        """
+        初始化DownloadScheduler。
+
+        Args:
+            max_concurrency: 全局最大并发请求数
+            per_host_concurrency: 每个主机的最大并发请求数
+        """
+        self.logger = logging.getLogger(__name__)
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.per_host_concurrency = max(int(per_host_concurrency), 1)
+        self._global = asyncio.Semaphore(self.max_concurrency)
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+        # 各主机冷却期的结束时间（time.monotonic）
+        self._cooldown_until: Dict[str, float] = {}
+        self._active = 0
+        self._stats: Dict[str, Any] = {
+            "requests": 0,
+            "peak_concurrency": 0,
+            "queue_wait_total_s": 0.0,
+            "queue_wait_max_s": 0.0,
+            "throttled": {},
+        }
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        """获取URL的主机（含端口），作为按主机限流的键。"""
+        return urlsplit(url).netloc.lower()
+
+    @asynccontextmanager
+    async def slot(self, url: str) -> AsyncIterator[None]:
+        """
+        获取一个请求名额，退出时释放。先占用主机名额并等待该主机的冷却期结束，再占用全局名额。
+
+        Args:
+            url: 要请求的URL
+        """
+        host = self.host_of(url)
+        host_semaphore = self._hosts.get(host)
+        if host_semaphore is None:
+            host_semaphore = self._hosts[host] = asyncio.Semaphore(self.per_host_concurrency)
+
+        enqueued_at = time.monotonic()
+        async with host_semaphore:
+            while True:
+                delay = self._cooldown_until.get(host, 0.0) - time.monotonic()
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            async with self._global:
+                wait = time.monotonic() - enqueued_at
+                self._stats["requests"] += 1
+                self._stats["queue_wait_total_s"] += wait
+                self._stats["queue_wait_max_s"] = max(self._stats["queue_wait_max_s"], wait)
+                self._active += 1
+                self._stats["peak_concurrency"] = max(self._stats["peak_concurrency"], self._active)
+                try:
+                    yield
+                finally:
+                    self._active -= 1
+
+    def throttle(self, url: str, delay: float) -> None:
+        """
+        记录某个主机的限流响应，让该主机在delay秒内不再发出新请求。
+
+        Args:
+            url: 返回限流响应的URL
+            delay: 冷却时间（秒）
+        """
+        host = self.host_of(url)
+        until = time.monotonic() + max(delay, 0.0)
+        if until > self._cooldown_until.get(host, 0.0):
+            self._cooldown_until[host] = until
+        throttled = self._stats["throttled"]
+        throttled[host] = throttled.get(host, 0) + 1
+        self.logger.debug(
+            f"主机 {host} 返回限流响应，冷却 {delay:.1f} 秒",
+            extra={"host": host, "冷却_秒": round(delay, 3), "累计限流次数": throttled[host]}
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取累计的调度统计。
+
+        Returns:
+            dict: 请求数、峰值并发、排队等待的总时间和最长时间（秒）、各主机的限流次数
+        """
+        stats = dict(self._stats)
+        stats["queue_wait_total_s"] = round(stats["queue_wait_total_s"], 3)
+        stats["queue_wait_max_s"] = round(stats["queue_wait_max_s"], 3)
+        stats["throttled"] = dict(stats["throttled"])
+        return stats
@@ -0,0 +1,152 @@
+import logging
+import time
+from typing import Dict, List, Set, Tuple
+
+from mihomo_sync.modules.rule_store import (
+    KIND_DOMAIN, KIND_FULL, PackedRuleColumn, RuleColumn, RuleStore, split_line
+)
+
+
+class DomainClaimIndex:
+    """
+    记录已认领的domain/full条目及其认领序号的后缀索引。
+
+    逻辑上等价于按反转标签组织的后缀字典树：每个domain条目对应树上的一个终止节点，
+    查询时从条目自身开始逐级去掉最左侧的标签，相当于沿树从叶子走向根。这里把每个节点
+    展平成以完整后缀为键的字典项，避免为每个标签分配一个字典对象。
+    """
+
+    __slots__ = ("_domains", "_fulls")
+
+    def __init__(self):
+        self._domains: Dict[bytes, int] = {}
+        self._fulls: Dict[bytes, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._domains) + len(self._fulls)
+
+    def add(self, kind: int, value: bytes, claim_index: int) -> None:
+        """登记一个条目，同一条目只保留最早的认领序号。"""
+        target = self._domains if kind == KIND_DOMAIN else self._fulls
+        target.setdefault(value, claim_index)
+
+    def covered_by(self, kind: int, value: bytes, claim_index: int) -> int:
+        """
+        查找在claim_index之前认领且完全覆盖该条目的认领。
+
+        Args:
+            kind: KIND_DOMAIN 或 KIND_FULL
+            value: 去掉前缀的域名
+            claim_index: 当前认领的序号
+
+        Returns:
+            int: 覆盖它的最早认领序号，未被覆盖时返回-1
+        """
+        best = -1
+        if kind == KIND_FULL:
+            index = self._fulls.get(value)
+            if index is not None and index < claim_index:
+                best = index
+        domains = self._domains
+        name = value
+        while True:
+            index = domains.get(name)
+            if index is not None and index < claim_index and (best < 0 or index < best):
+                best = index
+            dot = name.find(b".")
+            if dot < 0:
+                return best
+            name = name[dot + 1:]
+
+
+class ExclusivePolicyResolver:
+    """
+    按Mihomo规则顺序（先匹配者生效）解析各策略的域名规则，使输出互不重叠。
+
+    按规则顺序遍历每次认领，检查其中的domain/full条目是否已被更早的认领完全覆盖：
+    domain:X 覆盖 X 及其所有子域名，full:X 只覆盖 X 本身。被覆盖的条目在Mihomo中
+    永远不会命中，直接丢弃。keyword/regexp等无法判断覆盖关系的条目保持不变。
+    """
+
+    CONTENT_TYPE = "domain"
+
+    def __init__(self):
+        """
+        初始化ExclusivePolicyResolver。
+        """
+        self.logger = logging.getLogger(__name__)
+
+    def resolve(self, store: RuleStore) -> Dict[str, int]:
+        """
+        对已冻结的RuleStore做排他解析，并替换各策略的域名规则列。
+
+        Args:
+            store: 已冻结的规则存储
+
+        Returns:
+            dict: {策略: 被更早规则遮蔽而丢弃的条目数}
+        """
+        start_time = time.time()
+        index = DomainClaimIndex()
+        claim_policies: List[str] = []
+        shadowed: Dict[str, int] = {policy: 0 for policy in store.policies()}
+        cross_policy = 0
+        columns: Dict[str, List[Tuple[str, RuleColumn]]] = {}
+        inline_groups: Dict[str, Dict[int, Set[bytes]]] = {}
+        seen_columns: Set[Tuple[str, int]] = set()
+
+        for claim_index, (policy, provider_name, column) in enumerate(store.iter_claims(self.CONTENT_TYPE)):
+            claim_policies.append(policy)
+            if column is None:
+                continue
+            is_inline = provider_name == RuleStore.INLINE_PROVIDER
+            kept: Dict[int, Set[bytes]] = {}
+            new_entries: List[Tuple[int, bytes]] = []
+            dropped = 0
+            for line in column.iter_lines():
+                kind, value = split_line(line)
+                if kind == KIND_DOMAIN or kind == KIND_FULL:
+                    owner = index.covered_by(kind, value, claim_index)
+                    if owner >= 0:
+                        dropped += 1
+                        if claim_policies[owner] != policy:
+                            cross_policy += 1
+                        continue
+                    new_entries.append((kind, value))
+                kept.setdefault(kind, set()).add(value)
+            # 同一认领内的条目互不遮蔽，处理完整个认领后再登记
+            for kind, value in new_entries:
+                index.add(kind, value, claim_index)
+            shadowed[policy] = shadowed.get(policy, 0) + dropped
+
+            if is_inline:
+                groups = inline_groups.setdefault(policy, {})
+                for kind, values in kept.items():
+                    groups.setdefault(kind, set()).update(values)
+            elif (policy, id(column)) in seen_columns:
+                # 同一策略重复引用同一提供者时，后一次引用必然被前一次完全遮蔽
+                continue
+            else:
+                seen_columns.add((policy, id(column)))
+                if dropped == 0:
+                    # 没有条目被遮蔽时继续共享原始的规则列
+                    columns.setdefault(policy, []).append((provider_name, column))
+                elif kept:
+                    columns.setdefault(policy, []).append((provider_name, PackedRuleColumn(kept)))
+
+        for policy, groups in inline_groups.items():
+            if any(groups.values()):
+                columns.setdefault(policy, []).append((RuleStore.INLINE_PROVIDER, PackedRuleColumn(groups)))
+        store.replace_columns(self.CONTENT_TYPE, columns)
+
+        duration = time.time() - start_time
+        self.logger.info(
+            f"排他策略解析完成，共丢弃 {sum(shadowed.values())} 条被更早规则遮蔽的域名条目",
+            extra={
+                "被遮蔽条目数": shadowed,
+                "跨策略遮蔽条目数": cross_policy,
+                "已认领条目数": len(index),
+                "耗时_秒": round(duration, 3)
+            }
+        )
+        return shadowed
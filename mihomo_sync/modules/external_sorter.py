@@ -0,0 +1,145 @@
+import heapq
+import logging
+import os
+from typing import Iterable, Iterator, List
+
+
+class ExternalSorter:
+    """
+    在给定内存预算内对大量bytes行做排序去重的外部排序器。
+
+    行先缓存在内存中，估算占用超过预算时排序去重后写成磁盘上的有序段（run）；
+    结束时对各段做k路归并。单次归并的段数受 MAX_FAN_IN 限制，段过多时先分批归并，
+    保证同时打开的文件数和读缓冲总量都有上限。
+    """
+
+    # 单次归并最多同时打开的段数
+    MAX_FAN_IN = 16
+    # 每条缓存行的估算额外开销（bytes对象头 + 列表槽位）
+    LINE_OVERHEAD = 41
+    # 读写段文件时的缓冲区大小范围
+    MIN_BUFFER_SIZE = 4096
+    MAX_BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, spill_dir: str, memory_budget: int, name: str = "sort"):
+        """
+        初始化ExternalSorter。
+
+        Args:
+            spill_dir: 存放有序段的目录
+            memory_budget: 内存缓冲的字节数上限
+            name: 段文件名前缀，同一目录下的多个排序器需使用不同的名称
+        """
+        self.logger = logging.getLogger(__name__)
+        self.spill_dir = spill_dir
+        self.memory_budget = max(memory_budget, self.MIN_BUFFER_SIZE)
+        self.name = name
+        self.buffer_size = min(
+            self.MAX_BUFFER_SIZE,
+            max(self.MIN_BUFFER_SIZE, self.memory_budget // (self.MAX_FAN_IN * 4))
+        )
+        self._buffer: List[bytes] = []
+        self._buffered_bytes = 0
+        self._runs: List[str] = []
+        self._run_seq = 0
+
+    @property
+    def run_count(self) -> int:
+        """已写入磁盘的有序段数量。"""
+        return len(self._runs)
+
+    def add(self, line: bytes) -> None:
+        """
+        添加一行（不含换行符）。
+
+        Args:
+            line: 待排序的行
+        """
+        self._buffer.append(line)
+        self._buffered_bytes += len(line) + self.LINE_OVERHEAD
+        if self._buffered_bytes >= self.memory_budget:
+            self._spill()
+
+    def extend(self, lines: Iterable[bytes]) -> None:
+        """添加多行。"""
+        for line in lines:
+            self.add(line)
+
+    def _next_run_path(self) -> str:
+        self._run_seq += 1
+        return os.path.join(self.spill_dir, f"{self.name}.run{self._run_seq}")
+
+    def _spill(self) -> None:
+        """将内存中的行排序去重后写成一个有序段。"""
+        if not self._buffer:
+            return
+        path = self._next_run_path()
+        self._write_run(path, _dedupe(sorted(self._buffer)))
+        self._runs.append(path)
+        self._buffer = []
+        self._buffered_bytes = 0
+
+    def _write_run(self, path: str, lines: Iterable[bytes]) -> None:
+        with open(path, "wb", buffering=self.buffer_size) as f:
+            for line in lines:
+                f.write(line)
+                f.write(b"\n")
+
+    def _iter_run(self, path: str) -> Iterator[bytes]:
+        with open(path, "rb", buffering=self.buffer_size) as f:
+            for line in f:
+                yield line[:-1]
+
+    def _merge_runs(self, paths: List[str]) -> Iterator[bytes]:
+        return _dedupe(heapq.merge(*(self._iter_run(path) for path in paths)))
+
+    def iter_sorted(self) -> Iterator[bytes]:
+        """
+        按字节序遍历去重后的全部行。遍历结束后删除所有段文件。
+
+        Yields:
+            bytes: 有序且不重复的行
+        """
+        try:
+            if not self._runs:
+                # 全部数据都在预算之内，直接在内存中排序
+                buffer, self._buffer = self._buffer, []
+                self._buffered_bytes = 0
+                yield from _dedupe(sorted(buffer))
+                return
+
+            self._spill()
+            # 段数超过扇入上限时先分批归并成更大的段
+            while len(self._runs) > self.MAX_FAN_IN:
+                batch = self._runs[:self.MAX_FAN_IN]
+                path = self._next_run_path()
+                self._write_run(path, self._merge_runs(batch))
+                self._runs = self._runs[self.MAX_FAN_IN:] + [path]
+                self._remove_files(batch)
+
+            yield from self._merge_runs(self._runs)
+        finally:
+            self.cleanup()
+
+    def cleanup(self) -> None:
+        """删除所有段文件并丢弃缓冲。"""
+        self._remove_files(self._runs)
+        self._runs = []
+        self._buffer = []
+        self._buffered_bytes = 0
+
+    def _remove_files(self, paths: List[str]) -> None:
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError as e:
+                self.logger.debug(f"删除排序段文件失败: {path}, 错误: {e}")
+
+
+def _dedupe(lines: Iterable[bytes]) -> Iterator[bytes]:
+    """去除有序序列中相邻的重复项。"""
+    previous = None
+    for line in lines:
+        if line != previous:
+            yield line
+            previous = line
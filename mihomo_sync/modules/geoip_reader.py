@@ -0,0 +1,386 @@
+import hashlib
+import logging
+import mmap
+import os
+import shutil
+import socket
+import struct
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from mihomo_sync.modules.geosite_reader import WIRE_LEN, WIRE_VARINT, read_varint, scan_entry_index, skip_field
+from mihomo_sync.modules.ip_collapser import FAMILY_BITS, format_prefix, iter_prefixes, merge_ranges
+
+
+class GeoIpReader:
+    """
+    从Mihomo的本地GeoIP数据库中提取国家/标签对应的CIDR列表。
+
+    支持两种数据库：
+    - Country.mmdb（MaxMind DB格式）：遍历二叉搜索树，按叶子指向的数据记录筛选国家代码。
+      支持MaxMind的 country.iso_code 记录，以及MetaCubeX数据库中的字符串/字符串数组记录；
+    - geoip.dat（v2ray格式protobuf）：按分类索引只解码被引用的条目。
+
+    提取结果按编码合并为最少的CIDR，以数据库内容的SHA-256为键缓存到磁盘（每个编码一个文件），
+    数据库更新后的第一次生成才需要重新提取；mmdb一次遍历即可提取所有缺失的编码。
+    """
+
+    CACHE_DIR_PREFIX = "geoip-"
+    MMDB_METADATA_MARKER = b"\xab\xcd\xefMaxMind.com"
+    # Mihomo中 GEOIP,LAN 匹配的内网、环回、链路本地、组播和未指定地址，不需要查询数据库
+    LAN_CODE = "LAN"
+    LAN_CIDRS = (
+        "0.0.0.0/32", "10.0.0.0/8", "127.0.0.0/8", "169.254.0.0/16", "172.16.0.0/12",
+        "192.168.0.0/16", "224.0.0.0/4", "255.255.255.255/32",
+        "::/128", "::1/128", "fc00::/7", "fe80::/10", "ff00::/8",
+    )
+
+    def __init__(self, cache_dir: str):
+        """
+        初始化GeoIpReader。
+
+        Args:
+            cache_dir: 存放提取结果的缓存目录
+        """
+        self.logger = logging.getLogger(__name__)
+        self.cache_dir = cache_dir
+        self._digest_key: Optional[Tuple[str, int, int]] = None
+        self._digest = ""
+
+    def prepare(self, db_path: str, codes: Iterable[str]) -> None:
+        """
+        确保给定编码的CIDR列表都已缓存，缺失的编码在一次提取中完成。
+
+        Args:
+            db_path: Country.mmdb或geoip.dat路径
+            codes: 规则引用的国家/标签编码
+        """
+        digest_dir = self._get_digest_dir(db_path)
+        missing = sorted({
+            code.upper() for code in codes
+            if code and code.upper() != self.LAN_CODE
+            and not os.path.exists(os.path.join(digest_dir, f"{code.upper()}.list"))
+        })
+        if not missing:
+            return
+
+        start_time = time.time()
+        if self._is_mmdb(db_path):
+            ranges = self._extract_mmdb(db_path, missing)
+        else:
+            ranges = self._extract_dat(db_path, missing)
+
+        os.makedirs(digest_dir, exist_ok=True)
+        counts = {}
+        for code in missing:
+            lines = self._format_ranges(ranges.get(code, {}))
+            counts[code] = len(lines)
+            path = os.path.join(digest_dir, f"{code}.list")
+            temp_path = path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                for line in lines:
+                    f.write(line + "\n")
+            os.replace(temp_path, path)
+        self.logger.info(
+            f"已从GeoIP数据库提取 {len(missing)} 个编码的CIDR",
+            extra={
+                "db_path": db_path,
+                "CIDR数量": counts,
+                "耗时_秒": round(time.time() - start_time, 3)
+            }
+        )
+
+    def iter_cidrs(self, db_path: str, code: str) -> Iterator[str]:
+        """
+        逐条产出某个国家/标签编码的CIDR。
+
+        Args:
+            db_path: Country.mmdb或geoip.dat路径
+            code: 编码，如 "CN"
+
+        Yields:
+            str: CIDR，如 "1.0.1.0/24"
+        """
+        code = code.strip().upper()
+        if code == self.LAN_CODE:
+            yield from self.LAN_CIDRS
+            return
+        self.prepare(db_path, [code])
+        path = os.path.join(self._get_digest_dir(db_path), f"{code}.list")
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
+
+    def _get_digest_dir(self, db_path: str) -> str:
+        """获取数据库当前内容对应的缓存子目录，内容变化时清理旧的子目录。"""
+        stat = os.stat(db_path)
+        key = (os.path.abspath(db_path), stat.st_mtime_ns, stat.st_size)
+        if key != self._digest_key:
+            sha256 = hashlib.sha256()
+            with open(db_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    sha256.update(chunk)
+            self._digest = sha256.hexdigest()[:16]
+            self._digest_key = key
+            self._remove_stale_caches()
+        return os.path.join(self.cache_dir, self.CACHE_DIR_PREFIX + self._digest)
+
+    def _remove_stale_caches(self) -> None:
+        """删除其他数据库版本的提取结果。"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        current = self.CACHE_DIR_PREFIX + self._digest
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(self.CACHE_DIR_PREFIX) and name != current:
+                shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+                self.logger.debug(f"已删除过期的GeoIP提取缓存: {name}")
+
+    @classmethod
+    def _is_mmdb(cls, db_path: str) -> bool:
+        """根据文件末尾的元数据标记判断是否为MaxMind DB。"""
+        with open(db_path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(size - 128 * 1024, 0))
+            return cls.MMDB_METADATA_MARKER in f.read()
+
+    @staticmethod
+    def _format_ranges(ranges: Dict[int, List[Tuple[int, int]]]) -> List[str]:
+        """把各地址族的整数区间合并为最少的CIDR，IPv4在前。"""
+        lines = []
+        for family in (socket.AF_INET, socket.AF_INET6):
+            family_ranges = ranges.get(family)
+            if not family_ranges:
+                continue
+            starts, ends = zip(*family_ranges)
+            for start, end in merge_ranges(list(starts), list(ends)):
+                for network, prefix_len in iter_prefixes(start, end, FAMILY_BITS[family]):
+                    lines.append(format_prefix(family, network, prefix_len).decode("ascii"))
+        return lines
+
+    # --- geoip.dat ---
+
+    def _extract_dat(self, db_path: str, codes: List[str]) -> Dict[str, Dict[int, List[Tuple[int, int]]]]:
+        """从geoip.dat中解码给定编码的CIDR。"""
+        index = scan_entry_index(db_path)
+        result: Dict[str, Dict[int, List[Tuple[int, int]]]] = {}
+        with open(db_path, "rb") as f:
+            for code in codes:
+                location = index.get(code)
+                if location is None:
+                    self.logger.warning(f"GeoIP数据库中不存在编码: {code}", extra={"db_path": db_path})
+                    continue
+                f.seek(location[0])
+                data = f.read(location[1])
+                ranges, reverse_match = self._decode_geoip_entry(data)
+                if reverse_match:
+                    # 反向匹配表示“不在这些CIDR中”，无法表示为CIDR列表
+                    self.logger.warning(f"不支持反向匹配的GeoIP编码，已跳过: {code}")
+                    continue
+                result[code] = ranges
+        return result
+
+    @staticmethod
+    def _decode_geoip_entry(data: bytes) -> Tuple[Dict[int, List[Tuple[int, int]]], bool]:
+        """解码一个GeoIP条目：2号字段为CIDR{ip, prefix}，3号字段为reverse_match。"""
+        ranges: Dict[int, List[Tuple[int, int]]] = {}
+        reverse_match = False
+        pos = 0
+        size = len(data)
+        while pos < size:
+            tag, pos = read_varint(data, pos)
+            if tag == (2 << 3 | WIRE_LEN):
+                length, pos = read_varint(data, pos)
+                end = pos + length
+                ip = b""
+                prefix_len = 0
+                while pos < end:
+                    field_tag, pos = read_varint(data, pos)
+                    if field_tag == (1 << 3 | WIRE_LEN):
+                        ip_length, pos = read_varint(data, pos)
+                        ip = data[pos:pos + ip_length]
+                        pos += ip_length
+                    elif field_tag == (2 << 3 | WIRE_VARINT):
+                        prefix_len, pos = read_varint(data, pos)
+                    else:
+                        pos = skip_field(data, pos, field_tag & 7)
+                pos = end
+                family = {4: socket.AF_INET, 16: socket.AF_INET6}.get(len(ip))
+                if family is None:
+                    continue
+                bits = FAMILY_BITS[family]
+                prefix_len = min(prefix_len, bits)
+                host_bits = bits - prefix_len
+                start = int.from_bytes(ip, "big") >> host_bits << host_bits
+                ranges.setdefault(family, []).append((start, start + (1 << host_bits) - 1))
+            elif tag == (3 << 3 | WIRE_VARINT):
+                value, pos = read_varint(data, pos)
+                reverse_match = bool(value)
+            else:
+                pos = skip_field(data, pos, tag & 7)
+        return ranges, reverse_match
+
+    # --- MaxMind DB ---
+
+    def _extract_mmdb(self, db_path: str, codes: List[str]) -> Dict[str, Dict[int, List[Tuple[int, int]]]]:
+        """遍历MaxMind DB的搜索树，一次提取所有给定编码的CIDR。"""
+        wanted = {code.lower(): code for code in codes}
+        result: Dict[str, Dict[int, List[Tuple[int, int]]]] = {}
+        with open(db_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            marker = buf.rfind(self.MMDB_METADATA_MARKER)
+            if marker < 0:
+                raise ValueError(f"不是有效的MaxMind DB文件: {db_path}")
+            metadata, _ = _MmdbDecoder(buf, marker + len(self.MMDB_METADATA_MARKER)).decode(
+                marker + len(self.MMDB_METADATA_MARKER)
+            )
+            node_count = metadata["node_count"]
+            record_size = metadata["record_size"]
+            ip_version = metadata.get("ip_version", 6)
+            if record_size not in (24, 28, 32):
+                raise ValueError(f"不支持的MaxMind DB记录长度: {record_size}")
+            node_bytes = record_size // 4
+            data_start = node_bytes * node_count + 16
+            decoder = _MmdbDecoder(buf, data_start)
+            codes_by_record: Dict[int, Set[str]] = {}
+
+            def read_node(node: int) -> Tuple[int, int]:
+                offset = node * node_bytes
+                if record_size == 24:
+                    return (int.from_bytes(buf[offset:offset + 3], "big"),
+                            int.from_bytes(buf[offset + 3:offset + 6], "big"))
+                if record_size == 28:
+                    middle = buf[offset + 3]
+                    return (((middle & 0xF0) << 20) | int.from_bytes(buf[offset:offset + 3], "big"),
+                            ((middle & 0x0F) << 24) | int.from_bytes(buf[offset + 4:offset + 7], "big"))
+                return (int.from_bytes(buf[offset:offset + 4], "big"),
+                        int.from_bytes(buf[offset + 4:offset + 8], "big"))
+
+            def walk(root: int, family: int, skip_node: int) -> None:
+                bits = FAMILY_BITS[family]
+                stack = [(root, 0, 0)]
+                while stack:
+                    node, depth, value = stack.pop()
+                    if node < node_count:
+                        if depth and node == skip_node:
+                            # IPv4子树（及其在 ::ffff:0:0/96 等处的别名）单独按IPv4遍历
+                            continue
+                        left, right = read_node(node)
+                        stack.append((right, depth + 1, value | (1 << (bits - depth - 1))))
+                        stack.append((left, depth + 1, value))
+                        continue
+                    if node == node_count:
+                        continue
+                    record = node - node_count - 16
+                    record_codes = codes_by_record.get(record)
+                    if record_codes is None:
+                        record_codes = codes_by_record[record] = self._record_codes(decoder.decode(data_start + record)[0])
+                    for code in record_codes:
+                        if code in wanted:
+                            result.setdefault(wanted[code], {}).setdefault(family, []).append(
+                                (value, value + (1 << (bits - depth)) - 1)
+                            )
+
+            if ip_version == 4:
+                walk(0, socket.AF_INET, -1)
+            else:
+                # IPv4地址位于 ::/96 之下
+                ipv4_start = 0
+                for _ in range(96):
+                    if ipv4_start >= node_count:
+                        break
+                    ipv4_start = read_node(ipv4_start)[0]
+                if ipv4_start < node_count:
+                    walk(ipv4_start, socket.AF_INET, -1)
+                walk(0, socket.AF_INET6, ipv4_start)
+        return result
+
+    @staticmethod
+    def _record_codes(record: Any) -> Set[str]:
+        """
+        从数据记录中取出国家/标签编码（小写）。
+
+        MaxMind格式为 {"country": {"iso_code": "CN"}}；MetaCubeX的数据库记录为字符串或字符串数组。
+        """
+        if isinstance(record, str):
+            return {record.lower()}
+        if isinstance(record, list):
+            return {item.lower() for item in record if isinstance(item, str)}
+        if isinstance(record, dict):
+            country = record.get("country")
+            if isinstance(country, dict) and isinstance(country.get("iso_code"), str):
+                return {country["iso_code"].lower()}
+            if isinstance(record.get("country_code"), str):
+                return {record["country_code"].lower()}
+        return set()
+
+
+class _MmdbDecoder:
+    """MaxMind DB数据段的解码器，指针相对于数据段起始位置。"""
+
+    def __init__(self, buf, pointer_base: int):
+        self.buf = buf
+        self.pointer_base = pointer_base
+
+    def decode(self, offset: int) -> Tuple[Any, int]:
+        """解码offset处的值，返回 (值, 下一个值的偏移)。"""
+        buf = self.buf
+        control = buf[offset]
+        offset += 1
+        data_type = control >> 5
+        if data_type == 1:
+            # 指针：大小位的高两位决定额外字节数
+            size_bits = (control >> 3) & 0x3
+            value_bits = control & 0x7
+            if size_bits == 0:
+                pointer = (value_bits << 8) | buf[offset]
+            elif size_bits == 1:
+                pointer = ((value_bits << 16) | int.from_bytes(buf[offset:offset + 2], "big")) + 2048
+            elif size_bits == 2:
+                pointer = ((value_bits << 24) | int.from_bytes(buf[offset:offset + 3], "big")) + 526336
+            else:
+                pointer = int.from_bytes(buf[offset:offset + 4], "big")
+            value, _ = self.decode(self.pointer_base + pointer)
+            return value, offset + size_bits + 1
+        if data_type == 0:
+            data_type = 7 + buf[offset]
+            offset += 1
+        size = control & 0x1F
+        if size == 29:
+            size = 29 + buf[offset]
+            offset += 1
+        elif size == 30:
+            size = 285 + int.from_bytes(buf[offset:offset + 2], "big")
+            offset += 2
+        elif size == 31:
+            size = 65821 + int.from_bytes(buf[offset:offset + 3], "big")
+            offset += 3
+
+        if data_type == 2:
+            return buf[offset:offset + size].decode("utf-8", "replace"), offset + size
+        if data_type == 7:
+            result = {}
+            for _ in range(size):
+                key, offset = self.decode(offset)
+                result[key], offset = self.decode(offset)
+            return result, offset
+        if data_type == 11:
+            items = []
+            for _ in range(size):
+                item, offset = self.decode(offset)
+                items.append(item)
+            return items, offset
+        if data_type in (5, 6, 9, 10):
+            return int.from_bytes(buf[offset:offset + size], "big"), offset + size
+        if data_type == 8:
+            return int.from_bytes(buf[offset:offset + size], "big", signed=size == 4), offset + size
+        if data_type == 3:
+            return struct.unpack(">d", buf[offset:offset + 8])[0], offset + 8
+        if data_type == 15:
+            return struct.unpack(">f", buf[offset:offset + 4])[0], offset + 4
+        if data_type == 14:
+            return bool(size), offset
+        if data_type == 4:
+            return bytes(buf[offset:offset + size]), offset + size
+        raise ValueError(f"不支持的MaxMind DB数据类型: {data_type}")
@@ -0,0 +1,261 @@
+import json
+import logging
+import mmap
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from mihomo_sync.modules.rule_store import KIND_DOMAIN, KIND_FULL, KIND_KEYWORD, KIND_REGEXP
+
+
+# protobuf线格式的类型
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_LEN = 2
+WIRE_FIXED32 = 5
+
+
+def read_varint(data, pos: int) -> Tuple[int, int]:
+    """从pos处读取一个varint，返回 (值, 新位置)。"""
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+        if shift >= 64:
+            raise ValueError("protobuf varint过长")
+
+
+def skip_field(data, pos: int, wire_type: int) -> int:
+    """跳过一个字段的值，返回新位置。"""
+    if wire_type == WIRE_VARINT:
+        return read_varint(data, pos)[1]
+    if wire_type == WIRE_LEN:
+        length, pos = read_varint(data, pos)
+        return pos + length
+    if wire_type == WIRE_FIXED64:
+        return pos + 8
+    if wire_type == WIRE_FIXED32:
+        return pos + 4
+    raise ValueError(f"不支持的protobuf字段类型: {wire_type}")
+
+
+def scan_entry_index(dat_path: str) -> Dict[str, Tuple[int, int]]:
+    """
+    扫描v2ray格式数据库（GeoSiteList/GeoIPList）的顶层条目，只读取每个条目的分类名（1号字段），
+    记录条目在文件中的偏移和长度。
+
+    Returns:
+        dict: {大写的分类名: (偏移, 长度)}
+    """
+    index: Dict[str, Tuple[int, int]] = {}
+    with open(dat_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return index
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            size = len(data)
+            pos = 0
+            while pos < size:
+                tag, pos = read_varint(data, pos)
+                if tag >> 3 != 1 or tag & 7 != WIRE_LEN:
+                    pos = skip_field(data, pos, tag & 7)
+                    continue
+                length, pos = read_varint(data, pos)
+                end = pos + length
+                if end > size:
+                    raise ValueError(f"数据库已被截断: {dat_path}")
+                # 分类名是条目的1号字段，通常位于最前面
+                inner = pos
+                while inner < end:
+                    inner_tag, inner = read_varint(data, inner)
+                    if inner_tag == (1 << 3 | WIRE_LEN):
+                        code_length, inner = read_varint(data, inner)
+                        code = data[inner:inner + code_length].decode("utf-8", "replace").upper()
+                        index.setdefault(code, (pos, length))
+                        break
+                    inner = skip_field(data, inner, inner_tag & 7)
+                pos = end
+    return index
+
+
+class GeoSiteReader:
+    """
+    Mihomo的GeoSite数据库（geosite.dat）读取器。
+
+    geosite.dat是v2ray格式的protobuf文件：GeoSiteList由若干GeoSite组成，每个GeoSite包含
+    分类名（country_code）和域名列表，每个域名有类型（Plain/Regex/Domain/Full）、值和属性。
+    首次使用时只扫描顶层结构，为每个分类记录在文件中的偏移和长度，索引按文件的修改时间和大小
+    缓存为JSON，之后的生成直接复用；只有规则实际引用的分类才会被解码。
+    """
+
+    # 域名类型到Mosdns匹配器类型的映射：Plain为子串匹配，Regex为正则，Domain为域名后缀，Full为完整匹配
+    DOMAIN_TYPE_KINDS = {0: KIND_KEYWORD, 1: KIND_REGEXP, 2: KIND_DOMAIN, 3: KIND_FULL}
+    INDEX_VERSION = 1
+
+    def __init__(self, index_path: str = ""):
+        """
+        初始化GeoSiteReader。
+
+        Args:
+            index_path: 分类索引缓存文件的路径，为空时不缓存
+        """
+        self.logger = logging.getLogger(__name__)
+        self.index_path = index_path
+        self._index: Dict[str, Tuple[int, int]] = {}
+        self._index_key: Optional[Tuple[str, int, int]] = None
+
+    @staticmethod
+    def parse_category(category: str) -> Tuple[str, List[str]]:
+        """
+        解析GEOSITE规则的参数，例如 "google@cn" -> ("GOOGLE", ["cn"])。
+
+        Returns:
+            tuple: (大写的分类名, 小写的属性列表)
+        """
+        code, *attrs = category.strip().split("@")
+        return code.strip().upper(), [attr.strip().lower() for attr in attrs if attr.strip()]
+
+    def categories(self, dat_path: str) -> List[str]:
+        """返回数据库中所有分类的名称。"""
+        return sorted(self._load_index(dat_path))
+
+    def iter_rules(self, dat_path: str, category: str) -> Iterator[Tuple[int, bytes, str]]:
+        """
+        解码一个分类，逐条产出已分类的域名规则。
+
+        Args:
+            dat_path: geosite.dat路径
+            category: 分类名，可带 @属性 过滤（多个属性需同时满足），如 "google@cn"
+
+        Yields:
+            tuple: (匹配器类型代码, 域名, "domain")，与RuleConverter的分类结果格式相同
+        """
+        code, attrs = self.parse_category(category)
+        index = self._load_index(dat_path)
+        location = index.get(code)
+        if location is None:
+            self.logger.warning(f"GeoSite数据库中不存在分类: {code}", extra={"dat_path": dat_path})
+            return
+
+        offset, length = location
+        with open(dat_path, "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+        if len(data) != length:
+            raise ValueError(f"GeoSite数据库已被截断: {dat_path}")
+
+        count = 0
+        for domain_type, value, domain_attrs in self._iter_domains(data):
+            if attrs and not all(attr in domain_attrs for attr in attrs):
+                continue
+            kind = self.DOMAIN_TYPE_KINDS.get(domain_type)
+            if kind is None or not value:
+                continue
+            count += 1
+            yield kind, value, "domain"
+        self.logger.debug(
+            f"已解码GeoSite分类: {category}",
+            extra={"分类": code, "属性": attrs, "规则数量": count}
+        )
+
+    def _load_index(self, dat_path: str) -> Dict[str, Tuple[int, int]]:
+        """获取分类索引，依次使用内存中的索引、缓存文件，最后才扫描数据库。"""
+        stat = os.stat(dat_path)
+        key = (os.path.abspath(dat_path), stat.st_mtime_ns, stat.st_size)
+        if key == self._index_key:
+            return self._index
+
+        index = self._read_cached_index(key)
+        if index is None:
+            start_time = time.time()
+            index = scan_entry_index(dat_path)
+            self.logger.info(
+                f"已建立GeoSite分类索引，共 {len(index)} 个分类",
+                extra={
+                    "dat_path": dat_path,
+                    "耗时_秒": round(time.time() - start_time, 3)
+                }
+            )
+            self._write_cached_index(key, index)
+        self._index = index
+        self._index_key = key
+        return index
+
+    def _read_cached_index(self, key: Tuple[str, int, int]) -> Optional[Dict[str, Tuple[int, int]]]:
+        """读取与数据库文件匹配的索引缓存，不匹配或损坏时返回None。"""
+        if not self.index_path or not os.path.exists(self.index_path):
+            return None
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("version") != self.INDEX_VERSION or \
+                    (cached.get("path"), cached.get("mtime_ns"), cached.get("size")) != key:
+                return None
+            return {code: (offset, length) for code, (offset, length) in cached["categories"].items()}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.logger.warning(f"GeoSite索引缓存无效，将重新建立: {self.index_path}, 错误: {e}")
+            return None
+
+    def _write_cached_index(self, key: Tuple[str, int, int], index: Dict[str, Tuple[int, int]]) -> None:
+        """原子地写入索引缓存。"""
+        if not self.index_path:
+            return
+        cached = {
+            "version": self.INDEX_VERSION,
+            "path": key[0],
+            "mtime_ns": key[1],
+            "size": key[2],
+            "categories": index,
+        }
+        try:
+            temp_path = self.index_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(cached, f, ensure_ascii=False)
+            os.replace(temp_path, self.index_path)
+        except OSError as e:
+            self.logger.warning(f"写入GeoSite索引缓存失败: {self.index_path}, 错误: {e}")
+
+    @staticmethod
+    def _iter_domains(data: bytes) -> Iterator[Tuple[int, bytes, List[str]]]:
+        """解码一个GeoSite条目中的域名列表，产出 (类型, 值, 属性名列表)。"""
+        pos = 0
+        size = len(data)
+        while pos < size:
+            tag, pos = read_varint(data, pos)
+            if tag != (2 << 3 | WIRE_LEN):
+                pos = skip_field(data, pos, tag & 7)
+                continue
+            length, pos = read_varint(data, pos)
+            end = pos + length
+            domain_type = 0
+            value = b""
+            attrs: List[str] = []
+            while pos < end:
+                field_tag, pos = read_varint(data, pos)
+                if field_tag == (1 << 3 | WIRE_VARINT):
+                    domain_type, pos = read_varint(data, pos)
+                elif field_tag == (2 << 3 | WIRE_LEN):
+                    value_length, pos = read_varint(data, pos)
+                    value = data[pos:pos + value_length]
+                    pos += value_length
+                elif field_tag == (3 << 3 | WIRE_LEN):
+                    attr_length, pos = read_varint(data, pos)
+                    attr_end = pos + attr_length
+                    # Attribute的1号字段为属性名，其余为取值，这里只关心名称
+                    while pos < attr_end:
+                        attr_tag, pos = read_varint(data, pos)
+                        if attr_tag == (1 << 3 | WIRE_LEN):
+                            key_length, pos = read_varint(data, pos)
+                            attrs.append(data[pos:pos + key_length].decode("utf-8", "replace").lower())
+                            pos += key_length
+                        else:
+                            pos = skip_field(data, pos, attr_tag & 7)
+                    pos = attr_end
+                else:
+                    pos = skip_field(data, pos, field_tag & 7)
+            pos = end
+            yield domain_type, value, attrs
@@ -0,0 +1,191 @@
+import logging
+import socket
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from mihomo_sync.modules.rule_store import OrderedRuleColumn, RuleColumn, RuleStore
+
+try:
+    import numpy as np
+except ImportError:  # numpy为可选依赖，缺失时使用纯Python实现
+    np = None
+
+
+# 地址族的位数
+FAMILY_BITS = {socket.AF_INET: 32, socket.AF_INET6: 128}
+CONTENT_TYPE_FAMILIES = {"ipv4": socket.AF_INET, "ipv6": socket.AF_INET6}
+
+
+def parse_cidr(line: bytes) -> Optional[Tuple[int, int, int]]:
+    """
+    将CIDR规则行解析为整数区间。
+
+    主机位会按掩码清零（与Mosdns加载ip_set的行为一致），逗号后的附加参数（如no-resolve）被忽略。
+
+    Args:
+        line: 例如 b"10.0.0.0/8" 或 b"2001:db8::/32"
+
+    Returns:
+        tuple: (地址族, 起始地址, 结束地址)，无法解析时返回None
+    """
+    text = line.split(b",", 1)[0].strip().decode("ascii", "replace")
+    address, sep, prefix = text.partition("/")
+    family = socket.AF_INET6 if ":" in address else socket.AF_INET
+    bits = FAMILY_BITS[family]
+    try:
+        packed = socket.inet_pton(family, address)
+        prefix_len = int(prefix) if sep else bits
+    except (OSError, ValueError):
+        return None
+    if not 0 <= prefix_len <= bits:
+        return None
+    host_bits = bits - prefix_len
+    start = int.from_bytes(packed, "big") >> host_bits << host_bits
+    return family, start, start + (1 << host_bits) - 1
+
+
+def merge_ranges(starts: List[int], ends: List[int]) -> List[Tuple[int, int]]:
+    """
+    合并重叠和相邻的整数区间。
+
+    Args:
+        starts: 各区间的起始值
+        ends: 各区间的结束值（包含）
+
+    Returns:
+        list: 按起始值排序、互不重叠也不相邻的区间
+    """
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(zip(starts, ends)):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _merge_ranges_numpy(starts: List[int], ends: List[int]) -> List[Tuple[int, int]]:
+    """merge_ranges的向量化实现，仅适用于IPv4（值在int64范围内）。"""
+    start_array = np.array(starts, dtype=np.int64)
+    end_array = np.array(ends, dtype=np.int64)
+    order = np.argsort(start_array, kind="stable")
+    start_array = start_array[order]
+    end_array = np.maximum.accumulate(end_array[order])
+    # 当前区间的起始值超过前面所有区间的最大结束值+1时开始一个新的合并区间
+    is_new = np.empty(len(start_array), dtype=bool)
+    is_new[0] = True
+    is_new[1:] = start_array[1:] > end_array[:-1] + 1
+    group_starts = start_array[is_new]
+    last_indexes = np.append(np.flatnonzero(is_new)[1:] - 1, len(start_array) - 1)
+    group_ends = end_array[last_indexes]
+    return list(zip(group_starts.tolist(), group_ends.tolist()))
+
+
+def iter_prefixes(start: int, end: int, bits: int) -> Iterator[Tuple[int, int]]:
+    """
+    生成恰好覆盖区间 [start, end] 的最少前缀。
+
+    Yields:
+        tuple: (网络地址, 前缀长度)
+    """
+    while start <= end:
+        # 起始地址对齐允许的最大块，再缩小到不超过区间末尾
+        size = start & -start if start else 1 << bits
+        while start + size - 1 > end:
+            size >>= 1
+        yield start, bits - size.bit_length() + 1
+        start += size
+
+
+def format_prefix(family: int, network: int, prefix_len: int) -> bytes:
+    """将网络地址和前缀长度格式化为CIDR规则行。"""
+    packed = network.to_bytes(FAMILY_BITS[family] // 8, "big")
+    return f"{socket.inet_ntop(family, packed)}/{prefix_len}".encode("ascii")
+
+
+class CidrCollapser:
+    """
+    将各策略的IP规则合并为最少的CIDR前缀，并按数值顺序输出。
+
+    CIDR被解析为整数区间后排序，合并重叠和相邻的区间，再把每个区间拆成最少的对齐前缀。
+    安装了numpy时IPv4使用向量化的排序与合并。无法解析或地址族与文件不符的行原样保留在末尾。
+    """
+
+    # 合并后规则列使用的伪提供者名称
+    PROVIDER_NAME = "collapsed"
+
+    def __init__(self):
+        """
+        初始化CidrCollapser。
+        """
+        self.logger = logging.getLogger(__name__)
+
+    def collapse(self, store: RuleStore) -> Dict[str, Dict[str, Tuple[int, int]]]:
+        """
+        合并已冻结的RuleStore中各策略的IP规则，并替换对应的规则列。
+
+        Args:
+            store: 已冻结的规则存储
+
+        Returns:
+            dict: {内容类型: {策略: (合并前条目数, 合并后条目数)}}
+        """
+        start_time = time.time()
+        report: Dict[str, Dict[str, Tuple[int, int]]] = {}
+        for content_type, family in CONTENT_TYPE_FAMILIES.items():
+            columns: Dict[str, List[Tuple[str, RuleColumn]]] = {}
+            report[content_type] = {}
+            for policy in store.policies():
+                before, lines = self._collapse_lines(store.iter_lines(policy, content_type), family)
+                if lines:
+                    columns[policy] = [(self.PROVIDER_NAME, OrderedRuleColumn(lines))]
+                report[content_type][policy] = (before, len(lines))
+            store.replace_columns(content_type, columns)
+
+        duration = time.time() - start_time
+        self.logger.info(
+            "IP规则合并完成",
+            extra={
+                "合并前后条目数": report,
+                "使用numpy": np is not None,
+                "耗时_秒": round(duration, 3)
+            }
+        )
+        return report
+
+    def _collapse_lines(self, lines: Iterable[bytes], family: int) -> Tuple[int, List[bytes]]:
+        """
+        合并一组CIDR规则行。
+
+        Returns:
+            tuple: (输入条目数, 合并后的规则行)
+        """
+        starts: List[int] = []
+        ends: List[int] = []
+        passthrough: List[bytes] = []
+        count = 0
+        for line in lines:
+            count += 1
+            parsed = parse_cidr(line)
+            if parsed is None or parsed[0] != family:
+                passthrough.append(line)
+                continue
+            starts.append(parsed[1])
+            ends.append(parsed[2])
+
+        if not starts:
+            merged = []
+        elif np is not None and family == socket.AF_INET:
+            merged = _merge_ranges_numpy(starts, ends)
+        else:
+            merged = merge_ranges(starts, ends)
+
+        bits = FAMILY_BITS[family]
+        output = [
+            format_prefix(family, network, prefix_len)
+            for start, end in merged
+            for network, prefix_len in iter_prefixes(start, end, bits)
+        ]
+        output.extend(passthrough)
+        return count, output
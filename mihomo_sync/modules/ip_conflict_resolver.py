@@ -0,0 +1,177 @@
+import heapq
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Tuple
+
+from mihomo_sync.modules.ip_collapser import (
+    CONTENT_TYPE_FAMILIES, FAMILY_BITS, format_prefix, iter_prefixes, parse_cidr
+)
+from mihomo_sync.modules.rule_store import OrderedRuleColumn, RuleColumn, RuleStore
+
+
+class IpConflictResolver:
+    """
+    检测不同策略之间重叠的IP段，并按Mihomo规则顺序（先匹配者生效）消除重叠。
+
+    所有认领的IP段转换为整数区间的起止事件后排序，扫描线在每个基本区间上维护当前覆盖它的
+    认领（每个策略一个按认领序号排序的小根堆，延迟删除）。序号最小的认领赢得该区间；
+    同时被多个策略覆盖的区间记录为冲突。总复杂度为 O((n + k) log n)，不需要两两比较。
+    输出的每个策略的IP规则互不重叠，并以按数值排序的最少CIDR表示。
+    """
+
+    # 合并后规则列使用的伪提供者名称
+    PROVIDER_NAME = "resolved"
+    # 冲突报告中最多列出的冲突区间数量
+    MAX_REPORTED_CONFLICTS = 10000
+
+    def __init__(self, report_path: str = ""):
+        """
+        初始化IpConflictResolver。
+
+        Args:
+            report_path: 冲突报告(JSON)的写入路径，为空时不写报告
+        """
+        self.logger = logging.getLogger(__name__)
+        self.report_path = report_path
+
+    def resolve(self, store: RuleStore) -> Dict[str, Any]:
+        """
+        消除已冻结的RuleStore中各策略之间重叠的IP规则，并替换对应的规则列。
+
+        Args:
+            store: 已冻结的规则存储
+
+        Returns:
+            dict: 冲突报告
+        """
+        start_time = time.time()
+        report: Dict[str, Any] = {"total_conflicts": 0, "conflicts": []}
+        for content_type, family in CONTENT_TYPE_FAMILIES.items():
+            columns = self._resolve_content_type(store, content_type, family, report)
+            store.replace_columns(content_type, columns)
+
+        if self.report_path:
+            self._write_report(report)
+
+        duration = time.time() - start_time
+        self.logger.info(
+            f"IP冲突检测完成，共发现 {report['total_conflicts']} 个跨策略重叠区间",
+            extra={
+                "report_path": self.report_path,
+                "耗时_秒": round(duration, 3)
+            }
+        )
+        return report
+
+    def _resolve_content_type(self, store: RuleStore, content_type: str, family: int,
+                              report: Dict[str, Any]) -> Dict[str, List[Tuple[str, RuleColumn]]]:
+        """
+        对某一内容类型做扫描线解析。
+
+        Returns:
+            dict: {策略: [(提供者名称, 规则列)]}
+        """
+        claims: List[Tuple[str, str]] = []
+        events: List[Tuple[int, int, int]] = []
+        passthrough: Dict[str, List[bytes]] = {}
+        for claim_index, (policy, provider_name, column) in enumerate(store.iter_claims(content_type)):
+            claims.append((policy, provider_name))
+            if column is None:
+                continue
+            for line in column.iter_lines():
+                parsed = parse_cidr(line)
+                if parsed is None or parsed[0] != family:
+                    passthrough.setdefault(policy, []).append(line)
+                    continue
+                # 结束事件排在同一位置的开始事件之前，位置为结束地址+1
+                events.append((parsed[1], 1, claim_index))
+                events.append((parsed[2] + 1, 0, claim_index))
+        events.sort()
+
+        heaps: Dict[str, List[int]] = {}
+        active: Dict[int, int] = {}
+        won: Dict[str, List[Tuple[int, int]]] = {}
+        conflicts = report["conflicts"]
+        i = 0
+        while i < len(events):
+            position = events[i][0]
+            while i < len(events) and events[i][0] == position:
+                _, is_start, claim_index = events[i]
+                if is_start:
+                    if active.get(claim_index, 0) == 0:
+                        heapq.heappush(heaps.setdefault(claims[claim_index][0], []), claim_index)
+                    active[claim_index] = active.get(claim_index, 0) + 1
+                else:
+                    active[claim_index] -= 1
+                i += 1
+            if i >= len(events):
+                break
+
+            # 取出每个策略当前仍然有效的最早认领
+            tops = []
+            for heap in heaps.values():
+                while heap and active.get(heap[0], 0) == 0:
+                    heapq.heappop(heap)
+                if heap:
+                    tops.append(heap[0])
+            if not tops:
+                continue
+
+            end = events[i][0] - 1
+            winner = min(tops)
+            winner_policy = claims[winner][0]
+            ranges = won.setdefault(winner_policy, [])
+            if ranges and ranges[-1][1] + 1 == position:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((position, end))
+
+            if len(tops) > 1:
+                report["total_conflicts"] += 1
+                if len(conflicts) < self.MAX_REPORTED_CONFLICTS:
+                    conflicts.append(self._describe_conflict(family, position, end, winner, tops, claims))
+
+        bits = FAMILY_BITS[family]
+        columns: Dict[str, List[Tuple[str, RuleColumn]]] = {}
+        for policy in store.policies():
+            lines = [
+                format_prefix(family, network, prefix_len)
+                for start, end in won.get(policy, [])
+                for network, prefix_len in iter_prefixes(start, end, bits)
+            ]
+            lines.extend(passthrough.get(policy, []))
+            if lines:
+                columns[policy] = [(self.PROVIDER_NAME, OrderedRuleColumn(lines))]
+        return columns
+
+    @staticmethod
+    def _describe_conflict(family: int, start: int, end: int, winner: int, tops: List[int],
+                           claims: List[Tuple[str, str]]) -> Dict[str, Any]:
+        """生成单个冲突区间的报告项。"""
+        bits = FAMILY_BITS[family]
+        return {
+            "cidrs": [
+                format_prefix(family, network, prefix_len).decode("ascii")
+                for network, prefix_len in iter_prefixes(start, end, bits)
+            ],
+            "winner": {"policy": claims[winner][0], "provider": claims[winner][1], "order": winner},
+            "shadowed": [
+                {"policy": claims[index][0], "provider": claims[index][1], "order": index}
+                for index in sorted(tops) if index != winner
+            ],
+        }
+
+    def _write_report(self, report: Dict[str, Any]) -> None:
+        """原子地写入冲突报告。"""
+        try:
+            directory = os.path.dirname(self.report_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = self.report_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.report_path)
+        except OSError as e:
+            self.logger.error(f"写入IP冲突报告失败: {self.report_path}, 错误: {e}")
@@ -0,0 +1,342 @@
+import logging
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from mihomo_sync.modules.rule_store import (
+    KIND_DOMAIN, KIND_FULL, KIND_KEYWORD, KIND_PREFIXES, KIND_REGEXP,
+    PackedRuleColumn, RuleColumn, RuleStore, filter_column, split_line
+)
+
+
+# 可在正则中原样出现的域名字符
+_DOMAIN_CHARS = frozenset("abcdefghijklmnopqrstuvwxyz0123456789-._")
+# 转义后表示字面字符的符号
+_ESCAPABLE = frozenset(".-_/\\*+?()[]{}|^$")
+# 表示"任意子域名或无子域名"的前缀写法，后面跟着的字面量等价于 domain: 匹配
+_SUBDOMAIN_GROUPS = ("(.*\\.)?", "(?:.*\\.)?", "(.+\\.)?", "(?:.+\\.)?")
+_LABEL_START = "(^|\\.)"
+_ANY = ".*"
+
+
+def _expand_sequence(pattern: str, pos: int, limit: int, in_group: bool) -> Optional[Tuple[List[str], int]]:
+    """
+    展开由字面字符、字符类和分组（含 | 分支和 ? 可选）组成的正则片段。
+
+    Returns:
+        tuple: (展开得到的所有字面串, 结束位置)，含有其他元字符或展开数超过limit时返回None
+    """
+    branches: List[str] = []
+    current = [""]
+    length = len(pattern)
+    while pos < length:
+        char = pattern[pos]
+        if char == "|":
+            branches.extend(current)
+            current = [""]
+            pos += 1
+            continue
+        if char == ")":
+            if not in_group:
+                return None
+            break
+        if char == "\\":
+            if pos + 1 >= length or pattern[pos + 1] not in _ESCAPABLE:
+                return None
+            options, pos = [pattern[pos + 1]], pos + 2
+        elif char == "[":
+            parsed = _expand_class(pattern, pos + 1)
+            if parsed is None:
+                return None
+            options, pos = parsed
+        elif char == "(":
+            pos += 1
+            if pattern.startswith("?:", pos):
+                pos += 2
+            parsed = _expand_sequence(pattern, pos, limit, True)
+            if parsed is None or parsed[1] >= length or pattern[parsed[1]] != ")":
+                return None
+            options, pos = parsed[0], parsed[1] + 1
+        elif char in ".*+?{}^$]":
+            return None
+        else:
+            options, pos = [char], pos + 1
+
+        if pos < length and pattern[pos] == "?":
+            options = options + [""]
+            pos += 1
+        current = [prefix + option for prefix in current for option in options]
+        if len(current) + len(branches) > limit:
+            return None
+    branches.extend(current)
+    return branches, pos
+
+
+def _expand_class(pattern: str, pos: int) -> Optional[Tuple[List[str], int]]:
+    """展开不取反的字符类，如 [a-c0-9]，返回 (字符列表, 结束位置)。"""
+    chars: List[str] = []
+    length = len(pattern)
+    if pos < length and pattern[pos] == "^":
+        return None
+    while pos < length and pattern[pos] != "]":
+        char = pattern[pos]
+        if char == "\\":
+            if pos + 1 >= length or pattern[pos + 1] not in _ESCAPABLE:
+                return None
+            char = pattern[pos + 1]
+            pos += 2
+        else:
+            pos += 1
+        if pos + 1 < length and pattern[pos] == "-" and pattern[pos + 1] != "]":
+            end = pattern[pos + 1]
+            if end == "\\" or end < char:
+                return None
+            chars.extend(chr(code) for code in range(ord(char), ord(end) + 1))
+            pos += 2
+        else:
+            chars.append(char)
+    if pos >= length or not chars:
+        return None
+    return sorted(set(chars)), pos + 1
+
+
+def lower_regexp(pattern: str, limit: int = 16) -> Optional[List[Tuple[int, str]]]:
+    """
+    判断一条Mosdns正则是否等价于若干 full:/domain:/keyword: 条目，是则返回这些条目。
+
+    Mosdns用去掉末尾点的小写域名匹配正则，因此：
+    ^字面量$ 等价于 full:，^(.*\\.)?字面量$ 和 (^|\\.)字面量$ 等价于 domain:，
+    两端都不锚定的字面量等价于 keyword:。字面量中的分组分支、字符类和 ? 可选在总数
+    不超过limit时展开为多个条目；其余写法（含 . * + 等）保留为正则。
+
+    Args:
+        pattern: 去掉 regexp: 前缀的正则
+        limit: 最多展开的条目数
+
+    Returns:
+        list: [(匹配器类型代码, 值)]，不能等价改写时返回None
+    """
+    top = _split_top_level(pattern)
+    if top is None:
+        return None
+    lowered: List[Tuple[int, str]] = []
+    for branch in top:
+        entries = _lower_branch(branch, limit - len(lowered))
+        if entries is None:
+            return None
+        lowered.extend(entries)
+    return lowered
+
+
+def _split_top_level(pattern: str) -> Optional[List[str]]:
+    """按不在分组和字符类中的 | 拆分正则。"""
+    branches = []
+    depth = 0
+    in_class = False
+    start = 0
+    pos = 0
+    while pos < len(pattern):
+        char = pattern[pos]
+        if char == "\\":
+            pos += 2
+            continue
+        if in_class:
+            in_class = char != "]"
+        elif char == "[":
+            in_class = True
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth < 0:
+                return None
+        elif char == "|" and depth == 0:
+            branches.append(pattern[start:pos])
+            start = pos + 1
+        pos += 1
+    if depth or in_class:
+        return None
+    branches.append(pattern[start:])
+    return branches
+
+
+def _lower_branch(branch: str, limit: int) -> Optional[List[Tuple[int, str]]]:
+    """改写一个顶层分支，返回条目列表或None。"""
+    kind = None
+    if branch.startswith(_LABEL_START):
+        kind, branch = KIND_DOMAIN, branch[len(_LABEL_START):]
+    elif branch.startswith("^"):
+        branch = branch[1:]
+        for group in _SUBDOMAIN_GROUPS:
+            if branch.startswith(group):
+                kind, branch = KIND_DOMAIN, branch[len(group):]
+                break
+        else:
+            kind = KIND_FULL
+    elif branch.startswith(_ANY):
+        branch = branch[len(_ANY):]
+
+    # 末尾的 $ 不能是被转义的字面字符
+    anchored_end = branch.endswith("$") and (len(branch) - len(branch[:-1].rstrip("\\")) - 1) % 2 == 0
+    if anchored_end:
+        branch = branch[:-1]
+        if kind is None:
+            return None
+    else:
+        if kind is not None:
+            return None
+        if branch.endswith(_ANY) and not branch.endswith("\\" + _ANY):
+            branch = branch[:-len(_ANY)]
+        kind = KIND_KEYWORD
+
+    parsed = _expand_sequence(branch, 0, limit, False)
+    if parsed is None or parsed[1] != len(branch):
+        return None
+    entries = []
+    for literal in parsed[0]:
+        if kind == KIND_KEYWORD:
+            if literal != literal.lower():
+                return None
+        elif not literal or literal[0] == "." or not _DOMAIN_CHARS.issuperset(literal):
+            return None
+        entries.append((kind, literal))
+    return entries
+
+
+def find_redundant_keywords(keywords: Set[bytes]) -> Set[bytes]:
+    """
+    找出被更短的关键字包含的关键字：包含另一个关键字的域名必然已被那个关键字匹配。
+
+    Args:
+        keywords: 同一策略的所有关键字
+
+    Returns:
+        set: 可以删除的关键字
+    """
+    redundant = set()
+    for keyword in keywords:
+        length = len(keyword)
+        if any(
+            keyword[start:end] in keywords
+            for start in range(length)
+            for end in range(start, length + 1)
+            if end - start < length
+        ):
+            redundant.add(keyword)
+    return redundant
+
+
+class MatcherOptimizer:
+    """
+    降低各策略域名规则中昂贵匹配器的数量。
+
+    Mosdns对 full:/domain: 条目使用哈希表，而 keyword: 和 regexp: 条目需要对每次查询逐条匹配，
+    查询延迟随其数量线性增长。本阶段把等价于 full:/domain: 的正则改写为哈希匹配器
+    （小规模的分支在展开后改写为多个条目），把两端都不锚定的字面量正则改写为 keyword:，
+    再删除被同一策略中更短的关键字包含的关键字，最后按策略报告剩余的 keyword: 和 regexp: 数量。
+    改写同时登记到RuleStore的认领上，之后的排他解析按改写后的条目判断遮蔽关系。
+    """
+
+    CONTENT_TYPE = "domain"
+    # 一条正则最多展开的条目数
+    MAX_EXPANSION = 16
+
+    def __init__(self):
+        """
+        初始化MatcherOptimizer。
+        """
+        self.logger = logging.getLogger(__name__)
+
+    def optimize(self, store: RuleStore) -> Dict[str, Dict[str, int]]:
+        """
+        优化已冻结的RuleStore中各策略的域名匹配器，并替换对应的规则列。
+
+        Args:
+            store: 已冻结的规则存储
+
+        Returns:
+            dict: {策略: {"regexp": 剩余正则数, "keyword": 剩余关键字数}}
+        """
+        start_time = time.time()
+        # {id(原规则列): (原规则列, 改写后的规则列, 改写的正则数)}，保留原列的引用使id不会被复用
+        lowered_columns: Dict[int, Tuple[RuleColumn, RuleColumn, int]] = {}
+        # {策略: 删除的冗余关键字规则行}
+        removed_by_policy: Dict[str, Set[bytes]] = {}
+        columns: Dict[str, List[Tuple[str, RuleColumn]]] = {}
+        remaining: Dict[str, Dict[str, int]] = {}
+        lowered_count = 0
+        redundant_count = 0
+
+        for policy in store.policies():
+            policy_columns = []
+            for name, column in store.iter_provider_columns(policy, self.CONTENT_TYPE):
+                # 同一提供者被多个策略引用时只改写一次，改写结果继续共享
+                cached = lowered_columns.get(id(column))
+                if cached is None:
+                    cached = lowered_columns[id(column)] = (column, *self._lower_column(column))
+                    lowered_count += cached[2]
+                policy_columns.append((name, cached[1]))
+
+            keywords: Set[bytes] = set()
+            regexps: Set[bytes] = set()
+            for _, column in policy_columns:
+                for line in column.iter_lines():
+                    kind, value = split_line(line)
+                    if kind == KIND_KEYWORD:
+                        keywords.add(value)
+                    elif kind == KIND_REGEXP:
+                        regexps.add(value)
+            redundant = find_redundant_keywords(keywords)
+            redundant_count += len(redundant)
+            if redundant:
+                removed = removed_by_policy[policy] = {KIND_PREFIXES[KIND_KEYWORD] + keyword for keyword in redundant}
+                policy_columns = [(name, filter_column(column, removed)) for name, column in policy_columns]
+
+            columns[policy] = [(name, column) for name, column in policy_columns if len(column)]
+            if keywords or regexps:
+                remaining[policy] = {"regexp": len(regexps), "keyword": len(keywords) - len(redundant)}
+
+        def rewrite(policy: str, column: RuleColumn) -> RuleColumn:
+            cached = lowered_columns.get(id(column))
+            lowered = cached[1] if cached is not None and cached[0] is column else self._lower_column(column)[0]
+            return filter_column(lowered, removed_by_policy.get(policy, set()))
+
+        store.replace_columns(self.CONTENT_TYPE, columns, rewrite)
+
+        self.logger.info(
+            f"匹配器优化完成，改写 {lowered_count} 条正则，删除 {redundant_count} 条冗余关键字",
+            extra={
+                "剩余昂贵匹配器": remaining,
+                "耗时_秒": round(time.time() - start_time, 3)
+            }
+        )
+        return remaining
+
+    def _lower_column(self, column: RuleColumn) -> Tuple[RuleColumn, int]:
+        """改写规则列中可等价改写的正则，返回 (新的规则列, 改写的正则数)；没有可改写的正则时返回原列。"""
+        rewrites: Dict[bytes, List[Tuple[int, str]]] = {}
+        for line in column.iter_lines():
+            kind, value = split_line(line)
+            if kind != KIND_REGEXP:
+                continue
+            lowered = lower_regexp(value.decode("utf-8", "replace"), self.MAX_EXPANSION)
+            if lowered is not None:
+                rewrites[value] = lowered
+                self.logger.debug(
+                    "正则已改写为低成本匹配器",
+                    extra={
+                        "regexp": value.decode("utf-8", "replace"),
+                        "改写为": [(KIND_PREFIXES[k] + v.encode("utf-8")).decode("utf-8") for k, v in lowered]
+                    }
+                )
+        if not rewrites:
+            return column, 0
+
+        groups: Dict[int, Set[bytes]] = {}
+        for line in column.iter_lines():
+            kind, value = split_line(line)
+            if kind == KIND_REGEXP and value in rewrites:
+                for new_kind, new_value in rewrites[value]:
+                    groups.setdefault(new_kind, set()).add(new_value.encode("utf-8"))
+            else:
+                groups.setdefault(kind, set()).add(value)
+        return PackedRuleColumn(groups), len(rewrites)
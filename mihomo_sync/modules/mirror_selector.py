@@ -0,0 +1,180 @@
+import logging
+import math
+import statistics
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+
+class MirrorSelector:
+    """
+    规则集下载镜像的选择器。
+
+    镜像有两种配置方式：
+    - 前缀组：一组可互相替换的URL前缀（如原始地址和若干加速代理），第一项为规范前缀；
+    - 备用URL：为某个规范URL单独列出的其他地址。
+    缓存按规范URL保存，切换镜像或Mihomo配置中使用哪个代理前缀都不会让缓存失效。
+    每个镜像（按主机区分）记录最近的下载耗时和失败情况：候选地址按平滑后的耗时排序，
+    没有记录的镜像取其他候选镜像耗时的中位数，不会排在已证明更快的镜像之前；
+    对冲请求的等待时间取该镜像耗时的分位数。
+    """
+
+    # 保留的最近耗时样本数
+    WINDOW = 50
+    # 计算分位数所需的最少样本数，不足时使用初始等待时间
+    MIN_SAMPLES = 5
+    # 平滑耗时的衰减系数
+    EWMA_ALPHA = 0.3
+    # 失败按该耗时（秒）计入平滑耗时
+    FAILURE_PENALTY = 30.0
+
+    def __init__(self, prefix_groups: Sequence[Sequence[str]] = (), alternates: Optional[Dict[str, Sequence[str]]] = None,
+                 hedge_percentile: float = 0.9, hedge_min_delay: float = 0.25, hedge_initial_delay: float = 2.0):
+        """
+        初始化MirrorSelector。
+
+        Args:
+            prefix_groups: 前缀组列表，每组的第一项为规范前缀
+            alternates: {规范URL: [备用URL]}
+            hedge_percentile: 对冲请求等待时间所取的耗时分位数（0~1）
+            hedge_min_delay: 对冲请求的最短等待时间（秒）
+            hedge_initial_delay: 镜像的耗时样本不足时的对冲等待时间（秒）
+        """
+        self.logger = logging.getLogger(__name__)
+        self.prefix_groups = [list(group) for group in prefix_groups if group]
+        self.alternates = {url: list(urls) for url, urls in (alternates or {}).items()}
+        self.hedge_percentile = min(max(float(hedge_percentile), 0.0), 1.0)
+        self.hedge_min_delay = float(hedge_min_delay)
+        self.hedge_initial_delay = float(hedge_initial_delay)
+        self._mirrors: Dict[str, Dict[str, Any]] = {}
+        self._hedge_stats = {"hedged": 0, "hedge_won": 0}
+
+    @staticmethod
+    def mirror_of(url: str) -> str:
+        """获取URL所属的镜像（主机，含端口），作为耗时统计的键。"""
+        return urlsplit(url).netloc.lower()
+
+    def _match_prefix(self, url: str) -> Optional[Tuple[List[str], str]]:
+        """查找URL匹配的最长前缀，返回 (前缀组, 去掉前缀的剩余部分)。"""
+        best = None
+        for group in self.prefix_groups:
+            for prefix in group:
+                if url.startswith(prefix) and (best is None or len(prefix) > best[0]):
+                    best = (len(prefix), group, url[len(prefix):])
+        return best[1:] if best else None
+
+    def canonical(self, url: str) -> str:
+        """获取URL的规范形式：匹配前缀组时改写为该组的规范前缀，否则原样返回。"""
+        matched = self._match_prefix(url)
+        return matched[0][0] + matched[1] if matched else url
+
+    def candidates(self, url: str) -> List[str]:
+        """
+        获取URL的所有候选下载地址，按镜像的平滑耗时排序。
+
+        没有记录的镜像按其他候选镜像平滑耗时的中位数排序，与已知镜像同分时排在其后；
+        其余同分的情况（包括所有候选都没有记录时）保持配置顺序。
+
+        Args:
+            url: 规则集URL（规范或镜像形式均可）
+
+        Returns:
+            list: 去重后的候选地址
+        """
+        canonical = self.canonical(url)
+        matched = self._match_prefix(url)
+        urls = [prefix + matched[1] for prefix in matched[0]] if matched else [canonical]
+        urls.extend(self.alternates.get(canonical, []))
+        unique = list(dict.fromkeys(urls))
+        scores = {candidate: self._score(self.mirror_of(candidate)) for candidate in unique}
+        known = [score for score in scores.values() if score is not None]
+        prior = statistics.median(known) if known else 0.0
+        return sorted(
+            unique,
+            key=lambda candidate: (prior, 1) if scores[candidate] is None else (scores[candidate], 0)
+        )
+
+    def _score(self, mirror: str) -> Optional[float]:
+        """镜像的排序分数：平滑耗时，没有记录时为None。"""
+        state = self._mirrors.get(mirror)
+        return state["ewma"] if state else None
+
+    def _state(self, mirror: str) -> Dict[str, Any]:
+        state = self._mirrors.get(mirror)
+        if state is None:
+            state = self._mirrors[mirror] = {
+                "samples": deque(maxlen=self.WINDOW), "ewma": 0.0, "requests": 0, "failures": 0
+            }
+        return state
+
+    def record(self, url: str, duration: float, success: bool) -> None:
+        """
+        记录一次下载的结果。
+
+        Args:
+            url: 实际请求的候选地址
+            duration: 从发出请求到下载完成（或失败）的耗时（秒）
+            success: 是否成功
+        """
+        state = self._state(self.mirror_of(url))
+        sample = duration if success else max(duration, self.FAILURE_PENALTY)
+        state["ewma"] = sample if not state["requests"] else \
+            self.EWMA_ALPHA * sample + (1 - self.EWMA_ALPHA) * state["ewma"]
+        state["requests"] += 1
+        if success:
+            state["samples"].append(duration)
+        else:
+            state["failures"] += 1
+
+    def record_abandoned(self, url: str, elapsed: float) -> None:
+        """
+        记录一次因其他镜像先成功而被取消的请求：已等待的时间是耗时的下限，只计入平滑耗时。
+
+        Args:
+            url: 被取消的候选地址
+            elapsed: 取消前已等待的时间（秒）
+        """
+        state = self._state(self.mirror_of(url))
+        if elapsed > state["ewma"]:
+            state["ewma"] = elapsed if not state["requests"] else \
+                self.EWMA_ALPHA * elapsed + (1 - self.EWMA_ALPHA) * state["ewma"]
+        state["requests"] += 1
+
+    def record_hedge(self, won: bool) -> None:
+        """记录一次对冲请求，以及它是否先于原请求成功。"""
+        self._hedge_stats["hedged"] += 1
+        if won:
+            self._hedge_stats["hedge_won"] += 1
+
+    def hedge_delay(self, url: str) -> float:
+        """
+        获取向下一个镜像发出对冲请求前的等待时间：该镜像成功耗时的分位数，不低于最短等待时间。
+
+        Args:
+            url: 正在等待的候选地址
+        """
+        state = self._mirrors.get(self.mirror_of(url))
+        samples: Deque[float] = state["samples"] if state else deque()
+        if len(samples) < self.MIN_SAMPLES:
+            return max(self.hedge_initial_delay, self.hedge_min_delay)
+        ordered = sorted(samples)
+        index = min(max(math.ceil(self.hedge_percentile * len(ordered)) - 1, 0), len(ordered) - 1)
+        return max(ordered[index], self.hedge_min_delay)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取各镜像的统计和对冲请求次数。
+
+        Returns:
+            dict: {"mirrors": {镜像: {请求数、失败数、平滑耗时、中位耗时}}, "hedged": 对冲次数, "hedge_won": 对冲获胜次数}
+        """
+        mirrors = {}
+        for mirror, state in self._mirrors.items():
+            ordered = sorted(state["samples"])
+            mirrors[mirror] = {
+                "requests": state["requests"],
+                "failures": state["failures"],
+                "ewma_s": round(state["ewma"], 3),
+                "p50_s": round(ordered[len(ordered) // 2], 3) if ordered else None,
+            }
+        return {"mirrors": mirrors, **self._hedge_stats}
@@ -0,0 +1,209 @@
+import io
+import logging
+import socket
+import struct
+import sys
+from array import array
+from typing import BinaryIO, Iterator, List
+
+from mihomo_sync.modules.ip_collapser import FAMILY_BITS, format_prefix, iter_prefixes
+
+try:
+    import zstandard
+except ImportError:  # zstandard为可选依赖
+    zstandard = None
+
+try:
+    from compression import zstd as stdlib_zstd  # Python 3.14+
+except ImportError:
+    stdlib_zstd = None
+
+
+# IPv4映射到IPv6地址时的前缀 (::ffff:0:0/96)
+_IPV4_MAPPED_PREFIX = 0xFFFF << 32
+_IPV4_MAPPED_MASK = ((1 << 96) - 1) << 32
+
+
+class MrsReader:
+    """
+    Mihomo二进制规则集（MRS）的解码器，支持domain和ipcidr两种行为。
+
+    MRS文件是zstd压缩的流，结构为：
+    - 4字节魔数 "MRS\\x01"，1字节行为（0=domain，1=ipcidr），int64条目数，int64长度的附加数据；
+    - domain：版本字节，随后依次是以int64长度开头的leaves、labelBitmap（均为大端uint64数组）
+      和labels字节串，组成按反转域名构建的LOUDS简洁字典树（节点按广度优先编号）；
+    - ipcidr：版本字节，int64区间数，随后每个区间是两个16字节地址（起始、结束，IPv4为映射地址）。
+
+    解码结果以文本规则集的行格式产出（如 b"+.example.com"、b"1.0.0.0/24"，不解码为str），
+    交给RuleConverter的同一套行解析器处理。
+    """
+
+    MAGIC = b"MRS\x01"
+    BEHAVIOR_CODES = {"domain": 0, "ipcidr": 1}
+    SUPPORTED_VERSION = 1
+
+    # 字典树中的通配符标签（Mihomo在导出时将 ".example.com" 还原为 "+.example.com"）
+    _DOT = ord(".")
+    _COMPLEX_WILDCARD = ord("+")
+
+    def __init__(self):
+        """
+        初始化MrsReader。
+        """
+        self.logger = logging.getLogger(__name__)
+
+    @staticmethod
+    def is_available() -> bool:
+        """当前环境是否有可用的zstd解压实现。"""
+        return zstandard is not None or stdlib_zstd is not None
+
+    @classmethod
+    def supports(cls, behavior: str) -> bool:
+        """是否可以直接解码该行为的MRS文件。"""
+        return cls.is_available() and behavior.lower() in cls.BEHAVIOR_CODES
+
+    def iter_lines(self, file_path: str, behavior: str) -> Iterator[bytes]:
+        """
+        解码MRS文件，逐条产出文本规则集格式的条目。
+
+        Args:
+            file_path: MRS文件路径
+            behavior: 规则集行为 (domain, ipcidr)
+
+        Yields:
+            bytes: 文本规则集格式的条目
+
+        Raises:
+            ValueError: 文件格式不正确或与行为不符
+            RuntimeError: 没有可用的zstd解压实现
+        """
+        behavior = behavior.lower()
+        if behavior not in self.BEHAVIOR_CODES:
+            raise ValueError(f"MRS不支持的行为类型: {behavior}")
+
+        with open(file_path, "rb") as raw, self._open_zstd(raw) as stream:
+            if self._read_exact(stream, 4) != self.MAGIC:
+                raise ValueError(f"不是有效的MRS文件: {file_path}")
+            behavior_code = self._read_exact(stream, 1)[0]
+            if behavior_code != self.BEHAVIOR_CODES[behavior]:
+                raise ValueError(f"MRS文件的行为({behavior_code})与提供者的行为({behavior})不一致")
+            count = self._read_int64(stream)
+            extra_length = self._read_int64(stream)
+            if extra_length < 0:
+                raise ValueError(f"MRS附加数据长度无效: {extra_length}")
+            if extra_length:
+                self._read_exact(stream, extra_length)
+
+            if behavior == "domain":
+                lines = self._iter_domain_set(stream)
+            else:
+                lines = self._iter_ipcidr_set(stream)
+            produced = 0
+            for line in lines:
+                produced += 1
+                yield line
+        self.logger.debug(
+            f"已解码MRS文件: {file_path}",
+            extra={"behavior": behavior, "声明条目数": count, "解码条目数": produced}
+        )
+
+    def _open_zstd(self, raw: BinaryIO) -> BinaryIO:
+        """用可用的zstd实现打开解压流。"""
+        if zstandard is not None:
+            return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw))
+        if stdlib_zstd is not None:
+            return stdlib_zstd.ZstdFile(raw, "rb")
+        raise RuntimeError("解码MRS需要zstd支持，请安装zstandard")
+
+    def _iter_domain_set(self, stream: BinaryIO) -> Iterator[bytes]:
+        """解码LOUDS编码的反转域名字典树，按深度优先顺序产出域名。"""
+        self._check_version(stream)
+        leaves = self._read_uint64_array(stream)
+        label_bitmap = self._read_uint64_array(stream)
+        labels = self._read_exact(stream, self._read_int64(stream))
+
+        # 每个节点的边占用labelBitmap中连续的0位，以1位结束；
+        # 第k个节点的第一条边的序号等于第k-1个1位之前的0位个数，边e指向的子节点编号为e+1
+        starts = [0]
+        for word_index, word in enumerate(label_bitmap):
+            base = word_index << 6
+            while word:
+                low = word & -word
+                position = base + low.bit_length() - 1
+                starts.append(position + 1 - len(starts))
+                word ^= low
+        node_count = len(starts) - 1
+        if node_count == 0:
+            return
+        if starts[-1] > len(labels):
+            raise ValueError("MRS域名字典树数据不完整")
+
+        def is_leaf(node: int) -> bool:
+            word_index = node >> 6
+            return word_index < len(leaves) and (leaves[word_index] >> (node & 63)) & 1 == 1
+
+        def child_with_label(node: int, label: int) -> int:
+            for edge in range(starts[node], starts[node + 1]):
+                if labels[edge] == label:
+                    return edge + 1
+            return -1
+
+        path = bytearray()
+        stack = [(0, 0, -1)]
+        while stack:
+            node, depth, label = stack.pop()
+            del path[depth:]
+            if label >= 0:
+                path.append(label)
+            if is_leaf(node):
+                # 文本规则集中的 "+.X" 在字典树中同时存为 "X" 和 "+.X"，这里只还原一次
+                dot_child = child_with_label(node, self._DOT) if node < node_count else -1
+                wildcard = child_with_label(dot_child, self._COMPLEX_WILDCARD) if 0 <= dot_child < node_count else -1
+                if wildcard < 0 or not is_leaf(wildcard):
+                    yield bytes(path[::-1])
+            if node < node_count:
+                depth = len(path)
+                for edge in range(starts[node + 1] - 1, starts[node] - 1, -1):
+                    stack.append((edge + 1, depth, labels[edge]))
+
+    def _iter_ipcidr_set(self, stream: BinaryIO) -> Iterator[bytes]:
+        """解码IP区间集合，把每个区间还原为最少的CIDR前缀。"""
+        self._check_version(stream)
+        count = self._read_int64(stream)
+        for _ in range(count):
+            data = self._read_exact(stream, 32)
+            start = int.from_bytes(data[:16], "big")
+            end = int.from_bytes(data[16:], "big")
+            if start & _IPV4_MAPPED_MASK == _IPV4_MAPPED_PREFIX and end & _IPV4_MAPPED_MASK == _IPV4_MAPPED_PREFIX:
+                family, start, end = socket.AF_INET, start & 0xFFFFFFFF, end & 0xFFFFFFFF
+            else:
+                family = socket.AF_INET6
+            for network, prefix_len in iter_prefixes(start, end, FAMILY_BITS[family]):
+                yield format_prefix(family, network, prefix_len)
+
+    def _check_version(self, stream: BinaryIO) -> None:
+        version = self._read_exact(stream, 1)[0]
+        if version != self.SUPPORTED_VERSION:
+            raise ValueError(f"不支持的MRS数据版本: {version}")
+
+    @staticmethod
+    def _read_exact(stream: BinaryIO, size: int) -> bytes:
+        data = stream.read(size)
+        if len(data) != size:
+            raise ValueError("MRS文件意外结束")
+        return data
+
+    @classmethod
+    def _read_int64(cls, stream: BinaryIO) -> int:
+        return struct.unpack(">q", cls._read_exact(stream, 8))[0]
+
+    @classmethod
+    def _read_uint64_array(cls, stream: BinaryIO) -> List[int]:
+        length = cls._read_int64(stream)
+        if length < 0:
+            raise ValueError(f"MRS数组长度无效: {length}")
+        values = array("Q")
+        values.frombytes(cls._read_exact(stream, length * 8))
+        if sys.byteorder == "little":
+            values.byteswap()
+        return values.tolist()
@@ -1,6 +1,275 @@
 import logging
+import mmap
 import os
-from typing import Dict, Any, List, Tuple, Callable
+import re
+from itertools import repeat
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+from mihomo_sync.modules.cache_compression import COMPRESSION_NONE, MAGIC_SIZE, detect_compression, open_decompressed
+from mihomo_sync.modules.mrs_reader import MrsReader
+from mihomo_sync.modules.rule_store import (
+    KIND_DOMAIN, KIND_FULL, KIND_KEYWORD, KIND_PREFIXES, KIND_RAW, KIND_REGEXP
+)
+from mihomo_sync.modules.yaml_ruleset_reader import YamlRulesetReader
+
+
+# 分类结果：(匹配器类型代码, 去掉前缀的规则值, 内容类型)。规则值保持为bytes，直到写入最终文件都不需要解码
+ClassifiedRule = Tuple[int, bytes, str]
+# 批量分类结果：(匹配器类型代码, 内容类型, 规则值列表)，同一批内的规则类型相同
+ClassifiedBatch = Tuple[int, str, List[bytes]]
+
+# 按块切分规则文件时每块的大小（内存预算模式下按预算缩小，不低于下限）
+_SPLIT_CHUNK_SIZE = 1024 * 1024
+_MIN_SPLIT_CHUNK_SIZE = 16 * 1024
+# 逐条产出的规则按此数量分批（内存预算模式下按预算缩小，不低于下限）
+_BATCH_SIZE = 65536
+_MIN_BATCH_SIZE = 1024
+# 一块文本切分为行并分类后，临时bytes对象约占块大小的倍数
+_CHUNK_EXPANSION = 6
+# 逐条产出的规则在分批前每条约占用的字节数（分类元组 + 规则值 + 列表槽位）
+_BATCHED_ITEM_BYTES = 128
+_UTF8_BOM = b"\xef\xbb\xbf"
+# bytes.strip() 会去除的空白字符
+_WHITESPACE = (b" ", b"\t", b"\r", b"\x0b", b"\x0c")
+_SUFFIX_PREFIXES = (b"*.", b"+.")
+
+
+def _classify_domain_suffix(value: bytes) -> Optional[ClassifiedRule]:
+    # *.example.com / +.example.com / .example.com 都按域名后缀处理；单独的 * 匹配所有域名
+    if value.startswith((b"*.", b"+.")):
+        value = value[2:]
+    elif value.startswith(b"."):
+        value = value[1:]
+    elif value == b"*":
+        return KIND_KEYWORD, b"", "domain"
+    return KIND_DOMAIN, value, "domain"
+
+
+def _classify_domain_full(value: bytes) -> Optional[ClassifiedRule]:
+    return KIND_FULL, value, "domain"
+
+
+def _classify_domain_keyword(value: bytes) -> Optional[ClassifiedRule]:
+    return KIND_KEYWORD, value, "domain"
+
+
+def _classify_domain_regex(value: bytes) -> Optional[ClassifiedRule]:
+    return KIND_REGEXP, value, "domain"
+
+
+def _classify_domain_wildcard(value: bytes) -> Optional[ClassifiedRule]:
+    # *.example.com 按域名后缀处理；其他含 * 或 ? 的通配符转换为等价的正则
+    if value == b"*":
+        return KIND_KEYWORD, b"", "domain"
+    if value.startswith(b"*.") and b"*" not in value[2:] and b"?" not in value[2:]:
+        return KIND_DOMAIN, value[2:], "domain"
+    if b"*" not in value and b"?" not in value:
+        return KIND_FULL, value, "domain"
+    pattern = "".join(
+        ".*" if char == "*" else "." if char == "?" else re.escape(char)
+        for char in value.decode("utf-8", "replace")
+    )
+    return KIND_REGEXP, f"^{pattern}$".encode("utf-8"), "domain"
+
+
+def _classify_ip_cidr(value: bytes) -> Optional[ClassifiedRule]:
+    # 只要地址部分含有":"就是IPv6（包括 ::ffff:1.2.3.0/120 这类内嵌IPv4的地址）
+    address, sep, prefix_len = value.partition(b"/")
+    if not sep or not address or not prefix_len:
+        return None
+    if b":" in address:
+        return KIND_RAW, value, "ipv6"
+    if b"." in address:
+        return KIND_RAW, value, "ipv4"
+    return None
+
+
+# classical规则类型（含API返回的驼峰名称）到分类函数的分派表
+_CLASSICAL_HANDLERS: Dict[bytes, Callable[[bytes], Optional[ClassifiedRule]]] = {
+    b"DOMAIN": _classify_domain_full,
+    b"Domain": _classify_domain_full,
+    b"DOMAIN-SUFFIX": _classify_domain_suffix,
+    b"DomainSuffix": _classify_domain_suffix,
+    b"DOMAIN-KEYWORD": _classify_domain_keyword,
+    b"DomainKeyword": _classify_domain_keyword,
+    b"DOMAIN-REGEX": _classify_domain_regex,
+    b"DomainRegex": _classify_domain_regex,
+    b"DOMAIN-WILDCARD": _classify_domain_wildcard,
+    b"DomainWildcard": _classify_domain_wildcard,
+    b"IP-CIDR": _classify_ip_cidr,
+    b"IPCIDR": _classify_ip_cidr,
+    b"IP-CIDR6": _classify_ip_cidr,
+    b"IPCIDR6": _classify_ip_cidr,
+    # IP-SUFFIX与IP-CIDR一样按CIDR输出
+    b"IP-SUFFIX": _classify_ip_cidr,
+    b"IPSuffix": _classify_ip_cidr,
+}
+
+
+def _classify_classical_line(line: bytes) -> Optional[ClassifiedRule]:
+    # 第三段起是no-resolve等附加参数，Mosdns不需要
+    rule_type, sep, rest = line.partition(b",")
+    if not sep:
+        return None
+    handler = _CLASSICAL_HANDLERS.get(rule_type) or _CLASSICAL_HANDLERS.get(rule_type.strip().upper())
+    if handler is None:
+        return None
+    value = rest.partition(b",")[0].strip()
+    return handler(value) if value else None
+
+
+def _classify_domain_line(line: bytes) -> Optional[ClassifiedRule]:
+    if line.startswith((b"+.", b"*.")):
+        return KIND_DOMAIN, line[2:], "domain"
+    if line.startswith(b"."):
+        return KIND_DOMAIN, line[1:], "domain"
+    return KIND_DOMAIN, line, "domain"
+
+
+_BEHAVIOR_CLASSIFIERS: Dict[str, Callable[[bytes], Optional[ClassifiedRule]]] = {
+    "domain": _classify_domain_line,
+    "ipcidr": _classify_ip_cidr,
+    "classical": _classify_classical_line,
+}
+
+
+def _group_classified(items: Iterable[Optional[ClassifiedRule]]) -> List[ClassifiedBatch]:
+    """把逐条分类结果按 (类型代码, 内容类型) 分组，跳过None。"""
+    groups: Dict[Tuple[int, str], List[bytes]] = {}
+    for item in items:
+        if item is not None:
+            kind, value, content_type = item
+            values = groups.get((kind, content_type))
+            if values is None:
+                values = groups[(kind, content_type)] = []
+            values.append(value)
+    return [(kind, content_type, values) for (kind, content_type), values in groups.items()]
+
+
+def _strip_suffix_prefixes(values: List[bytes]) -> List[bytes]:
+    """去掉域名后缀写法中的 *. / +. / . 前缀。"""
+    return [
+        value[2:] if value[:2] in _SUFFIX_PREFIXES else value[1:] if value[:1] == b"." else value
+        for value in values
+    ]
+
+
+def _batch_domain_suffix(values: List[bytes]) -> List[ClassifiedBatch]:
+    if b"*" not in values:
+        return [(KIND_DOMAIN, "domain", _strip_suffix_prefixes(values))]
+    # 单独的 * 匹配所有域名
+    return [
+        (KIND_KEYWORD, "domain", [b""]),
+        (KIND_DOMAIN, "domain", _strip_suffix_prefixes([value for value in values if value != b"*"])),
+    ]
+
+
+# 可以整批处理的classical规则类型；其余类型逐条调用分派表中的函数
+_BATCH_HANDLERS: Dict[Callable[[bytes], Optional[ClassifiedRule]], Callable[[List[bytes]], List[ClassifiedBatch]]] = {
+    _classify_domain_suffix: _batch_domain_suffix,
+    _classify_domain_full: lambda values: [(KIND_FULL, "domain", values)],
+    _classify_domain_keyword: lambda values: [(KIND_KEYWORD, "domain", values)],
+    _classify_domain_regex: lambda values: [(KIND_REGEXP, "domain", values)],
+}
+
+
+def _batch_classical_lines(lines: List[bytes]) -> List[ClassifiedBatch]:
+    # 先按规则类型分组，每种类型只查一次分派表
+    by_type: Dict[bytes, List[bytes]] = {}
+    for line in lines:
+        rule_type, sep, rest = line.partition(b",")
+        if sep:
+            rests = by_type.get(rule_type)
+            if rests is None:
+                rests = by_type[rule_type] = []
+            rests.append(rest)
+
+    batches: List[ClassifiedBatch] = []
+    for rule_type, rests in by_type.items():
+        handler = _CLASSICAL_HANDLERS.get(rule_type) or _CLASSICAL_HANDLERS.get(rule_type.strip().upper())
+        if handler is None:
+            continue
+        # 第三段起是no-resolve等附加参数，Mosdns不需要
+        values = [value for value in (rest.partition(b",")[0].strip() for rest in rests) if value]
+        if not values:
+            continue
+        batch_handler = _BATCH_HANDLERS.get(handler)
+        if batch_handler is not None:
+            batches.extend(batch_handler(values))
+        else:
+            batches.extend(_group_classified(map(handler, values)))
+    return batches
+
+
+_BEHAVIOR_BATCH_CLASSIFIERS: Dict[str, Callable[[List[bytes]], List[ClassifiedBatch]]] = {
+    "domain": lambda lines: [(KIND_DOMAIN, "domain", _strip_suffix_prefixes(lines))],
+    "ipcidr": lambda lines: _group_classified(map(_classify_ip_cidr, lines)),
+    "classical": _batch_classical_lines,
+}
+
+
+def _iter_mapped_chunks(file_path: str, chunk_size: int = _SPLIT_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    内存映射文件，按约chunk_size字节的块产出内容，每块都在换行处结束，不做任何解码。
+
+    gzip或zstd压缩的缓存文件无法映射，改为流式解压后按同样的方式分块。
+    """
+    with open(file_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        if detect_compression(f.read(MAGIC_SIZE)) != COMPRESSION_NONE:
+            yield from _iter_decompressed_chunks(file_path, chunk_size)
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = len(_UTF8_BOM) if data[:len(_UTF8_BOM)] == _UTF8_BOM else 0
+            while start < size:
+                end = data.find(b"\n", min(start + chunk_size, size))
+                if end == -1:
+                    end = size
+                yield data[start:end]
+                start = end + 1
+
+
+def _iter_decompressed_chunks(file_path: str, chunk_size: int = _SPLIT_CHUNK_SIZE) -> Iterator[bytes]:
+    """流式解压文件，按约chunk_size字节的块产出内容，每块都在换行处结束，内存占用与文件大小无关。"""
+    with open_decompressed(file_path) as stream:
+        pending = b""
+        first = True
+        while True:
+            data = stream.read(chunk_size)
+            if not data:
+                break
+            if first:
+                first = False
+                if data.startswith(_UTF8_BOM):
+                    data = data[len(_UTF8_BOM):]
+            data = pending + data
+            end = data.rfind(b"\n")
+            if end == -1:
+                pending = data
+                continue
+            yield data[:end]
+            pending = data[end + 1:]
+        if pending:
+            yield pending
+
+
+def _split_chunk(chunk: bytes) -> List[bytes]:
+    """把一块内容切分为去掉空白的有效行，跳过空行和注释。"""
+    lines = chunk.split(b"\n")
+    # 整块都不含空白时省去逐行strip
+    if any(char in chunk for char in _WHITESPACE):
+        lines = [line.strip() for line in lines]
+    if b"#" in chunk:
+        return [line for line in lines if line and line[0] != 35]  # '#'
+    return [line for line in lines if line]
+
+
+def _encode_items(items: Iterable[Any]) -> Iterator[bytes]:
+    """把字符串条目编码为UTF-8，bytes条目原样返回。"""
+    for item in items:
+        yield item if isinstance(item, bytes) else str(item).encode("utf-8")
 
 
 class RuleConverter:
@@ -10,8 +279,8 @@ class RuleConverter:
     def convert_single_rule(rule: Dict[str, Any]) -> Tuple[str | None, str | None]:
         """
         转换单个Mihomo规则为Mosdns格式。
-        仅处理支持的规则类型：DOMAIN, DOMAIN-SUFFIX, DOMAIN-KEYWORD, DOMAIN-WILDCARD, DOMAIN-REGEX, IP-CIDR, IP-CIDR6, IP-SUFFIX, RULE-SET。
-        其他规则类型将被跳过。
+        仅处理支持的规则类型：DOMAIN, DOMAIN-SUFFIX, DOMAIN-KEYWORD, DOMAIN-WILDCARD, DOMAIN-REGEX, IP-CIDR, IP-CIDR6, IP-SUFFIX
+        （以及API返回的驼峰名称）。其他规则类型将被跳过。
         
         Args:
             rule (dict): 来自Mihomo的单个规则。
@@ -20,38 +289,18 @@ class RuleConverter:
             tuple: (转换后的Mosdns格式字符串, 内容类型) 或 (None, None) 如果不支持。
         """
         try:
-            rule_type = rule.get("type", "")
-            
-            # 检查规则类型是否是我们支持的类型
-            supported_types = {
-                "DOMAIN", "DOMAIN-SUFFIX", "DOMAIN-KEYWORD", 
-                "DOMAIN-WILDCARD", "DOMAIN-REGEX", 
-                "IP-CIDR", "IP-CIDR6", "IP-SUFFIX", 
-                "RULE-SET", "DomainSuffix", "IPCIDR"
-            }
-            
-            if rule_type not in supported_types:
+            classified = RuleConverter.classify_rule(rule.get("type", ""), str(rule.get("payload", "")))
+            if classified is None:
                 # 不支持的规则类型，跳过
                 logging.getLogger(__name__).debug(
                     "跳过不支持的规则类型",
                     extra={
-                        "rule_type": rule_type
+                        "rule_type": rule.get("type", "")
                     }
                 )
                 return None, None
-            
-            rule_payload = rule.get("payload", "")
-            
-            # 根据规则类型确定内容类型
-            content_type = RuleConverter._determine_content_type(rule_type)
-            
-            # 转换格式
-            mosdns_rule = RuleConverter._convert_format(rule_type, rule_payload)
-            
-            if mosdns_rule:
-                return mosdns_rule, content_type
-            else:
-                return None, None
+            kind, value, content_type = classified
+            return (KIND_PREFIXES[kind] + value).decode("utf-8", "replace"), content_type
         except Exception as e:
             logging.getLogger(__name__).error(
                 "转换单个规则失败",
@@ -61,200 +310,215 @@ class RuleConverter:
                 }
             )
             return None, None
-    
-    
-    
+
     @staticmethod
-    def _determine_content_type(rule_type: str) -> str:
+    def classify_rule(rule_type: str, payload: str) -> Optional[ClassifiedRule]:
         """
-        根据规则类型确定内容类型。
-        
+        按分派表转换一条指定类型的规则。
+
         Args:
-            rule_type (str): 规则的类型。
-            
+            rule_type: 规则类型，如 DOMAIN-SUFFIX 或API返回的 DomainSuffix
+            payload: 规则内容
+
         Returns:
-            str: 内容类型 (domain, ipv4, ipv6)。
+            tuple: (匹配器类型代码, 规则值, 内容类型)，不支持的类型返回None
         """
-        # 根据规则类型确定
-        domain_types = ["DOMAIN-SUFFIX", "DOMAIN", "DOMAIN-KEYWORD", "DOMAIN-REGEX", "DOMAIN-WILDCARD", "DomainSuffix"]
-        ip_types = ["IP-CIDR", "IP-CIDR6", "IP-SUFFIX", "IPCIDR"]
-        
-        if rule_type in domain_types:
-            return "domain"
-        elif rule_type in ip_types:
-            if rule_type == "IP-CIDR6":
-                return "ipv6"
-            elif rule_type == "IP-SUFFIX":
-                # IP-SUFFIX可能是IPv4或IPv6，需要根据内容判断
-                # 但由于我们只在这里处理类型名称，返回通用的ipcidr
-                # 实际区分将在RuleGenerationOrchestrator中完成
-                return "ipcidr"
-            else:
-                return "ipv4"
-        else:
-            # 对于未知类型，默认为domain
-            return "domain"
-    
+        handler = _CLASSICAL_HANDLERS.get(rule_type.encode("utf-8"))
+        payload = payload.strip()
+        if handler is None or not payload:
+            return None
+        return handler(payload.encode("utf-8"))
+
     @staticmethod
-    def _convert_format(rule_type: str, content: str) -> str:
+    def parse_ruleset_from_file(file_path: str, behavior: str) -> List[str]:
         """
-        将Mihomo规则格式转换为Mosdns格式。
-        
+        从给定的本地文件路径解析规则集。
+
         Args:
-            rule_type (str): 规则的类型。
-            content (str): 规则的内容。
+            file_path: 规则集的本地文件路径。
+            behavior: 规则的行为 (domain, ipcidr, classical)，决定了解析方式。
             
         Returns:
-            str: 转换后的Mosdns格式规则。
+            Mosdns格式的规则列表，解析失败时为空列表。
         """
-        # 处理列表格式通配符的特殊情况
-        if rule_type == "DOMAIN-SUFFIX" or rule_type == "DomainSuffix":
-            # 处理列表格式的通配符
-            if content.startswith("*."):
-                # *.example.com -> domain:example.com
-                content = content[2:]
-                return f"domain:{content}"
-            elif content.startswith("+."):
-                # +.example.com -> domain:example.com
-                content = content[2:]
-                return f"domain:{content}"
-            elif content.startswith("."):
-                # .example.com -> domain:example.com
-                content = content[1:]
-                return f"domain:{content}"
-            elif content == "*":
-                # * -> keyword:
-                return "keyword:"
-            else:
-                # 正常的域名后缀
-                return f"domain:{content}"
-        elif rule_type == "DOMAIN":
-            return f"full:{content}"
-        elif rule_type == "DOMAIN-KEYWORD":
-            return f"keyword:{content}"
-        elif rule_type == "DOMAIN-WILDCARD":
-            # 处理通配符模式，例如 *.google.com -> domain:google.com
-            if content.startswith("*."):
-                # *.example.com -> domain:example.com
-                domain_part = content[2:]
-                return f"domain:{domain_part}"
-            elif content.startswith("*"):
-                # 如果只是"*"，则转换为keyword
-                return "keyword:"
-            else:
-                # 其他情况，尝试移除通配符并转换为domain
-                # 需要更复杂的通配符处理，先暂时转为keyword
-                return f"keyword:{content}"
-        elif rule_type == "DOMAIN-REGEX":
-            return f"regexp:{content}"
-        elif rule_type == "IP-CIDR" or rule_type == "IPCIDR":
-            return content  # 直接返回CIDR内容，不带前缀
-        elif rule_type == "IP-CIDR6":
-            return content  # 直接返回CIDR内容，不带前缀
-        elif rule_type == "IP-SUFFIX":
-            # IP-SUFFIX 格式为 IP 地址加上掩码长度，如 8.8.8.8/24
-            # 直接返回，无需前缀
-            return content
-        elif rule_type == "RULE-SET":
-            # RULE-SET 类型的规则格式通常是: RULE-SET,providername,target-policy
-            # 这里我们只处理providername部分，target-policy是mihomo的策略，Mosdns不需要
-            # RULE-SET规则需要引用已定义的规则集，这里我们简单返回providername
-            # 但实际使用中需要根据providername获取对应的规则集内容
-            logging.getLogger(__name__).debug(
-                "检测到RULE-SET规则",
-                extra={
-                    "rule_type": rule_type,
-                    "content": content
-                }
-            )
-            # 由于RULE-SET规则需要引用外部规则集，在当前上下文中无法直接转换
-            # 实际转换应通过fetch_and_parse_ruleset方法处理规则集提供者
-            # 返回空字符串表示此规则需要特殊处理
-            return ""
-        else:
-            # 对于不支持的类型，返回空字符串
-            logging.getLogger(__name__).warning(
-                "不支持的规则类型转换",
-                extra={
-                    "rule_type": rule_type,
-                    "content": content
-                }
-            )
-            return ""
+        try:
+            return list(RuleConverter.iter_ruleset_from_file(file_path, behavior))
+        except Exception as e:
+            logging.getLogger(__name__).error(f"解析文件失败: {file_path}, 错误: {e}")
+            return []
 
     @staticmethod
-    def parse_ruleset_from_file(file_path: str, behavior: str) -> List[str]:
+    def iter_ruleset_from_file(file_path: str, behavior: str, format_: str = "") -> Iterator[str]:
         """
-        从给定的本地文件路径解析规则集。
+        逐行解析规则集文件并逐条产出Mosdns格式的规则，不在内存中保留整个列表。
 
         Args:
             file_path: 规则集的本地文件路径。
             behavior: 规则的行为 (domain, ipcidr, classical)，决定了解析方式。
+            format_: 文件格式，含义同iter_classified_from_file。
             
-        Returns:
-            Mosdns格式的规则列表。
+        Yields:
+            Mosdns格式的规则。
+
+        Raises:
+            Exception: 同iter_classified_from_file。
+        """
+        for kind, value, _ in RuleConverter.iter_classified_from_file(file_path, behavior, format_):
+            yield (KIND_PREFIXES[kind] + value).decode("utf-8", "replace")
+
+    @staticmethod
+    def iter_classified_from_file(file_path: str, behavior: str, format_: str = "") -> Iterator[ClassifiedRule]:
+        """
+        逐行解析规则集文件，每行只扫描一次就得到匹配器类型、规则值和内容类型。
+
+        Args:
+            file_path: 规则集的本地文件路径。
+            behavior: 规则的行为 (domain, ipcidr, classical)，决定了解析方式。
+            format_: 文件格式，mrs时直接解码二进制规则集，yaml时流式读取payload；
+                text时内存映射文件并按bytes逐行解析，不做解码；为空时根据文件内容判断是否为YAML。
+            
+        Yields:
+            tuple: (匹配器类型代码, 规则值, 内容类型)
+
+        Raises:
+            Exception: 文件中途解析失败时抛出原异常；此前已产出的规则不完整，调用方应整体丢弃。
         """
         if not os.path.exists(file_path):
             logging.getLogger(__name__).warning(f"规则文件不存在，无法解析: {file_path}")
-            return []
+            return
 
-        parser = RuleConverter._get_parser_for_behavior(behavior)
-        if not parser:
+        classifier = _BEHAVIOR_CLASSIFIERS.get(behavior.lower())
+        if not classifier:
             logging.getLogger(__name__).warning(f"不支持的行为类型: {behavior}")
-            return []
+            return
 
-        try:
-            rules = []
-            with open(file_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#'):
-                        parsed_rule = parser(line)
-                        if parsed_rule:
-                            rules.append(parsed_rule)
-            return rules
-        except Exception as e:
-            logging.getLogger(__name__).error(f"解析文件失败: {file_path}, 错误: {e}")
-            return []
+        format_ = format_.lower()
+        if format_ == "mrs":
+            yield from RuleConverter._iter_classified_lines(MrsReader().iter_lines(file_path, behavior), classifier)
+            return
+        if format_ == "yaml" or (not format_ and YamlRulesetReader.looks_like_yaml(file_path)):
+            yield from RuleConverter._iter_classified_lines(
+                _encode_items(YamlRulesetReader().iter_lines(file_path)), classifier
+            )
+            return
+        for kind, content_type, values in RuleConverter._iter_text_batches(file_path, behavior.lower(), _SPLIT_CHUNK_SIZE):
+            yield from zip(repeat(kind), values, repeat(content_type))
 
-    # --- 私有解析辅助方法 ---
-    
     @staticmethod
-    def _get_parser_for_behavior(behavior: str) -> Callable[[str], str] | None:
-        """根据行为返回对应的行解析器。"""
-        behavior_map = {
-            "domain": RuleConverter._parse_domain_line,
-            "ipcidr": RuleConverter._parse_ipcidr_line,
-            "classical": RuleConverter._parse_classical_line,
-        }
-        return behavior_map.get(behavior.lower())
+    def iter_classified_batches(file_path: str, behavior: str, format_: str = "", chunk_size: int = _SPLIT_CHUNK_SIZE,
+                                batch_size: int = _BATCH_SIZE) -> Iterator[ClassifiedBatch]:
+        """
+        与iter_classified_from_file相同，但按批产出分类结果。
+
+        文本格式的规则集按块切分后整批分类，热路径上没有逐行的函数调用和元组分配；
+        其他格式逐条解析后再分批。
+
+        Args:
+            file_path: 规则集的本地文件路径。
+            behavior: 规则的行为 (domain, ipcidr, classical)，决定了解析方式。
+            format_: 文件格式，含义同iter_classified_from_file。
+            chunk_size: 文本格式按块切分时每块的字节数。
+            batch_size: 其他格式逐条解析后每批的最大条数。
+
+        Yields:
+            tuple: (匹配器类型代码, 内容类型, 规则值列表)
+
+        Raises:
+            Exception: 同iter_classified_from_file。
+        """
+        format_ = format_.lower()
+        if not format_ and YamlRulesetReader.looks_like_yaml(file_path):
+            format_ = "yaml"
+        if format_ in ("mrs", "yaml"):
+            yield from RuleConverter.batch_classified(
+                RuleConverter.iter_classified_from_file(file_path, behavior, format_), batch_size
+            )
+            return
+        if not os.path.exists(file_path):
+            logging.getLogger(__name__).warning(f"规则文件不存在，无法解析: {file_path}")
+            return
+        if behavior.lower() not in _BEHAVIOR_BATCH_CLASSIFIERS:
+            logging.getLogger(__name__).warning(f"不支持的行为类型: {behavior}")
+            return
+        yield from RuleConverter._iter_text_batches(file_path, behavior.lower(), chunk_size)
 
     @staticmethod
-    def _parse_domain_line(line: str) -> str:
-        if line.startswith(("+.", "*.")):
-            return f"domain:{line[2:]}"
-        if line.startswith("."):
-            return f"domain:{line[1:]}"
-        return f"domain:{line}"
+    def batch_classified(items: Iterable[ClassifiedRule], batch_size: int = _BATCH_SIZE) -> Iterator[ClassifiedBatch]:
+        """
+        把逐条的分类结果按 (类型代码, 内容类型) 分批，每批最多约 batch_size 条。
+
+        Args:
+            items: 已分类的规则
+            batch_size: 每批的最大条数
+
+        Yields:
+            tuple: (匹配器类型代码, 内容类型, 规则值列表)
+        """
+        pending: List[ClassifiedRule] = []
+        for item in items:
+            pending.append(item)
+            if len(pending) >= batch_size:
+                yield from _group_classified(pending)
+                pending = []
+        if pending:
+            yield from _group_classified(pending)
 
     @staticmethod
-    def _parse_ipcidr_line(line: str) -> str | None:
-        return line if '/' in line else None
+    def parse_sizes_for_budget(memory_budget: int) -> Tuple[int, int]:
+        """
+        根据内存预算确定文本分块的字节数和逐条规则的分批条数。
+
+        两者产生的临时对象各约占预算的1/8，预算较大时不超过默认值，较小时不低于下限。
+
+        Args:
+            memory_budget: 内存预算（字节），0表示不限制，返回默认值
+
+        Returns:
+            tuple: (分块字节数, 分批条数)
+        """
+        if memory_budget <= 0:
+            return _SPLIT_CHUNK_SIZE, _BATCH_SIZE
+        chunk_size = memory_budget // (8 * _CHUNK_EXPANSION)
+        batch_size = memory_budget // (8 * _BATCHED_ITEM_BYTES)
+        return (
+            min(_SPLIT_CHUNK_SIZE, max(_MIN_SPLIT_CHUNK_SIZE, chunk_size)),
+            min(_BATCH_SIZE, max(_MIN_BATCH_SIZE, batch_size))
+        )
 
     @staticmethod
-    def _parse_classical_line(line: str) -> str | None:
-        parts = line.split(',', 1)
-        if len(parts) != 2: return None
-        rule_type, content = parts
-        
-        if rule_type == "DOMAIN-SUFFIX": return f"domain:{content}"
-        if rule_type == "DOMAIN": return f"full:{content}"
-        if rule_type == "IP-CIDR": return content
-        # ...可以补充更多classical类型...
-        return None
-    
-    
-    
-    
-    
-    
\ No newline at end of file
+    def _iter_text_batches(file_path: str, behavior: str, chunk_size: int) -> Iterator[ClassifiedBatch]:
+        """内存映射文本规则集，按chunk_size逐块切分并整批分类。"""
+        batch_classifier = _BEHAVIOR_BATCH_CLASSIFIERS[behavior]
+        for chunk in _iter_mapped_chunks(file_path, chunk_size):
+            lines = _split_chunk(chunk)
+            if lines:
+                yield from batch_classifier(lines)
+
+    @staticmethod
+    def iter_classified_from_payload(payload: Iterable[Any], behavior: str) -> Iterator[ClassifiedRule]:
+        """
+        解析内联规则提供者（type: inline）的payload列表。
+
+        Args:
+            payload: 规则条目列表（str或bytes），格式与同behavior的规则集文件中的行相同。
+            behavior: 规则的行为 (domain, ipcidr, classical)，决定了解析方式。
+            
+        Yields:
+            tuple: (匹配器类型代码, 规则值, 内容类型)
+        """
+        classifier = _BEHAVIOR_CLASSIFIERS.get(behavior.lower())
+        if not classifier:
+            logging.getLogger(__name__).warning(f"不支持的行为类型: {behavior}")
+            return
+        yield from RuleConverter._iter_classified_lines(_encode_items(payload), classifier)
+
+    @staticmethod
+    def _iter_classified_lines(lines: Iterable[bytes],
+                               classifier: Callable[[bytes], Optional[ClassifiedRule]]) -> Iterator[ClassifiedRule]:
+        """逐行分类规则，跳过空行和注释。"""
+        for line in lines:
+            line = line.strip()
+            if line and line[0] != 35:  # '#'
+                classified = classifier(line)
+                if classified is not None:
+                    yield classified
@@ -5,15 +5,52 @@ import hashlib
 import json
 import logging
 import random
-from typing import List, Optional
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from mihomo_sync.modules.cache_compression import COMPRESSION_NONE, detect_compression, is_supported, open_compressor
+from mihomo_sync.modules.download_scheduler import DownloadScheduler, parse_retry_after
+from mihomo_sync.modules.mirror_selector import MirrorSelector
 
 class RuleDownloader:
     """
     一个高效的规则下载器，负责并发下载和基于ETag的缓存管理。
+
+    元数据中记录上次成功获取（或验证）的时间和提供者的更新间隔，缓存在间隔内视为新鲜，
+    不发起任何网络请求；过期后才用ETag做条件请求重新验证。
+    新内容分块流式写入临时文件并同时计算sha256，fsync后原子地替换缓存文件，
+    元数据（ETag、Last-Modified、摘要和大小）随后同样原子地写入；缓存文件大小与元数据不符时不再信任其ETag。
+    服务器忽略条件请求或为相同内容返回新ETag时，按摘要判断内容未变，不替换缓存文件。
+    可选地把缓存文件压缩存储（摘要按解压后的内容计算），本身已压缩的内容（如mrs）原样保存。
+    配置了镜像时缓存按规范URL保存；首选镜像在其耗时分位数内没有完成时向下一个镜像发出对冲请求，
+    首选镜像失败时立即改用下一个镜像，采用最先成功的结果。
+    每次请求都经DownloadScheduler获取名额，受全局和单主机并发上限约束；
+    429/503响应会让该主机按Retry-After冷却，其他主机的下载照常进行。
     """
 
+    # 单个URL的处理结果
+    RESULT_FRESH = "fresh"
+    RESULT_NOT_MODIFIED = "not_modified"
+    RESULT_UPDATED = "updated"
+    RESULT_UNCHANGED = "unchanged"
+    RESULT_FAILED = "failed"
+    # 缓存内容未变的结果（失败时保留原有缓存，内容同样未变）
+    UNCHANGED_RESULTS = frozenset((RESULT_FRESH, RESULT_NOT_MODIFIED, RESULT_UNCHANGED, RESULT_FAILED))
+
+    # 流式写入缓存时每次读取的块大小
+    CHUNK_SIZE = 64 * 1024
+    # 临时文件的后缀，写完后原子地重命名为缓存文件或元数据文件
+    TEMP_SUFFIX = ".tmp"
+
+    # 表示主机过载或限流的状态码，即使没有Retry-After也让该主机冷却
+    THROTTLE_STATUS_CODES = (429, 503)
+
     def __init__(self, client: httpx.AsyncClient, cache_dir: str, max_retries: int = 5, 
-                 initial_backoff: float = 1.0, max_backoff: float = 16.0, jitter: bool = True):
+                 initial_backoff: float = 1.0, max_backoff: float = 16.0, jitter: bool = True,
+                 default_interval: float = 0, scheduler: Optional[DownloadScheduler] = None,
+                 max_retry_after: float = 60.0, cache_compression: str = COMPRESSION_NONE,
+                 mirrors: Optional[MirrorSelector] = None):
         """
         初始化规则下载器。
 
@@ -24,6 +61,11 @@ class RuleDownloader:
             initial_backoff: 初始退避时间（秒）。
             max_backoff: 最大退避时间（秒）。
             jitter: 是否添加抖动以减少重试冲突。
+            default_interval: 提供者未声明interval时使用的缓存有效期（秒），0表示每次都重新验证。
+            scheduler: 下载并发调度器（可选），未提供时使用默认并发上限新建一个。
+            max_retry_after: 愿意等待的最长Retry-After（秒），超过时放弃重试并沿用已有缓存。
+            cache_compression: 缓存文件的压缩方式（none、gzip、zstd）。
+            mirrors: 镜像选择器（可选），未提供时只请求原始URL。
         """
         self.client = client
         self.cache_dir = cache_dir
@@ -31,7 +73,17 @@ class RuleDownloader:
         self.initial_backoff = initial_backoff
         self.max_backoff = max_backoff
         self.jitter = jitter
+        self.default_interval = default_interval
+        self.scheduler = scheduler or DownloadScheduler()
+        self.max_retry_after = max_retry_after
+        self.mirrors = mirrors
         self.logger = logging.getLogger(__name__)
+        if not is_supported(cache_compression):
+            self.logger.warning(f"不支持的缓存压缩方式: {cache_compression}，缓存文件将不压缩")
+            cache_compression = COMPRESSION_NONE
+        self.cache_compression = cache_compression
+        # 本次下载的传输字节数（压缩传输时小于内容字节数）、解压后的内容字节数和写入缓存的字节数
+        self._transfer_stats = {"wire_bytes": 0, "content_bytes": 0, "cache_bytes": 0}
         self.logger.debug(f"创建RuleDownloader实例，缓存目录: {self.cache_dir}")
         
         # 检查目录是否真的存在
@@ -45,14 +97,152 @@ class RuleDownloader:
         else:
             self.logger.error(f"缓存目录不存在: {self.cache_dir}")
 
+    def canonical_url(self, url: str) -> str:
+        """获取URL的规范形式，镜像形式的URL与规范URL共用同一份缓存。"""
+        return self.mirrors.canonical(url) if self.mirrors else url
+
     def get_cache_path_for_url(self, url: str) -> str:
         """
-        根据URL获取其在本地缓存中的文件路径。
+        根据URL获取其在本地缓存中的文件路径（按规范URL计算）。
         这是一个无I/O的确定性方法，用于给其他模块查询路径。
         """
-        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        key = hashlib.sha256(self.canonical_url(url).encode('utf-8')).hexdigest()
         return os.path.join(self.cache_dir, f"{key}.list")
 
+    @staticmethod
+    def get_meta_path(content_path: str) -> str:
+        """获取缓存文件对应的元数据文件路径。"""
+        return content_path.replace(".list", ".meta.json")
+
+    def _read_meta(self, meta_path: str) -> Dict[str, Any]:
+        """读取元数据，不存在或损坏时返回空字典。"""
+        if not os.path.exists(meta_path):
+            return {}
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            return meta if isinstance(meta, dict) else {}
+        except (IOError, json.JSONDecodeError):
+            self.logger.warning(f"无法读取元数据: {meta_path}")
+            return {}
+
+    def _write_meta(self, meta_path: str, meta: Dict[str, Any]) -> None:
+        """原子地写入元数据。"""
+        temp_path = self._create_temp(meta_path)
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, meta_path)
+        except BaseException:
+            self._remove_temp(temp_path)
+            raise
+
+    @classmethod
+    def _create_temp(cls, target_path: str) -> str:
+        """在目标文件所在目录创建一个唯一的空临时文件，同一文件的多个写入者不会共用临时文件。"""
+        fd, temp_path = tempfile.mkstemp(
+            prefix=os.path.basename(target_path) + ".", suffix=cls.TEMP_SUFFIX, dir=os.path.dirname(target_path)
+        )
+        os.close(fd)
+        return temp_path
+
+    @classmethod
+    def remove_stale_temp_files(cls, cache_dir: str) -> int:
+        """
+        删除进程意外退出时遗留的临时文件，只应在没有下载进行时（如启动时）调用。
+
+        Returns:
+            int: 删除的文件数
+        """
+        removed = 0
+        try:
+            names = os.listdir(cache_dir)
+        except OSError:
+            return 0
+        for name in names:
+            if name.endswith(cls.TEMP_SUFFIX):
+                try:
+                    os.remove(os.path.join(cache_dir, name))
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    @staticmethod
+    def is_intact(content_path: str, meta: Dict[str, Any]) -> bool:
+        """
+        判断缓存文件是否与元数据记录的大小一致。
+
+        Returns:
+            bool: 文件存在且大小一致时为True；旧版元数据没有记录大小时只要求文件存在
+        """
+        try:
+            size = os.path.getsize(content_path)
+        except OSError:
+            return False
+        expected = meta.get('size')
+        return not isinstance(expected, int) or expected == size
+
+    @staticmethod
+    def is_fresh(meta: Dict[str, Any], interval: float, now: Optional[float] = None) -> bool:
+        """
+        判断缓存是否仍在有效期内。
+
+        Args:
+            meta: 缓存的元数据
+            interval: 有效期（秒），不大于0时总是过期
+            now: 当前时间戳，默认取当前时间
+
+        Returns:
+            bool: 是否新鲜。系统时间被回拨到获取时间之前时视为过期
+        """
+        fetched_at = meta.get('fetched_at')
+        if interval <= 0 or not isinstance(fetched_at, (int, float)):
+            return False
+        now = time.time() if now is None else now
+        return fetched_at <= now < fetched_at + interval
+
+    def has_usable_cache(self, url: str) -> bool:
+        """URL是否有完整的本地缓存（不考虑是否过期）。"""
+        content_path = self.get_cache_path_for_url(url)
+        return self.is_intact(content_path, self._read_meta(self.get_meta_path(content_path)))
+
+    async def _stream_to_file(self, response: httpx.Response, path: str) -> Tuple[str, int]:
+        """
+        把响应体分块写入文件（按cache_compression压缩）并计算解压后内容的sha256，写完后fsync。
+
+        Args:
+            response: 以流式方式打开的响应
+            path: 目标文件路径
+
+        Returns:
+            tuple: (sha256十六进制摘要, 写入文件的字节数)
+        """
+        digest = hashlib.sha256()
+        content_size = 0
+        with open(path, 'wb') as f:
+            writer = None
+            async for chunk in response.aiter_bytes(self.CHUNK_SIZE):
+                if writer is None:
+                    # 已经压缩过的内容再压缩没有收益
+                    compress = self.cache_compression != COMPRESSION_NONE and \
+                        detect_compression(chunk) == COMPRESSION_NONE
+                    writer = open_compressor(f, self.cache_compression) if compress else f
+                writer.write(chunk)
+                digest.update(chunk)
+                content_size += len(chunk)
+            if writer is not None and writer is not f:
+                writer.close()
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        self._transfer_stats["wire_bytes"] += response.num_bytes_downloaded
+        self._transfer_stats["content_bytes"] += content_size
+        self._transfer_stats["cache_bytes"] += size
+        return digest.hexdigest(), size
+
     async def _exponential_backoff_with_jitter(self, attempt: int) -> float:
         """
         计算带抖动的指数退避时间。
@@ -73,28 +263,25 @@ class RuleDownloader:
             # 不使用抖动，返回固定退避时间
             return base_time
 
-    async def _download_with_retry(self, url: str, headers: dict) -> Optional[httpx.Response]:
+    async def _download_with_retry(self, url: str, headers: dict,
+                                   temp_path: str) -> Optional[Tuple[httpx.Response, str, int]]:
         """
-        使用指数退避和重试机制下载URL内容。
+        使用指数退避和重试机制下载URL内容，响应体流式写入temp_path。
         
         Args:
             url: 要下载的URL。
             headers: 请求头。
+            temp_path: 响应体写入的临时文件路径。
             
         Returns:
-            HTTP响应对象，如果失败则返回None。
+            (HTTP响应对象, 响应体的sha256摘要, 字节数)，304响应的摘要为空串；如果失败则返回None。
         """
         last_exception = None
         
         for attempt in range(self.max_retries + 1):
             try:
-                response = await self.client.get(url, timeout=30, headers=headers)
-                
-                if response.status_code != 304:
-                    response.raise_for_status()
-                
                 # 成功，返回响应
-                return response
+                return await self._fetch_from_mirrors(url, headers, temp_path)
                 
             except (httpx.HTTPStatusError, httpx.RequestError) as e:
                 last_exception = e
@@ -106,6 +293,16 @@ class RuleDownloader:
                 
                 # 计算退避时间
                 backoff_time = await self._exponential_backoff_with_jitter(attempt)
+                cooldown = self._get_throttle_cooldown(e, backoff_time)
+                if cooldown is not None:
+                    if cooldown > self.max_retry_after:
+                        self.logger.error(
+                            f"服务器要求的等待时间 {cooldown:.0f} 秒超过上限 {self.max_retry_after:.0f} 秒，放弃重试: {url}"
+                        )
+                        break
+                    # 让该主机的其他请求一起冷却；重试时间在冷却结束后再随机错开，避免同时涌向刚恢复的主机
+                    self.scheduler.throttle(str(e.request.url), cooldown)
+                    backoff_time = cooldown + (random.uniform(0, self.initial_backoff) if self.jitter else 0)
                 
                 self.logger.warning(
                     f"下载规则失败 (尝试 {attempt + 1}/{self.max_retries + 1}): {url}, "
@@ -118,75 +315,265 @@ class RuleDownloader:
         # 所有重试都失败了
         return None
 
-    async def _ensure_rule_updated(self, url: str):
+    async def _fetch(self, url: str, headers: dict, temp_path: str) -> Tuple[httpx.Response, str, int]:
+        """
+        发出一次请求并把响应体写入temp_path，失败时抛出异常。
+
+        Returns:
+            (HTTP响应对象, 响应体的sha256摘要, 字节数)，304响应的摘要为空串
+        """
+        digest, size = "", 0
+        async with self.scheduler.slot(url):
+            start_time = time.monotonic()
+            try:
+                async with self.client.stream('GET', url, timeout=30, headers=headers) as response:
+                    if response.status_code != 304:
+                        response.raise_for_status()
+                        digest, size = await self._stream_to_file(response, temp_path)
+            except (httpx.HTTPStatusError, httpx.RequestError):
+                if self.mirrors:
+                    self.mirrors.record(url, time.monotonic() - start_time, False)
+                raise
+        if self.mirrors:
+            self.mirrors.record(url, time.monotonic() - start_time, True)
+        return response, digest, size
+
+    async def _fetch_from_mirrors(self, url: str, headers: dict, temp_path: str) -> Tuple[httpx.Response, str, int]:
+        """
+        按镜像的耗时顺序下载URL：当前请求超过该镜像的对冲等待时间仍未完成时向下一个镜像再发一个请求，
+        请求失败时立即改用下一个镜像；采用最先成功的结果，取消其余请求。
+
+        每个请求写入各自唯一的临时文件，胜出者的文件被重命名为temp_path。
+
+        Returns:
+            (HTTP响应对象, 响应体的sha256摘要, 字节数)
+
+        Raises:
+            httpx.HTTPStatusError, httpx.RequestError: 所有镜像都失败时抛出最后一个错误
+        """
+        candidates = self.mirrors.candidates(url) if self.mirrors else [url]
+        if len(candidates) == 1:
+            return await self._fetch(candidates[0], headers, temp_path)
+
+        pending: Dict[asyncio.Task, Tuple[str, str, float]] = {}
+        launched = 0
+        hedged = False
+        last_error: Optional[Exception] = None
+
+        def launch() -> None:
+            nonlocal launched
+            candidate = candidates[launched]
+            path = self._create_temp(temp_path)
+            pending[asyncio.ensure_future(self._fetch(candidate, headers, path))] = (candidate, path, time.monotonic())
+            launched += 1
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if launched < len(candidates):
+                    timeout = self.mirrors.hedge_delay(candidates[launched - 1])
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.logger.debug(f"镜像响应较慢，向下一个镜像发出对冲请求: {candidates[launched]}")
+                    hedged = True
+                    launch()
+                    continue
+                for task in done:
+                    candidate, path, _ = pending.pop(task)
+                    try:
+                        response, digest, size = task.result()
+                    except (httpx.HTTPStatusError, httpx.RequestError) as e:
+                        self._remove_temp(path)
+                        last_error = e
+                        self.logger.debug(f"镜像下载失败: {candidate}, 错误: {e}")
+                        continue
+                    except BaseException:
+                        self._remove_temp(path)
+                        raise
+                    if response.status_code != 304:
+                        os.replace(path, temp_path)
+                    else:
+                        self._remove_temp(path)
+                    if hedged:
+                        self.mirrors.record_hedge(candidate != candidates[0])
+                    self.logger.debug(f"已从镜像下载: {candidate}")
+                    return response, digest, size
+                if not pending and launched < len(candidates):
+                    launch()
+        finally:
+            for task, (candidate, path, started_at) in pending.items():
+                task.cancel()
+                self.mirrors.record_abandoned(candidate, time.monotonic() - started_at)
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+                for _, path, _ in pending.values():
+                    self._remove_temp(path)
+        raise last_error
+
+    def _get_throttle_cooldown(self, error: Exception, backoff_time: float) -> Optional[float]:
+        """
+        判断一次失败是否为主机限流，是则返回主机的冷却时间。
+
+        Args:
+            error: 请求抛出的异常
+            backoff_time: 本次重试的退避时间，没有Retry-After时作为冷却时间
+
+        Returns:
+            float: 冷却时间（秒）；429/503，或带有Retry-After的5xx响应才视为限流，否则返回None
+        """
+        if not isinstance(error, httpx.HTTPStatusError):
+            return None
+        status_code = error.response.status_code
+        retry_after = parse_retry_after(error.response.headers.get('Retry-After'))
+        if status_code in self.THROTTLE_STATUS_CODES:
+            return backoff_time if retry_after is None else retry_after
+        if status_code >= 500 and retry_after is not None:
+            return retry_after
+        return None
+
+    async def _ensure_rule_updated(self, url: str, interval: float, force_refresh: bool = False) -> str:
         """
         确保单个URL的规则文件是最新的。
-        如果本地缓存有效，则跳过下载；否则，下载并更新缓存。
+        如果本地缓存仍在有效期内，则不发起请求；否则用ETag和Last-Modified做条件请求，
+        必要时下载，内容的摘要与缓存不同时才更新缓存。
+
+        Args:
+            url: 规则文件URL
+            interval: 缓存有效期（秒）
+            force_refresh: 是否忽略有效期强制重新验证
+
+        Returns:
+            str: 处理结果，RESULT_* 之一
         """
         content_path = self.get_cache_path_for_url(url)
-        meta_path = content_path.replace(".list", ".meta.json")
+        meta_path = self.get_meta_path(content_path)
         headers = {}
         
         self.logger.debug(f"处理URL: {url}")
         self.logger.debug(f"缓存文件路径: {content_path}")
         self.logger.debug(f"元数据文件路径: {meta_path}")
         
-        # 1. 检查本地缓存元数据，获取ETag
-        if os.path.exists(meta_path):
-            try:
-                with open(meta_path, 'r') as f:
-                    etag = json.load(f).get('etag')
-                if etag:
-                    headers['If-None-Match'] = etag
-                    self.logger.debug(f"使用ETag进行条件请求: {etag}")
-            except (IOError, json.JSONDecodeError):
-                self.logger.warning(f"无法读取元数据: {meta_path}")
+        # 1. 检查本地缓存元数据：有效期内直接使用缓存，否则获取ETag和Last-Modified
+        meta = self._read_meta(meta_path)
+        cached = self.is_intact(content_path, meta)
+        if not cached and os.path.exists(content_path):
+            self.logger.warning(f"缓存文件与元数据记录的大小不符，将重新完整下载: {url}")
+        if cached and not force_refresh and self.is_fresh(meta, interval):
+            self.logger.debug(
+                f"缓存仍在有效期内，跳过验证: {url}",
+                extra={"剩余有效期_秒": round(meta['fetched_at'] + interval - time.time(), 1)}
+            )
+            return self.RESULT_FRESH
+        etag = meta.get('etag') if cached else None
+        if etag:
+            headers['If-None-Match'] = etag
+            self.logger.debug(f"使用ETag进行条件请求: {etag}")
         else:
-            self.logger.debug("未找到元数据文件，将进行完整下载")
+            self.logger.debug("没有可用的ETag，将进行完整下载")
+        last_modified = meta.get('last_modified') if cached else None
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
 
-        # 2. 使用重试机制发起异步条件请求
-        response = await self._download_with_retry(url, headers)
+        # 2. 使用重试机制发起异步条件请求，新内容流式写入临时文件（按原始字节保存，mrs等二进制格式不能按文本解码）
+        temp_path = self._create_temp(content_path)
+        try:
+            downloaded = await self._download_with_retry(url, headers, temp_path)
+        except BaseException:
+            self._remove_temp(temp_path)
+            raise
         
-        if response is None:
-            # 所有重试都失败了
+        if downloaded is None:
+            # 所有重试都失败了，保留原有缓存
+            self._remove_temp(temp_path)
             self.logger.error(f"下载失败: {url}")
-            return
+            return self.RESULT_FAILED
 
+        response, digest, size = downloaded
         if response.status_code == 304:
             self.logger.debug(f"缓存命中 (304): {url}")
-            return
+            # 验证通过，重新开始计算有效期
+            self._remove_temp(temp_path)
+            self._write_meta(meta_path, dict(meta, fetched_at=time.time(), interval=interval))
+            return self.RESULT_NOT_MODIFIED
 
-        # 3. 下载新内容并更新缓存
-        self.logger.debug(f"下载新内容: {url}")
-        try:
-            text = response.content.decode("utf-8", errors="replace")
-        except Exception:
-            text = response.text  # 保底方案
-        with open(content_path, 'w', encoding='utf-8') as f:
-            f.write(text)
-        
-        new_etag = response.headers.get('ETag')
-        if new_etag:
-            with open(meta_path, 'w', encoding='utf-8') as f:
-                json.dump({'etag': new_etag}, f, ensure_ascii=False)
-            self.logger.debug(f"已保存ETag: {new_etag}")
-        elif os.path.exists(meta_path):
-            os.remove(meta_path)
-            self.logger.debug("已删除旧的元数据文件")
+        new_meta: Dict[str, Any] = {'fetched_at': time.time(), 'interval': interval, 'sha256': digest, 'size': size}
+        for header, key in (('ETag', 'etag'), ('Last-Modified', 'last_modified')):
+            value = response.headers.get(header)
+            if value:
+                new_meta[key] = value
+
+        # 3. 内容与缓存相同时保留缓存文件，只更新验证信息；否则原子地替换缓存文件，再写入与之对应的元数据
+        if cached and digest == meta.get('sha256') and size == meta.get('size'):
+            self._remove_temp(temp_path)
+            self._write_meta(meta_path, new_meta)
+            self.logger.debug(f"内容未变化，保留缓存: {url}", extra={"sha256": digest})
+            return self.RESULT_UNCHANGED
+
+        os.replace(temp_path, content_path)
+        self._write_meta(meta_path, new_meta)
         
-        self.logger.debug(f"成功更新缓存: {url}")
+        self.logger.debug(f"成功更新缓存: {url}", extra={"sha256": digest, "字节数": size})
+        return self.RESULT_UPDATED
+
+    def _remove_temp(self, temp_path: str) -> None:
+        """删除未完成的临时文件。"""
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.logger.warning(f"无法删除临时文件: {temp_path}, 错误: {e}")
 
-    async def download_rules(self, urls: List[str]):
+    async def download_rules(self, urls: List[str], intervals: Optional[Dict[str, float]] = None,
+                             force_refresh: bool = False) -> Dict[str, str]:
         """
         并发地确保所有提供的URL规则文件都已下载并更新到本地缓存。
+
+        Args:
+            urls: 规则文件URL列表
+            intervals: {URL: 缓存有效期（秒）}，未列出的URL使用default_interval
+            force_refresh: 是否忽略有效期，对所有URL重新验证
+
+        Returns:
+            dict: {URL: 处理结果}，结果属于UNCHANGED_RESULTS时缓存文件的内容与之前相同
         """
         if not urls:
-            return
+            return {}
         
-        self.logger.debug(f"开始并发检查/下载 {len(urls)} 个规则文件...")
-        tasks = [self._ensure_rule_updated(url) for url in urls]
-        await asyncio.gather(*tasks)
-        self.logger.debug("所有规则文件下载任务完成。")
+        intervals = intervals or {}
+        # 规范URL相同的URL共用一份缓存，只下载一次，有效期取其中最短的
+        canonical_intervals: Dict[str, float] = {}
+        for url in urls:
+            canonical = self.canonical_url(url)
+            interval = intervals.get(url) or self.default_interval
+            previous = canonical_intervals.get(canonical)
+            canonical_intervals[canonical] = interval if previous is None else min(previous, interval)
+        self.logger.debug(f"开始并发检查/下载 {len(canonical_intervals)} 个规则文件...")
+        tasks = [
+            self._ensure_rule_updated(canonical, interval, force_refresh)
+            for canonical, interval in canonical_intervals.items()
+        ]
+        canonical_results = dict(zip(canonical_intervals, await asyncio.gather(*tasks)))
+        results = {url: canonical_results[self.canonical_url(url)] for url in urls}
+        counts = {result: 0 for result in (self.RESULT_FRESH, self.RESULT_NOT_MODIFIED,
+                                           self.RESULT_UNCHANGED, self.RESULT_UPDATED, self.RESULT_FAILED)}
+        for result in canonical_results.values():
+            counts[result] += 1
+        self.logger.info(
+            f"规则文件检查完成，{counts[self.RESULT_FRESH]} 个在有效期内无需联网",
+            extra={
+                "有效期内": counts[self.RESULT_FRESH],
+                "未修改": counts[self.RESULT_NOT_MODIFIED],
+                "内容未变": counts[self.RESULT_UNCHANGED],
+                "已更新": counts[self.RESULT_UPDATED],
+                "失败": counts[self.RESULT_FAILED],
+                "强制刷新": force_refresh,
+                "传输统计_字节": dict(self._transfer_stats),
+                "下载调度统计_累计": self.scheduler.stats(),
+                "镜像统计_累计": self.mirrors.stats() if self.mirrors else None
+            }
+        )
         
         # 检查缓存目录是否仍然存在
         if os.path.exists(self.cache_dir):
@@ -196,4 +583,5 @@ class RuleDownloader:
             except Exception as e:
                 self.logger.debug(f"下载完成后无法列出缓存目录内容: {e}")
         else:
-            self.logger.error(f"下载完成后缓存目录不存在: {self.cache_dir}")
\ No newline at end of file
+            self.logger.error(f"下载完成后缓存目录不存在: {self.cache_dir}")
+        return results
@@ -1,13 +1,26 @@
+import asyncio
 import logging
 import os
 import shutil
 import time
-from typing import Dict, Any, List, Set, Tuple
-import httpx
-from mihomo_sync.modules.rule_converter import RuleConverter
+from typing import Awaitable, Callable, Dict, Any, Iterable, List, Optional, Set, Tuple
+from mihomo_sync.modules.rule_converter import ClassifiedBatch, RuleConverter
 from mihomo_sync.modules.policy_resolver import PolicyResolver
 from mihomo_sync.modules.mihomo_config_parser import MihomoConfigParser
+from mihomo_sync.modules.mrs_reader import MrsReader
 from mihomo_sync.modules.rule_downloader import RuleDownloader
+from mihomo_sync.modules.domain_compactor import DomainCompactor
+from mihomo_sync.modules.download_client import DownloadClient
+from mihomo_sync.modules.download_scheduler import DownloadScheduler
+from mihomo_sync.modules.exclusive_resolver import ExclusivePolicyResolver
+from mihomo_sync.modules.external_sorter import ExternalSorter
+from mihomo_sync.modules.geoip_reader import GeoIpReader
+from mihomo_sync.modules.geosite_reader import GeoSiteReader
+from mihomo_sync.modules.ip_collapser import CidrCollapser
+from mihomo_sync.modules.ip_conflict_resolver import IpConflictResolver
+from mihomo_sync.modules.matcher_optimizer import MatcherOptimizer
+from mihomo_sync.modules.mirror_selector import MirrorSelector
+from mihomo_sync.modules.rule_store import KIND_PREFIXES, ProviderCorpus, RuleStore, SpilledRuleColumn
 
 
 class RuleGenerationOrchestrator:
@@ -16,7 +29,29 @@ class RuleGenerationOrchestrator:
     # 定义固定的策略名称
     FIXED_POLICIES = ["DIRECT", "PROXY", "REJECT"]
     
-    def __init__(self, api_client, config, mihomo_config_parser=None, mihomo_config_path=""):
+    # 版本化工作空间、待删除目录和默认缓存目录的命名
+    WORKSPACE_DIR_PREFIX = "gen-"
+    TRASH_DIR_PREFIX = ".trash-"
+    DEFAULT_CACHE_DIR_NAME = ".cache"
+    SPILL_DIR_NAME = "spill"
+    IP_CONFLICT_REPORT_NAME = "ip_conflicts.json"
+    # GeoSite数据库的默认文件名（位于Mihomo配置目录）、索引缓存文件名和展开后规则集合的名称前缀
+    GEOSITE_FILE_NAMES = ("GeoSite.dat", "geosite.dat")
+    GEOSITE_INDEX_NAME = "geosite.index.json"
+    GEOSITE_CORPUS_PREFIX = "geosite:"
+    # GeoIP数据库的默认文件名（mmdb优先）和提取后规则集合的名称前缀
+    GEOIP_FILE_NAMES = ("Country.mmdb", "GeoIP.dat", "geoip.dat")
+    GEOIP_CORPUS_PREFIX = "geoip:"
+    CONTENT_TYPES = ("domain", "ipv4", "ipv6")
+    # 提供者的规则来源
+    SOURCE_INLINE = "inline"
+    SOURCE_LOCAL = "local"
+    SOURCE_URL = "url"
+    # 外部排序时作为行前缀的内容类型序号（ASCII数字），使同一内容类型的规则排在一起
+    CONTENT_TYPE_TAGS = {content_type: str(i).encode("ascii") for i, content_type in enumerate(CONTENT_TYPES)}
+    
+    def __init__(self, api_client, config, mihomo_config_parser=None, mihomo_config_path="",
+                 download_client: Optional[DownloadClient] = None):
         """
         初始化RuleGenerationOrchestrator。
         
@@ -25,12 +60,48 @@ class RuleGenerationOrchestrator:
             config: ConfigManager实例
             mihomo_config_parser: MihomoConfigParser实例（可选）
             mihomo_config_path: Mihomo配置文件路径（可选）
+            download_client: 服务共享的规则下载客户端（可选），未提供时按配置创建并在close时关闭
         """
         self.api_client = api_client
         self.config = config
         self.mihomo_config_parser = mihomo_config_parser
         self.mihomo_config_path = mihomo_config_path
         self.intermediate_dir = self.config.get_mosdns_rules_path() + "_intermediate"
+        self.workspace_dir = ""
+        # 内存预算模式下规则落盘的目录和内存预算（字节），为空表示全部在内存中聚合
+        self._spill_dir = ""
+        self._memory_budget = 0
+        self._spill_seq = 0
+        # 解析规则集时的分块字节数和分批条数，内存预算模式下按预算缩小
+        self._parse_chunk_size, self._parse_batch_size = RuleConverter.parse_sizes_for_budget(0)
+        # 本次生成中各提供者的来源：{提供者名称: (来源类型, 路径)}
+        self._provider_sources: Dict[str, Tuple[str, str]] = {}
+        # 本次生成中各远程规则集的下载结果：{URL: RuleDownloader.RESULT_*}
+        self._download_results: Dict[str, str] = {}
+        # 跨生成复用的提供者解析结果：{提供者名称: (来源签名, 规则集合)}，
+        # 每次生成结束后只保留本次用到的条目
+        self._corpus_cache: Dict[str, Tuple[Tuple, ProviderCorpus]] = {}
+        self._next_corpus_cache: Dict[str, Tuple[Tuple, ProviderCorpus]] = {}
+        self._reused_corpus_count = 0
+        # stale-while-revalidate模式下的后台重新验证任务、发现内容变化时的回调，
+        # 以及已在后台验证过、下一次生成无需再验证的URL
+        self._revalidation_task: Optional[asyncio.Task] = None
+        self._content_changed_callback: Optional[Callable[[], Awaitable[None]]] = None
+        self._revalidated_urls: Set[str] = set()
+        # 本次生成是否忽略缓存有效期，以及下一次生成是否需要强制刷新
+        self._force_refresh = False
+        self._refresh_requested = False
+        self._geosite_reader = GeoSiteReader(
+            os.path.join(self._get_cache_dir(), self.GEOSITE_INDEX_NAME)
+        )
+        self._geoip_reader = GeoIpReader(self._get_cache_dir())
+        self._cleanup_tasks: Set[asyncio.Task] = set()
+        self._owns_download_client = download_client is None
+        self._download_client = download_client or self.create_download_client(config)
+        # 调度器与协调器同生命周期，主机的限流冷却跨生成保留
+        self._download_scheduler = self.create_download_scheduler(config)
+        # 镜像的耗时统计同样跨生成保留，未配置镜像时为None
+        self._mirror_selector = self.create_mirror_selector(config)
         self.logger = logging.getLogger(__name__)
         self.policy_resolver = PolicyResolver()
         self.logger.debug(
@@ -41,21 +112,41 @@ class RuleGenerationOrchestrator:
             }
         )
     
-    async def run(self) -> str:
+    def request_refresh(self) -> None:
+        """要求下一次生成忽略缓存有效期，重新验证所有远程规则集。"""
+        self._refresh_requested = True
+        self.logger.info("已请求在下一次生成时强制刷新远程规则集")
+
+    def set_content_changed_callback(self, callback: Optional[Callable[[], Awaitable[None]]]) -> None:
+        """
+        设置后台重新验证发现远程规则集内容变化时调用的回调，通常用于再触发一次生成。
+
+        Args:
+            callback: 无参数的协程函数
+        """
+        self._content_changed_callback = callback
+
+    async def run(self, force_refresh: bool = False) -> RuleStore:
         """
         执行完整的分发阶段工作流。
         
+        聚合结果直接交给RuleMerger写入最终文件；仅在开启intermediate_debug_dump时
+        才会额外把中间文件写入本次生成的工作空间，便于调试。
+        
+        Args:
+            force_refresh: 是否忽略提供者的interval，重新验证所有远程规则集；
+                通过request_refresh请求的刷新也在本次生成中执行
+        
         Returns:
-            str: 生成的中间目录路径
+            RuleStore: 冻结后的紧凑规则聚合结果
         """
         self.logger.debug("正在启动规则生成协调...")
         start_time = time.time()
+        self._force_refresh = force_refresh or self._refresh_requested
+        self._refresh_requested = False
         
         try:
-            # 步骤1：准备工作空间
-            self._prepare_workspace()
-            
-            # 步骤2：从API获取数据
+            # 步骤1：从API获取数据
             self.logger.debug("正在从API获取数据...")
             api_start_time = time.time()
             
@@ -74,7 +165,7 @@ class RuleGenerationOrchestrator:
                 }
             )
             
-            # 步骤3：如果可用，从配置文件获取规则提供者信息
+            # 步骤2：如果可用，从配置文件获取规则提供者信息
             config_provider_info = {}
             config_duration = 0
             if self.mihomo_config_parser and self.mihomo_config_path and os.path.exists(self.mihomo_config_path):
@@ -102,7 +193,7 @@ class RuleGenerationOrchestrator:
             else:
                 self.logger.debug("未提供配置文件或文件不存在，跳过配置文件解析")
         
-            # 步骤4：合并API和配置提供者信息
+            # 步骤3：合并API和配置提供者信息
             # 配置文件信息优先于API信息
             providers_info = rule_providers_data.get("providers", {})
             providers_info.update(config_provider_info)
@@ -114,44 +205,51 @@ class RuleGenerationOrchestrator:
                 }
             )
             
-            # 步骤5：设置环境：创建共享客户端和模块实例
-            async with httpx.AsyncClient() as client:
-                # 使用配置文件中的缓存目录路径，如果未设置则使用默认路径
-                cache_path = self.config.get_cache_dir_path()
-                if not cache_path:
-                    cache_path = os.path.join(self.intermediate_dir, ".cache")
-                    self.logger.debug(f"使用默认缓存路径: {cache_path}")
-                else:
-                    self.logger.debug(f"使用配置的缓存路径: {cache_path}")
-                
-                # 确保缓存目录存在
-                os.makedirs(cache_path, exist_ok=True)
-                self.logger.debug(f"确保缓存目录存在: {cache_path}")
-                
-                # 获取重试配置
-                retry_config = self.config.get_api_retry_config()
-                max_retries = retry_config.get('max_retries', 5)
-                initial_backoff = retry_config.get('initial_backoff', 1.0)
-                max_backoff = retry_config.get('max_backoff', 16.0)
-                jitter = retry_config.get('jitter', True)
-                
-                downloader = RuleDownloader(
-                    client=client, 
-                    cache_dir=cache_path,
-                    max_retries=max_retries,
-                    initial_backoff=initial_backoff,
-                    max_backoff=max_backoff,
-                    jitter=jitter
-                )
-                
-                # 步骤6：初始化内存聚合器
-                # 初始化固定策略的聚合器
-                aggregated_rules = {policy: {} for policy in self.FIXED_POLICIES}
-
-                # 步骤7：处理规则 (现在会使用新的架构)
-                self.logger.debug("正在处理规则...")
-                process_start_time = time.time()
-                await self._process_rules(rules_data, providers_info, proxies_data, aggregated_rules, downloader)
+            # 步骤4：设置环境：使用服务生命周期内共享的下载客户端创建模块实例
+            # 使用配置文件中的缓存目录路径，如果未设置则使用默认路径
+            cache_path = self._get_cache_dir()
+            self.logger.debug(f"使用缓存路径: {cache_path}")
+            
+            # 确保缓存目录存在
+            os.makedirs(cache_path, exist_ok=True)
+            self.logger.debug(f"确保缓存目录存在: {cache_path}")
+            
+            # 获取重试配置
+            retry_config = self.config.get_api_retry_config()
+            max_retries = retry_config.get('max_retries', 5)
+            initial_backoff = retry_config.get('initial_backoff', 1.0)
+            max_backoff = retry_config.get('max_backoff', 16.0)
+            jitter = retry_config.get('jitter', True)
+            
+            downloader = RuleDownloader(
+                client=self._download_client.client,
+                cache_dir=cache_path,
+                max_retries=max_retries,
+                initial_backoff=initial_backoff,
+                max_backoff=max_backoff,
+                jitter=jitter,
+                default_interval=self.config.get_default_provider_interval(),
+                scheduler=self._download_scheduler,
+                max_retry_after=self.config.get_download_client_config().get('max_retry_after', 60.0),
+                cache_compression=self.config.get_download_cache_compression(),
+                mirrors=self._mirror_selector
+            )
+            
+            # 步骤5：初始化内存聚合器
+            # 初始化固定策略的聚合器
+            aggregated_rules = RuleStore(self.FIXED_POLICIES)
+            self._prepare_generation()
+
+            # 步骤6：处理规则 (现在会使用新的架构)
+            self.logger.debug("正在处理规则...")
+            process_start_time = time.time()
+            await self._process_rules(rules_data, providers_info, proxies_data, aggregated_rules, downloader)
+            aggregated_rules.freeze()
+            self._corpus_cache = self._next_corpus_cache
+            self._optimize_matchers(aggregated_rules)
+            self._resolve_exclusive_policies(aggregated_rules)
+            self._compact_domains(aggregated_rules)
+            self._aggregate_ip_rules(aggregated_rules)
             process_duration = time.time() - process_start_time
             
             self.logger.debug(
@@ -161,7 +259,7 @@ class RuleGenerationOrchestrator:
                 }
             )
             
-            # 检查缓存目录是否仍然存在
+            # 步骤7：检查缓存目录是否仍然存在
             if os.path.exists(cache_path):
                 self.logger.debug(f"规则处理完成后缓存目录仍然存在: {cache_path}")
                 try:
@@ -172,25 +270,30 @@ class RuleGenerationOrchestrator:
             else:
                 self.logger.debug(f"规则处理完成后缓存目录不存在: {cache_path}")
             
-            # 步骤7：写入中间文件
-            self.logger.debug("正在写入中间文件...")
-            write_start_time = time.time()
-            self._write_intermediate_files(aggregated_rules)
-            write_duration = time.time() - write_start_time
+            # 步骤8：可选地写入中间文件用于调试
+            write_duration = 0
+            if self.config.get_intermediate_debug_dump():
+                self.logger.debug("正在写入中间文件...")
+                write_start_time = time.time()
+                self._write_intermediate_files(aggregated_rules)
+                write_duration = time.time() - write_start_time
+                self.logger.info(f"调试用中间文件已生成到: {self.workspace_dir}")
             
             total_duration = time.time() - start_time
             self.logger.info(
-                f"规则中间文件已生成到: {self.intermediate_dir}",
+                "规则聚合完成",
                 extra={
                     "总耗时_秒": round(total_duration, 3),
                     "API获取耗时_秒": round(api_duration, 3),
                     "配置解析耗时_秒": round(config_duration, 3),
                     "规则处理耗时_秒": round(process_duration, 3),
-                    "文件写入耗时_秒": round(write_duration, 3)
+                    "文件写入耗时_秒": round(write_duration, 3),
+                    "复用解析结果的提供者数量": self._reused_corpus_count,
+                    "下载连接统计_累计": self._download_client.stats()
                 }
             )
             
-            return self.intermediate_dir
+            return aggregated_rules
             
         except Exception as e:
             total_duration = time.time() - start_time
@@ -204,73 +307,291 @@ class RuleGenerationOrchestrator:
             )
             raise
     
-    def _prepare_workspace(self) -> None:
-        """通过清理和创建中间目录来准备工作空间。"""
-        start_time = time.time()
-        
-        # 获取缓存目录配置
+    def _prepare_generation(self) -> None:
+        """
+        根据配置为本次生成准备工作空间。
+
+        只有需要写磁盘时（调试转储或内存预算模式）才创建新的工作空间；
+        内存预算模式下提供者的规则会排序后落盘到工作空间的spill子目录。
+        """
+        memory_budget_mb = self.config.get_generation_memory_budget_mb()
+        self._spill_dir = ""
+        self._memory_budget = 0
+        self._spill_seq = 0
+        self._parse_chunk_size, self._parse_batch_size = RuleConverter.parse_sizes_for_budget(0)
+        self._download_results = {}
+        self._next_corpus_cache = {}
+        self._reused_corpus_count = 0
+        if memory_budget_mb <= 0 and not self.config.get_intermediate_debug_dump():
+            return
+
+        workspace_dir = self._prepare_workspace()
+        if memory_budget_mb > 0:
+            self._memory_budget = memory_budget_mb * 1024 * 1024
+            self._parse_chunk_size, self._parse_batch_size = RuleConverter.parse_sizes_for_budget(self._memory_budget)
+            self._spill_dir = os.path.join(workspace_dir, self.SPILL_DIR_NAME)
+            os.makedirs(self._spill_dir)
+            self.logger.info(
+                "已启用内存预算模式，提供者规则将排序后落盘",
+                extra={
+                    "内存预算_MB": memory_budget_mb,
+                    "spill_dir": self._spill_dir
+                }
+            )
+
+    def _optimize_matchers(self, aggregated_rules: RuleStore) -> None:
+        """
+        按配置把正则和关键字匹配器改写为等价的低成本匹配器。
+
+        在排他解析和域名压缩之前执行，改写出的 full:/domain: 条目同样参与这两个阶段。
+        """
+        if not self.config.get_optimize_domain_matchers():
+            return
+        if self._spill_dir:
+            self.logger.warning("内存预算模式下不支持匹配器优化，已跳过")
+            return
+        MatcherOptimizer().optimize(aggregated_rules)
+
+    def _resolve_exclusive_policies(self, aggregated_rules: RuleStore) -> None:
+        """按配置对聚合结果做先匹配者生效的排他解析。"""
+        if not self.config.get_exclusive_policy_outputs():
+            return
+        if self._spill_dir:
+            self.logger.warning("内存预算模式下不支持排他策略解析，已跳过")
+            return
+        ExclusivePolicyResolver().resolve(aggregated_rules)
+
+    def _compact_domains(self, aggregated_rules: RuleStore) -> None:
+        """按配置去除各策略中被更宽泛的domain条目覆盖的域名规则。"""
+        if not self.config.get_compact_domain_outputs():
+            return
+        if self._spill_dir:
+            self.logger.warning("内存预算模式下不支持域名规则压缩，已跳过")
+            return
+        DomainCompactor().compact(aggregated_rules)
+
+    def _aggregate_ip_rules(self, aggregated_rules: RuleStore) -> None:
+        """
+        按配置合并IP规则。
+
+        跨策略冲突解析的输出本身就是按数值排序的最少CIDR，因此开启时不再单独做合并。
+        两者都需要把所有IP段读入内存，内存预算模式下跳过。
+        """
+        if self._spill_dir and (self.config.get_resolve_ip_conflicts() or self.config.get_collapse_ip_outputs()):
+            self.logger.warning("内存预算模式下不支持IP规则合并和冲突解析，已跳过")
+            return
+        if self.config.get_resolve_ip_conflicts():
+            report_path = self.config.get_ip_conflict_report_path() or os.path.join(
+                self.intermediate_dir, self.IP_CONFLICT_REPORT_NAME
+            )
+            IpConflictResolver(report_path).resolve(aggregated_rules)
+        elif self.config.get_collapse_ip_outputs():
+            CidrCollapser().collapse(aggregated_rules)
+
+    def _get_cache_dir(self) -> str:
+        """获取规则缓存目录，未配置时使用中间目录下的.cache。"""
         cache_dir = self.config.get_cache_dir_path()
         if not cache_dir:
-            # 如果没有配置独立的缓存目录，则使用默认的中间目录下的.cache
-            cache_dir = os.path.join(self.intermediate_dir, ".cache")
-        
-        # 检查缓存目录是否在中间目录内
-        cache_in_intermediate = os.path.commonpath([cache_dir, self.intermediate_dir]) == self.intermediate_dir
-        
-        if os.path.exists(self.intermediate_dir):
-            self.logger.debug(f"清理中间目录: {self.intermediate_dir}")
-            
-            if cache_in_intermediate and os.path.exists(cache_dir):
-                # 缓存目录在中间目录内，需要保存缓存文件
-                self.logger.debug(f"中间目录中包含缓存目录: {cache_dir}")
-                # 保存缓存目录中的内容
-                cache_files = {}
-                try:
-                    if os.path.exists(cache_dir):
-                        for file in os.listdir(cache_dir):
-                            file_path = os.path.join(cache_dir, file)
-                            if os.path.isfile(file_path):
-                                with open(file_path, 'rb') as f:
-                                    cache_files[file] = f.read()
-                        self.logger.debug(f"已保存缓存文件: {list(cache_files.keys())}")
-                except Exception as e:
-                    self.logger.warning(f"保存缓存文件时出错: {e}")
-                
-                # 删除中间目录
-                shutil.rmtree(self.intermediate_dir)
-                
-                # 重新创建中间目录和缓存目录
-                os.makedirs(self.intermediate_dir)
-                os.makedirs(cache_dir, exist_ok=True)
-                
-                # 恢复缓存文件
-                try:
-                    for file, content in cache_files.items():
-                        file_path = os.path.join(cache_dir, file)
-                        with open(file_path, 'wb') as f:
-                            f.write(content)
-                    self.logger.debug(f"已恢复缓存文件: {list(cache_files.keys())}")
-                except Exception as e:
-                    self.logger.warning(f"恢复缓存文件时出错: {e}")
-            else:
-                # 缓存目录在中间目录外或不存在，直接删除中间目录
-                shutil.rmtree(self.intermediate_dir)
-                os.makedirs(self.intermediate_dir)
-            self.logger.debug(f"已清理中间目录: {self.intermediate_dir}")
-        else:
-            os.makedirs(self.intermediate_dir)
-        
+            cache_dir = os.path.join(self.intermediate_dir, self.DEFAULT_CACHE_DIR_NAME)
+        return cache_dir
+
+    def migrate_workspace_layout(self) -> None:
+        """
+        启动时迁移旧版中间目录布局。
+
+        旧版本直接在中间目录下写入 direct/proxy/reject 等策略目录，并在每次生成时
+        删除整个目录（包括其中的缓存）后重建。新布局下每次生成使用独立的版本化子目录，
+        这里清理旧版遗留的策略目录、上次运行留下的工作空间和未删除完的回收目录。
+        默认配置下生成不创建工作空间，之前开启调试转储或内存预算模式时留下的工作空间只能在这里删除。
+        缓存目录中只删除上次退出时遗留的下载临时文件，缓存本身保持不动。
+        """
+        stale_temp_count = RuleDownloader.remove_stale_temp_files(self._get_cache_dir())
+        if stale_temp_count:
+            self.logger.info(f"已删除 {stale_temp_count} 个遗留的下载临时文件")
+        if not os.path.isdir(self.intermediate_dir):
+            os.makedirs(self.intermediate_dir, exist_ok=True)
+            return
+
+        cache_dir = os.path.abspath(self._get_cache_dir())
+        legacy_names = {policy.lower() for policy in self.FIXED_POLICIES}
+        removed = []
+        for name in os.listdir(self.intermediate_dir):
+            path = os.path.abspath(os.path.join(self.intermediate_dir, name))
+            # 缓存目录（或包含缓存目录的目录）永远不删除
+            if os.path.commonpath([cache_dir, path]) == path:
+                continue
+            # 正在使用的工作空间不删除
+            if self.workspace_dir and path == os.path.abspath(self.workspace_dir):
+                continue
+            if name in legacy_names or name.startswith((self.WORKSPACE_DIR_PREFIX, self.TRASH_DIR_PREFIX)):
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed.append(name)
+
+        if removed:
+            self.logger.info(
+                "已迁移旧版中间目录布局",
+                extra={
+                    "intermediate_dir": self.intermediate_dir,
+                    "已删除目录": removed
+                }
+            )
+
+    def _start_revalidation(self, downloader: RuleDownloader, urls: List[str], intervals: Dict[str, float]) -> None:
+        """在后台重新验证已有缓存的远程规则集，上一轮后台验证尚未结束时不重复发起。"""
+        if self._revalidation_task is not None and not self._revalidation_task.done():
+            self.logger.debug("上一轮后台重新验证尚未结束，本次不再发起")
+            return
+        self.logger.info(f"使用现有缓存生成规则，{len(urls)} 个远程规则集将在后台重新验证")
+        self._revalidation_task = asyncio.create_task(self._revalidate(downloader, urls, intervals))
+
+    async def _revalidate(self, downloader: RuleDownloader, urls: List[str], intervals: Dict[str, float]) -> None:
+        """后台重新验证远程规则集，有内容变化时调用回调再生成一次规则。"""
+        start_time = time.time()
+        try:
+            results = await downloader.download_rules(urls, intervals)
+        except Exception as e:
+            self.logger.error(
+                f"后台重新验证远程规则集时出错: {e}",
+                extra={"error": str(e), "error_type": type(e).__name__},
+                exc_info=True
+            )
+            return
+        changed = [url for url, result in results.items() if result not in RuleDownloader.UNCHANGED_RESULTS]
+        self.logger.info(
+            f"后台重新验证完成，{len(changed)} 个远程规则集内容有变化",
+            extra={
+                "已验证数量": len(urls),
+                "耗时_秒": round(time.time() - start_time, 3)
+            }
+        )
+        if not changed:
+            return
+        # 这些URL刚验证过，下一次生成直接使用缓存
+        self._revalidated_urls.update(urls)
+        if self._content_changed_callback is not None:
+            await self._content_changed_callback()
+
+    async def _stop_revalidation(self) -> None:
+        """取消正在进行的后台重新验证并等待它退出，被中断的下载会删除自己的临时文件并保留原有缓存。"""
+        task = self._revalidation_task
+        if task is None or task.done() or task is asyncio.current_task():
+            return
+        self.logger.info("停止正在进行的后台重新验证")
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    async def close(self) -> None:
+        """取消后台重新验证，等待后台的旧工作空间删除任务完成，并关闭自己创建的下载客户端。"""
+        await self._stop_revalidation()
+        if self._cleanup_tasks:
+            await asyncio.gather(*self._cleanup_tasks, return_exceptions=True)
+        if self._owns_download_client:
+            await self._download_client.close()
+
+    @staticmethod
+    def create_download_client(config) -> DownloadClient:
+        """按配置创建规则下载客户端。"""
+        client_config = config.get_download_client_config()
+        return DownloadClient(
+            http2=client_config.get('http2', True),
+            max_connections=client_config.get('max_connections', 16),
+            max_keepalive_connections=client_config.get('max_keepalive_connections', 8),
+            keepalive_expiry=client_config.get('keepalive_expiry', 300.0)
+        )
+
+    @staticmethod
+    def create_download_scheduler(config) -> DownloadScheduler:
+        """按配置创建下载并发调度器。"""
+        client_config = config.get_download_client_config()
+        return DownloadScheduler(
+            max_concurrency=client_config.get('max_concurrency', 8),
+            per_host_concurrency=client_config.get('per_host_concurrency', 4)
+        )
+
+    @staticmethod
+    def create_mirror_selector(config) -> Optional[MirrorSelector]:
+        """按配置创建镜像选择器，没有配置任何镜像时返回None。"""
+        mirrors_config = config.get_download_mirrors_config()
+        prefix_groups = mirrors_config.get('prefixes') or []
+        alternates = mirrors_config.get('urls') or {}
+        if not prefix_groups and not alternates:
+            return None
+        return MirrorSelector(
+            prefix_groups=prefix_groups,
+            alternates=alternates,
+            hedge_percentile=mirrors_config.get('hedge_percentile', 0.9),
+            hedge_min_delay=mirrors_config.get('hedge_min_delay', 0.25),
+            hedge_initial_delay=mirrors_config.get('hedge_initial_delay', 2.0)
+        )
+
+    def _prepare_workspace(self) -> str:
+        """
+        为本次生成创建新的版本化工作空间，并异步删除旧的工作空间。
+
+        缓存目录与各版本工作空间平级，不会被读取、复制或删除。
+
+        Returns:
+            str: 本次生成的工作空间路径
+        """
+        start_time = time.time()
+        os.makedirs(self.intermediate_dir, exist_ok=True)
+
+        workspace_dir = os.path.join(
+            self.intermediate_dir,
+            f"{self.WORKSPACE_DIR_PREFIX}{time.time_ns()}"
+        )
+        os.makedirs(workspace_dir)
+
+        # 旧的工作空间先改名移出（原子且快速），再在后台线程中删除
+        for name in os.listdir(self.intermediate_dir):
+            path = os.path.join(self.intermediate_dir, name)
+            if name.startswith(self.WORKSPACE_DIR_PREFIX) and path != workspace_dir:
+                self._retire_workspace(path)
+
+        self.workspace_dir = workspace_dir
         duration = time.time() - start_time
         self.logger.debug(
-            f"已创建中间目录: {self.intermediate_dir}",
+            f"已创建工作空间: {workspace_dir}",
             extra={
                 "准备耗时_秒": round(duration, 3)
             }
         )
-    
-    def _write_intermediate_files(self, aggregated_rules: Dict[str, Dict[str, Dict[str, Set[str]]]]) -> None:
+        return workspace_dir
+
+    def _retire_workspace(self, path: str) -> None:
+        """
+        将旧的工作空间重命名为回收目录并在后台删除。
+
+        Args:
+            path: 旧工作空间路径
+        """
+        trash_path = os.path.join(
+            self.intermediate_dir,
+            self.TRASH_DIR_PREFIX + os.path.basename(path)
+        )
+        try:
+            os.rename(path, trash_path)
+        except OSError as e:
+            self.logger.warning(
+                "移出旧工作空间失败",
+                extra={
+                    "workspace_dir": path,
+                    "error": str(e)
+                }
+            )
+            return
+
+        task = asyncio.get_running_loop().create_task(
+            asyncio.to_thread(shutil.rmtree, trash_path, True)
+        )
+        self._cleanup_tasks.add(task)
+        task.add_done_callback(self._cleanup_tasks.discard)
+        self.logger.debug(f"已安排后台删除旧工作空间: {trash_path}")
+
+    def _write_intermediate_files(self, aggregated_rules: RuleStore) -> None:
         """
-        将聚合的规则写入中间文件。
+        将聚合的规则按提供者写入中间文件（调试用）。
         
         Args:
             aggregated_rules: 聚合的规则数据
@@ -279,88 +600,30 @@ class RuleGenerationOrchestrator:
         start_time = time.time()
         
         # 为每个策略创建文件
-        for policy, rule_types in aggregated_rules.items():
-            policy_dir = os.path.join(self.intermediate_dir, policy.lower())
+        for policy in aggregated_rules.policies():
+            policy_dir = os.path.join(self.workspace_dir, policy.lower())
             os.makedirs(policy_dir, exist_ok=True)
 
-            # 写入域名规则（按 provider 分文件）
-            if "domain" in rule_types:
-                domain_dir = os.path.join(policy_dir, "domain")
-                os.makedirs(domain_dir, exist_ok=True)
-                for provider_name, provider_rules in rule_types["domain"].items():
-                    if provider_name == "single_rules" or provider_name == "_inline":
+            # 按 provider 分文件写入 domain / ipv4 / ipv6 规则
+            for content_type in ("domain", "ipv4", "ipv6"):
+                content_dir = os.path.join(policy_dir, content_type)
+                for provider_name, column in aggregated_rules.iter_provider_columns(policy, content_type):
+                    os.makedirs(content_dir, exist_ok=True)
+                    if provider_name == RuleStore.INLINE_PROVIDER:
                         # 内联规则统一写到 _inline_rules.list
-                        file_path = os.path.join(domain_dir, "_inline_rules.list")
+                        file_path = os.path.join(content_dir, "_inline_rules.list")
                     else:
-                        file_path = os.path.join(domain_dir, f"provider_{provider_name}.list")
-                    with open(file_path, "w", encoding="utf-8") as f:
-                        for rule in sorted(provider_rules):
-                            f.write(rule + "\n")
+                        # GeoSite等伪提供者的名称中含有":"，替换后再作为文件名
+                        file_path = os.path.join(content_dir, f"provider_{provider_name.replace(':', '_')}.list")
+                    with open(file_path, "wb") as f:
+                        for line in column.iter_lines():
+                            f.write(line + b"\n")
                     self.logger.debug(
-                        f"已写入域名规则文件: {file_path}",
+                        f"已写入中间规则文件: {file_path}",
                         extra={
                             "策略": policy,
                             "provider": provider_name,
-                            "规则数量": len(provider_rules)
-                        }
-                    )
-
-            # 写入IP CIDR规则（保持原有逻辑）
-            if "ipcidr" in rule_types:
-                ipcidr_file_path = os.path.join(policy_dir, "ipcidr.txt")
-                with open(ipcidr_file_path, "w", encoding="utf-8") as f:
-                    all_ipcidr_rules = set()
-                    for provider_rules in rule_types["ipcidr"].values():
-                        all_ipcidr_rules.update(provider_rules)
-                    for rule in sorted(all_ipcidr_rules):
-                        f.write(rule + "\n")
-                self.logger.debug(
-                    f"已写入IP CIDR规则文件: {ipcidr_file_path}",
-                    extra={
-                        "策略": policy,
-                        "规则数量": len(all_ipcidr_rules)
-                    }
-                )
-
-            # 写入IPv4规则（来自RULE-SET和单规则）
-            if "ipv4" in rule_types:
-                ipv4_dir = os.path.join(policy_dir, "ipv4")
-                os.makedirs(ipv4_dir, exist_ok=True)
-                for provider_name, provider_rules in rule_types["ipv4"].items():
-                    if provider_name == "single_rules" or provider_name == "_inline":
-                        file_path = os.path.join(ipv4_dir, "_inline_rules.list")
-                    else:
-                        file_path = os.path.join(ipv4_dir, f"provider_{provider_name}.list")
-                    with open(file_path, "w", encoding="utf-8") as f:
-                        for rule in sorted(provider_rules):
-                            f.write(rule + "\n")
-                    self.logger.debug(
-                        f"已写入IPv4规则文件: {file_path}",
-                        extra={
-                            "策略": policy,
-                            "provider": provider_name,
-                            "规则数量": len(provider_rules)
-                        }
-                    )
-
-            # 写入IPv6规则（来自RULE-SET和单规则）
-            if "ipv6" in rule_types:
-                ipv6_dir = os.path.join(policy_dir, "ipv6")
-                os.makedirs(ipv6_dir, exist_ok=True)
-                for provider_name, provider_rules in rule_types["ipv6"].items():
-                    if provider_name == "single_rules" or provider_name == "_inline":
-                        file_path = os.path.join(ipv6_dir, "_inline_rules.list")
-                    else:
-                        file_path = os.path.join(ipv6_dir, f"provider_{provider_name}.list")
-                    with open(file_path, "w", encoding="utf-8") as f:
-                        for rule in sorted(provider_rules):
-                            f.write(rule + "\n")
-                    self.logger.debug(
-                        f"已写入IPv6规则文件: {file_path}",
-                        extra={
-                            "策略": policy,
-                            "provider": provider_name,
-                            "规则数量": len(provider_rules)
+                            "规则数量": len(column)
                         }
                     )
 
@@ -374,7 +637,7 @@ class RuleGenerationOrchestrator:
     
     async def _process_rules(self, rules_data: Dict[str, Any], providers_info: Dict[str, Any], 
                              proxies_data: Dict[str, Any],
-                             aggregated_rules: Dict[str, Dict[str, Dict[str, Set[str]]]], 
+                             aggregated_rules: RuleStore, 
                              downloader: RuleDownloader) -> None:
         """
         处理所有规则并在内存中聚合它们。
@@ -419,9 +682,114 @@ class RuleGenerationOrchestrator:
                 return url.rsplit(".mrs", 1)[0] + ".yaml" if url.endswith(".mrs") else url
         return url
 
+    def _get_provider_url(self, provider_info: Dict[str, Any]) -> str:
+        """
+        获取提供者实际下载的URL。
+
+        可以直接解码的mrs规则集下载原始的mrs文件（体积最小）；否则转换为文本格式的URL。
+        """
+        url = provider_info.get("url")
+        if self._is_native_mrs(provider_info):
+            return url
+        format_ = self._normalize_format(provider_info.get("format"))
+        behavior = provider_info.get("behavior", "domain")
+        return self._convert_mrs_url(url, format_, behavior)
+
+    @staticmethod
+    def _get_provider_interval(provider_info: Dict[str, Any]) -> float:
+        """获取提供者声明的更新间隔（秒），未声明或无效时返回0。"""
+        try:
+            return max(float(provider_info.get("interval") or 0), 0.0)
+        except (TypeError, ValueError):
+            return 0.0
+
+    @staticmethod
+    def _normalize_format(format_: Any) -> str:
+        """统一规则集格式名称，API返回的 YamlRule/TextRule/MrsRule 与配置文件中的 yaml/text/mrs 等价。"""
+        format_ = str(format_ or "").lower()
+        return format_[:-len("rule")] if format_.endswith("rule") else format_
+
+    @classmethod
+    def _is_native_mrs(cls, provider_info: Dict[str, Any]) -> bool:
+        """提供者是否为可以直接解码的mrs格式。"""
+        format_ = cls._normalize_format(provider_info.get("format"))
+        return format_ == "mrs" and MrsReader.supports(provider_info.get("behavior", "domain"))
+
+    @classmethod
+    def _get_provider_format(cls, provider_info: Dict[str, Any]) -> str:
+        """
+        获取提供者规则文件实际的格式。
+
+        无法直接解码的mrs规则集下载的是转换后的文本（domain/ipcidr）或YAML（classical）文件；
+        未声明格式时返回空字符串，由RuleConverter根据文件内容判断。
+        """
+        format_ = cls._normalize_format(provider_info.get("format"))
+        if format_ == "mrs" and not cls._is_native_mrs(provider_info):
+            behavior = str(provider_info.get("behavior", "domain")).lower()
+            return "yaml" if behavior == "classical" else "text"
+        return format_ if format_ in ("mrs", "yaml", "text") else ""
+
+    def _get_local_provider_path(self, provider_info: Dict[str, Any]) -> str:
+        """
+        获取提供者path字段对应的本地文件路径。
+
+        相对路径按Mihomo配置文件所在目录解析；未配置Mihomo配置文件时只接受绝对路径。
+        """
+        path = provider_info.get("path")
+        if not path or not isinstance(path, str):
+            return ""
+        if not os.path.isabs(path):
+            if not self.mihomo_config_path:
+                return ""
+            config_dir = os.path.dirname(os.path.abspath(self.mihomo_config_path))
+            path = os.path.join(config_dir, path)
+        return os.path.normpath(path)
+
+    def _resolve_provider_source(self, provider_name: str, provider_info: Dict[str, Any],
+                                 downloader: RuleDownloader) -> Tuple[str, str]:
+        """
+        按 内联payload -> 本地path -> URL 的顺序确定提供者的来源。
+
+        本地文件由Mihomo自己负责更新，只有在它存在且不比下载缓存旧时才使用，
+        这样大多数提供者无需联网，且在离线时也能生成规则。
+
+        Returns:
+            tuple: (来源类型, 本地路径或缓存路径)，无可用来源时来源类型为空字符串
+        """
+        # 配置文件中为type字段，API返回的是vehicleType字段
+        vehicle_type = provider_info.get("type") or provider_info.get("vehicleType") or ""
+        if str(vehicle_type).lower() == "inline":
+            if isinstance(provider_info.get("payload"), list):
+                return self.SOURCE_INLINE, ""
+            self.logger.warning(f"内联提供者缺少payload: {provider_name}")
+
+        url = self._get_provider_url(provider_info)
+        cache_path = downloader.get_cache_path_for_url(url) if url else ""
+
+        local_path = self._get_local_provider_path(provider_info)
+        if local_path and os.path.isfile(local_path):
+            if self._normalize_format(provider_info.get("format")) == "mrs" and not self._is_native_mrs(provider_info):
+                self.logger.debug(f"本地文件为mrs格式，但当前环境无法直接解码: {local_path}")
+            elif not cache_path or not os.path.exists(cache_path) or \
+                    os.path.getmtime(local_path) >= os.path.getmtime(cache_path):
+                self.logger.debug(f"使用本地规则文件: {provider_name} -> {local_path}")
+                return self.SOURCE_LOCAL, local_path
+
+        if url:
+            return self.SOURCE_URL, cache_path
+        return "", ""
+
+    def _get_provider_source(self, provider_name: str, provider_info: Dict[str, Any],
+                             downloader: RuleDownloader) -> Tuple[str, str]:
+        """获取阶段1确定的提供者来源，未确定时现场解析。"""
+        source = self._provider_sources.get(provider_name)
+        if source is None:
+            source = self._resolve_provider_source(provider_name, provider_info, downloader)
+        return source
+
     async def _process_rules_workflow(self, rules: list, providers_info: Dict[str, Any], 
                                       proxies_data: Dict[str, Any],
-                                      aggregated_rules: Dict[str, Dict[str, Dict[str, Set[str]]]], 
+                                      aggregated_rules: RuleStore, 
                                       downloader: RuleDownloader) -> None:
         """
         执行规则处理的核心工作流：
@@ -429,29 +797,65 @@ class RuleGenerationOrchestrator:
         2. 并发下载所有规则文件到缓存。
         3. 从缓存中读取文件进行转换和聚合。
         """
-        # --- 阶段 1: 收集所有需要下载的URL ---
+        # --- 阶段 1: 确定每个提供者的来源，只收集需要下载的URL ---
+        # 来源在下载前一次确定，避免下载后缓存变新而改变本地文件的选择
+        self._provider_sources = {}
         urls_to_download = set()
+        # 同一URL被多个提供者引用时按最短的interval判断缓存是否过期
+        url_intervals: Dict[str, float] = {}
+        geoip_codes = set()
+        source_counts = {self.SOURCE_INLINE: 0, self.SOURCE_LOCAL: 0, self.SOURCE_URL: 0}
         for rule in rules:
             if rule.get("type", "").lower() == "ruleset":
                 provider_name = rule.get("payload")
-                if provider_name in providers_info:
-                    provider_info = providers_info[provider_name]
-                    url = provider_info.get("url")
-                    format_ = provider_info.get("format", "")
-                    behavior = provider_info.get("behavior", "domain")
-                    url = self._convert_mrs_url(url, format_, behavior)
-                    if url:
+                if provider_name in providers_info and provider_name not in self._provider_sources:
+                    source_type, source = self._resolve_provider_source(
+                        provider_name, providers_info[provider_name], downloader
+                    )
+                    self._provider_sources[provider_name] = (source_type, source)
+                    if source_type in source_counts:
+                        source_counts[source_type] += 1
+                    if source_type == self.SOURCE_URL:
+                        url = self._get_provider_url(providers_info[provider_name])
                         urls_to_download.add(url)
+                        interval = self._get_provider_interval(providers_info[provider_name])
+                        if interval > 0:
+                            url_intervals[url] = min(interval, url_intervals.get(url, interval))
+            elif rule.get("type", "").lower() == "geoip":
+                geoip_codes.add(str(rule.get("payload", "")).strip().upper())
         
-        self.logger.debug(f"收集到 {len(urls_to_download)} 个需要下载的URL")
+        self.logger.debug(
+            f"收集到 {len(urls_to_download)} 个需要下载的URL",
+            extra={
+                "内联提供者数量": source_counts[self.SOURCE_INLINE],
+                "本地文件提供者数量": source_counts[self.SOURCE_LOCAL],
+                "远程提供者数量": source_counts[self.SOURCE_URL]
+            }
+        )
         for url in urls_to_download:
             self.logger.debug(f"需要下载的URL: {url}")
         
         # --- 阶段 2: 命令下载器并发更新所有缓存 ---
+        # stale-while-revalidate模式下已有缓存的URL直接使用缓存，重新验证放到后台进行
+        revalidated_urls, self._revalidated_urls = self._revalidated_urls, set()
+        background_urls = []
+        if self.config.get_stale_while_revalidate() and not self._force_refresh:
+            urls_to_download -= revalidated_urls
+            background_urls = [url for url in urls_to_download if downloader.has_usable_cache(url)]
+            urls_to_download.difference_update(background_urls)
         if urls_to_download:
-            await downloader.download_rules(list(urls_to_download))
+            # 后台重新验证可能正在写入同一批缓存，前台下载前先停止它（需要时下面会重新发起）
+            await self._stop_revalidation()
+            self._download_results = await downloader.download_rules(
+                list(urls_to_download), url_intervals, self._force_refresh
+            )
         else:
-            self.logger.debug("没有需要下载的规则集URL")
+            self.logger.debug("没有需要等待下载的规则集URL")
+        if background_urls:
+            self._start_revalidation(downloader, background_urls, url_intervals)
+        
+        # 所有被引用的GeoIP编码一次性提取（已缓存的编码直接跳过）
+        self._prepare_geoip(geoip_codes)
         
         # --- 阶段 3: 处理和转换 (现在从本地缓存读取) ---
         processed_count = 0
@@ -466,6 +870,16 @@ class RuleGenerationOrchestrator:
                 await self._process_rule_set_rule(rule, providers_info, proxies_data, aggregated_rules, downloader)
                 rule_set_count += 1
                 processed_count += 1
+            elif rule_type.lower() == "geosite":
+                # GEOSITE规则从本地geosite.dat展开为域名规则集合
+                self._process_geosite_rule(rule, proxies_data, aggregated_rules)
+                rule_set_count += 1
+                processed_count += 1
+            elif rule_type.lower() == "geoip":
+                # GEOIP规则从本地GeoIP数据库展开为CIDR集合
+                self._process_geoip_rule(rule, proxies_data, aggregated_rules)
+                rule_set_count += 1
+                processed_count += 1
             else:
                 # 处理单个规则
                 self._process_single_rule(rule, proxies_data, aggregated_rules)
@@ -484,7 +898,7 @@ class RuleGenerationOrchestrator:
     
     async def _process_rule_set_rule(self, rule: Dict[str, Any], providers_info: Dict[str, Any], 
                                      proxies_data: Dict[str, Any],
-                                     aggregated_rules: Dict[str, Dict[str, Dict[str, Set[str]]]], 
+                                     aggregated_rules: RuleStore, 
                                      downloader: RuleDownloader) -> None:
         """
         处理RULE-SET类型规则。
@@ -536,82 +950,265 @@ class RuleGenerationOrchestrator:
                 )
                 return
                 
-            provider_info = providers_info[provider_name]
+            # 每个提供者每次生成只解析一次，后续引用直接共享已解析的规则集合
+            corpus = aggregated_rules.get_corpus(provider_name)
+            if corpus is None:
+                provider_info = providers_info[provider_name]
+                behavior = provider_info.get("behavior", "domain")
+                source_type, source = self._get_provider_source(provider_name, provider_info, downloader)
+                
+                if source_type == self.SOURCE_INLINE:
+                    rule_batches = RuleConverter.batch_classified(
+                        RuleConverter.iter_classified_from_payload(provider_info.get("payload") or [], behavior),
+                        self._parse_batch_size
+                    )
+                elif source_type in (self.SOURCE_LOCAL, self.SOURCE_URL):
+                    # 本地路径或下载缓存路径
+                    self.logger.debug(f"规则集文件路径: {source}")
+                    if not os.path.exists(source):
+                        self.logger.warning(f"缓存文件不存在: {source}")
+                        return
+                    rule_batches = RuleConverter.iter_classified_batches(
+                        source, behavior, self._get_provider_format(provider_info),
+                        self._parse_chunk_size, self._parse_batch_size
+                    )
+                else:
+                    self.logger.warning(f"无法获取有效的URL: {provider_name}")
+                    return
+                
+                # 转换器惰性读取文件，复用上次的解析结果时不会打开文件
+                signature = self._get_corpus_signature(provider_info, source_type, source)
+                cached = self._corpus_cache.get(provider_name)
+                if signature is not None and cached is not None and cached[0] == signature and \
+                        self._is_source_unchanged(provider_info, source_type):
+                    corpus = cached[1]
+                    self._reused_corpus_count += 1
+                    self.logger.debug(f"规则集内容未变化，复用上次的解析结果: {provider_name}")
+                else:
+                    try:
+                        corpus = self._parse_provider_corpus(provider_name, rule_batches)
+                    except Exception as e:
+                        # 解析到一半失败时已得到的规则不完整，整个提供者本次不参与生成，也不缓存解析结果
+                        self.logger.error(
+                            f"解析规则集失败，本次生成跳过该提供者: {provider_name}, 错误: {e}",
+                            extra={
+                                "provider_name": provider_name,
+                                "source": source,
+                                "error": str(e),
+                                "error_type": type(e).__name__
+                            }
+                        )
+                        return
+                if signature is not None:
+                    self._next_corpus_cache[provider_name] = (signature, corpus)
+                aggregated_rules.add_corpus(corpus)
+            else:
+                self.logger.debug(f"复用已解析的规则集: {provider_name}")
             
-            # 从下载器获取缓存路径
-            url = provider_info.get("url")
-            format_ = provider_info.get("format", "")
-            behavior = provider_info.get("behavior", "domain")
-            url = self._convert_mrs_url(url, format_, behavior)
-            if not url:
-                self.logger.warning(f"无法获取有效的URL: {provider_name}")
+            # 策略只引用共享的规则集合，不复制规则
+            aggregated_rules.attach(resolved_policy, provider_name)
+            domain_count, ipv4_count, ipv6_count = (
+                corpus.count(content_type) for content_type in ("domain", "ipv4", "ipv6")
+            )
+            
+            self.logger.debug(
+                f"已处理RULE-SET规则: {provider_name} -> {domain_count} 个域名规则, {ipv4_count} 个IPv4规则, {ipv6_count} 个IPv6规则，策略为 {resolved_policy}",
+                extra={
+                    "provider_name": provider_name,
+                    "domain_rules_count": domain_count,
+                    "ipv4_rules_count": ipv4_count,
+                    "ipv6_rules_count": ipv6_count,
+                    "resolved_policy": resolved_policy
+                }
+            )
+        except Exception as e:
+            self.logger.error(
+                f"处理RULE-SET规则时出错: {e}",
+                extra={
+                    "error": str(e),
+                    "error_type": type(e).__name__,
+                    "rule": rule
+                },
+                exc_info=True
+            )
+    
+    def _find_geodata_path(self, configured_path: str, file_names: Tuple[str, ...]) -> str:
+        """获取地理数据库路径，未配置时按顺序在Mihomo配置文件所在目录查找。"""
+        if configured_path:
+            return configured_path
+        if not self.mihomo_config_path:
+            return ""
+        config_dir = os.path.dirname(os.path.abspath(self.mihomo_config_path))
+        for file_name in file_names:
+            candidate = os.path.join(config_dir, file_name)
+            if os.path.isfile(candidate):
+                return candidate
+        return ""
+
+    def _get_geosite_path(self) -> str:
+        """获取geosite.dat路径。"""
+        return self._find_geodata_path(self.config.get_geosite_path(), self.GEOSITE_FILE_NAMES)
+
+    def _get_geoip_path(self) -> str:
+        """获取Country.mmdb或geoip.dat路径。"""
+        return self._find_geodata_path(self.config.get_geoip_path(), self.GEOIP_FILE_NAMES)
+
+    def _prepare_geoip(self, codes: Set[str]) -> None:
+        """一次性提取本次生成引用的所有GeoIP编码，数据库不可用时在处理规则时再报告。"""
+        codes = {code for code in codes if code and not code.startswith("!")}
+        geoip_path = self._get_geoip_path()
+        if not codes or not geoip_path or not os.path.isfile(geoip_path):
+            return
+        try:
+            self._geoip_reader.prepare(geoip_path, codes)
+        except Exception as e:
+            self.logger.error(
+                f"提取GeoIP数据失败: {e}",
+                extra={
+                    "geoip_path": geoip_path,
+                    "error_type": type(e).__name__
+                },
+                exc_info=True
+            )
+
+    def _process_geoip_rule(self, rule: Dict[str, Any], proxies_data: Dict[str, Any],
+                            aggregated_rules: RuleStore) -> None:
+        """
+        处理GEOIP规则：把引用的国家/标签编码展开为共享的CIDR集合。
+        
+        Args:
+            rule: 要处理的GEOIP规则
+            proxies_data: 来自Mihomo API的代理数据
+            aggregated_rules: 用于固定策略的规则内存聚合器
+        """
+        try:
+            policy = rule.get("proxy") or rule.get("provider", "")
+            code = str(rule.get("payload", "")).strip().upper()
+            if not policy or not code:
+                self.logger.warning(f"跳过缺少策略或编码的GEOIP规则: {rule}")
+                return
+            if code.startswith("!"):
+                self.logger.warning(f"不支持取反的GEOIP编码，已跳过: {code}")
                 return
 
-            # 从下载器获取缓存路径
-            local_path = downloader.get_cache_path_for_url(url)
-            self.logger.debug(f"缓存文件路径: {local_path}")
-            
-            # 检查缓存文件是否存在
-            if not os.path.exists(local_path):
-                self.logger.warning(f"缓存文件不存在: {local_path}")
+            resolved_policy = self.policy_resolver.resolve(policy, proxies_data)
+            if resolved_policy not in self.FIXED_POLICIES:
+                self.logger.debug(
+                    f"跳过具有非固定策略的GEOIP规则: {resolved_policy}",
+                    extra={
+                        "original_policy": policy,
+                        "resolved_policy": resolved_policy
+                    }
+                )
                 return
-            
-            # 将路径和行为交给转换器
-            content_list = RuleConverter.parse_ruleset_from_file(
-                local_path, 
-                behavior
-            )
+
+            corpus_name = self.GEOIP_CORPUS_PREFIX + code.lower()
+            corpus = aggregated_rules.get_corpus(corpus_name)
+            if corpus is None:
+                geoip_path = self._get_geoip_path()
+                if code != GeoIpReader.LAN_CODE and (not geoip_path or not os.path.isfile(geoip_path)):
+                    self.logger.warning(
+                        f"未找到GeoIP数据库，无法展开GEOIP规则: {code}",
+                        extra={"geoip_path": geoip_path}
+                    )
+                    return
+                corpus = self._parse_provider_corpus(
+                    corpus_name,
+                    RuleConverter.batch_classified(RuleConverter.iter_classified_from_payload(
+                        self._geoip_reader.iter_cidrs(geoip_path, code), "ipcidr"
+                    ), self._parse_batch_size)
+                )
+                aggregated_rules.add_corpus(corpus)
+            else:
+                self.logger.debug(f"复用已展开的GeoIP编码: {corpus_name}")
+
+            aggregated_rules.attach(resolved_policy, corpus_name)
             self.logger.debug(
-                f"规则集 {provider_name} 包含 {len(content_list)} 条规则"
+                f"已处理GEOIP规则: {code} -> {corpus.count('ipv4')} 个IPv4规则, {corpus.count('ipv6')} 个IPv6规则，策略为 {resolved_policy}",
+                extra={
+                    "code": code,
+                    "ipv4_rules_count": corpus.count("ipv4"),
+                    "ipv6_rules_count": corpus.count("ipv6"),
+                    "resolved_policy": resolved_policy
+                }
             )
-            
-            # 分离域名规则和IP规则
-            domain_rules = set()
-            ipv4_rules = set()
-            ipv6_rules = set()
-            
-            for rule_item in content_list:
-                # 检查是否为IP CIDR规则（包含"/"）
-                if "/" in rule_item:
-                    # 检查是否为IPv6规则（包含":"但不包含"."）
-                    if ":" in rule_item and "." not in rule_item:
-                        ipv6_rules.add(rule_item)
-                    # 检查是否为IPv4规则（包含"."）
-                    elif "." in rule_item:
-                        ipv4_rules.add(rule_item)
-                    # 其他包含"/"的规则暂时归类为IPv4
-                    else:
-                        ipv4_rules.add(rule_item)
-                # 检查是否为MosDNS格式的域名规则
-                elif rule_item.startswith(("domain:", "full:", "keyword:", "regexp:")):
-                    domain_rules.add(rule_item)
-                # 其他类型规则（如纯域名或通配符）也归类为域名规则
-                else:
-                    domain_rules.add(rule_item)
-            
-            # 如果有任何域名规则，则添加到domain聚合器
-            if domain_rules:
-                aggregated_rules.setdefault(resolved_policy, {}).setdefault("domain", {}).setdefault(provider_name, set()).update(domain_rules)
-            # 如果有任何IPv4规则，则添加到IPv4聚合器
-            if ipv4_rules:
-                aggregated_rules.setdefault(resolved_policy, {}).setdefault("ipv4", {}).setdefault(provider_name, set()).update(ipv4_rules)
-            # 如果有任何IPv6规则，则添加到IPv6聚合器
-            if ipv6_rules:
-                aggregated_rules.setdefault(resolved_policy, {}).setdefault("ipv6", {}).setdefault(provider_name, set()).update(ipv6_rules)
-            
+        except Exception as e:
+            self.logger.error(
+                f"处理GEOIP规则时出错: {e}",
+                extra={
+                    "error": str(e),
+                    "error_type": type(e).__name__,
+                    "rule": rule
+                },
+                exc_info=True
+            )
+
+    def _process_geosite_rule(self, rule: Dict[str, Any], proxies_data: Dict[str, Any],
+                              aggregated_rules: RuleStore) -> None:
+        """
+        处理GEOSITE规则：把引用的分类展开为共享的域名规则集合。
+
+        同一分类（含属性过滤）每次生成只解码一次，多个策略引用时共享同一个集合。
+        
+        Args:
+            rule: 要处理的GEOSITE规则
+            proxies_data: 来自Mihomo API的代理数据
+            aggregated_rules: 用于固定策略的规则内存聚合器
+        """
+        try:
+            policy = rule.get("proxy") or rule.get("provider", "")
+            category = str(rule.get("payload", "")).strip()
+            if not policy or not category:
+                self.logger.warning(f"跳过缺少策略或分类的GEOSITE规则: {rule}")
+                return
+            if category.startswith("!"):
+                # 取反的分类匹配除该分类以外的所有域名，无法展开为域名列表
+                self.logger.warning(f"不支持取反的GEOSITE分类，已跳过: {category}")
+                return
+
+            resolved_policy = self.policy_resolver.resolve(policy, proxies_data)
+            if resolved_policy not in self.FIXED_POLICIES:
+                self.logger.debug(
+                    f"跳过具有非固定策略的GEOSITE规则: {resolved_policy}",
+                    extra={
+                        "original_policy": policy,
+                        "resolved_policy": resolved_policy
+                    }
+                )
+                return
+
+            code, attrs = GeoSiteReader.parse_category(category)
+            corpus_name = self.GEOSITE_CORPUS_PREFIX + "@".join([code.lower()] + attrs)
+            corpus = aggregated_rules.get_corpus(corpus_name)
+            if corpus is None:
+                geosite_path = self._get_geosite_path()
+                if not geosite_path or not os.path.isfile(geosite_path):
+                    self.logger.warning(
+                        f"未找到geosite.dat，无法展开GEOSITE规则: {category}",
+                        extra={"geosite_path": geosite_path}
+                    )
+                    return
+                corpus = self._parse_provider_corpus(
+                    corpus_name, RuleConverter.batch_classified(
+                        self._geosite_reader.iter_rules(geosite_path, category), self._parse_batch_size
+                    )
+                )
+                aggregated_rules.add_corpus(corpus)
+            else:
+                self.logger.debug(f"复用已展开的GeoSite分类: {corpus_name}")
+
+            aggregated_rules.attach(resolved_policy, corpus_name)
             self.logger.debug(
-                f"已处理RULE-SET规则: {provider_name} -> {len(domain_rules)} 个域名规则, {len(ipv4_rules)} 个IPv4规则, {len(ipv6_rules)} 个IPv6规则，策略为 {resolved_policy}",
+                f"已处理GEOSITE规则: {category} -> {corpus.count('domain')} 个域名规则，策略为 {resolved_policy}",
                 extra={
-                    "provider_name": provider_name,
-                    "domain_rules_count": len(domain_rules),
-                    "ipv4_rules_count": len(ipv4_rules),
-                    "ipv6_rules_count": len(ipv6_rules),
+                    "category": category,
+                    "domain_rules_count": corpus.count("domain"),
                     "resolved_policy": resolved_policy
                 }
             )
         except Exception as e:
             self.logger.error(
-                f"处理RULE-SET规则时出错: {e}",
+                f"处理GEOSITE规则时出错: {e}",
                 extra={
                     "error": str(e),
                     "error_type": type(e).__name__,
@@ -619,9 +1216,112 @@ class RuleGenerationOrchestrator:
                 },
                 exc_info=True
             )
+
+    def _get_corpus_signature(self, provider_info: Dict[str, Any], source_type: str, source: str) -> Optional[Tuple]:
+        """
+        获取提供者来源文件的签名，签名相同说明解析结果可以跨生成复用。
+
+        下载器只在内容变化时原子地替换缓存文件，因此文件的inode、修改时间和大小不变即内容不变。
+        内联提供者解析开销很小，内存预算模式下的解析结果位于每次生成都会清理的工作空间，都不复用。
+
+        Returns:
+            tuple: 来源签名，不可复用时返回None
+        """
+        if self._spill_dir or source_type not in (self.SOURCE_LOCAL, self.SOURCE_URL):
+            return None
+        try:
+            stat = os.stat(source)
+        except OSError:
+            return None
+        return (
+            source_type, source, str(provider_info.get("behavior", "domain")).lower(),
+            self._get_provider_format(provider_info), stat.st_ino, stat.st_mtime_ns, stat.st_size
+        )
+
+    def _is_source_unchanged(self, provider_info: Dict[str, Any], source_type: str) -> bool:
+        """判断远程规则集在本次下载中内容是否未变；本地文件只依赖来源签名。"""
+        if source_type != self.SOURCE_URL:
+            return True
+        result = self._download_results.get(self._get_provider_url(provider_info))
+        return result is None or result in RuleDownloader.UNCHANGED_RESULTS
+
+    def _parse_provider_corpus(self, provider_name: str, rule_batches: Iterable[ClassifiedBatch]) -> ProviderCorpus:
+        """
+        解析提供者的规则，生成冻结的共享规则集合。
+        
+        Args:
+            provider_name: 提供者名称
+            rule_batches: 转换器产出的分批规则 (匹配器类型代码, 内容类型, 规则值列表)
+            
+        Returns:
+            ProviderCorpus: 解析后的规则集合
+        """
+        if self._spill_dir:
+            return self._spill_provider_corpus(provider_name, rule_batches)
+
+        # 边解析边按内容类型和匹配器类型分组，分类已在转换器中一次完成，每批整体并入集合
+        groups_by_type: Dict[str, Dict[int, Set[bytes]]] = {"domain": {}, "ipv4": {}, "ipv6": {}}
+        content_count = 0
+        for kind, content_type, values in rule_batches:
+            content_count += len(values)
+            groups_by_type[content_type].setdefault(kind, set()).update(values)
+        self.logger.debug(
+            f"规则集 {provider_name} 包含 {content_count} 条规则"
+        )
+        return ProviderCorpus(provider_name, groups_by_type)
     
+    def _spill_provider_corpus(self, provider_name: str, rule_batches: Iterable[ClassifiedBatch]) -> ProviderCorpus:
+        """
+        内存预算模式下解析提供者：规则经外部排序去重后写入磁盘，只在内存中保留文件路径。
+
+        每条规则以内容类型序号作为前缀参与排序，排序结果按内容类型依次写入各自的文件，
+        文件中的顺序与内存模式下PackedRuleColumn的遍历顺序完全一致。
+        排序缓冲使用预算的3/4，其余留给解析时的分块和分批（见RuleConverter.parse_sizes_for_budget）。
+        """
+        self._spill_seq += 1
+        name = f"corpus{self._spill_seq}"
+        sorter = ExternalSorter(self._spill_dir, self._memory_budget * 3 // 4, name)
+        content_count = 0
+        tags = self.CONTENT_TYPE_TAGS
+        for kind, content_type, values in rule_batches:
+            content_count += len(values)
+            prefix = tags[content_type] + KIND_PREFIXES[kind]
+            for value in values:
+                if kind or value:
+                    sorter.add(prefix + value)
+        run_count = sorter.run_count
+
+        columns = {}
+        files = {}
+        counts = {}
+        try:
+            for line in sorter.iter_sorted():
+                content_type = self.CONTENT_TYPES[line[0] - 48]
+                f = files.get(content_type)
+                if f is None:
+                    path = os.path.join(self._spill_dir, f"{name}.{content_type}.list")
+                    f = files[content_type] = open(path, "wb", buffering=sorter.buffer_size)
+                    counts[content_type] = 0
+                f.write(line[1:])
+                f.write(b"\n")
+                counts[content_type] += 1
+        finally:
+            for f in files.values():
+                f.close()
+        for content_type, f in files.items():
+            columns[content_type] = SpilledRuleColumn(f.name, counts[content_type], sorter.buffer_size)
+
+        self.logger.debug(
+            f"规则集 {provider_name} 包含 {content_count} 条规则，已排序落盘",
+            extra={
+                "provider_name": provider_name,
+                "排序段数量": run_count
+            }
+        )
+        return ProviderCorpus.from_columns(provider_name, columns)
+
     def _process_single_rule(self, rule: Dict[str, Any], proxies_data: Dict[str, Any],
-                             aggregated_rules: Dict[str, Dict[str, Dict[str, Set[str]]]]) -> None:
+                             aggregated_rules: RuleStore) -> None:
         """
         处理单个规则（非RULE-SET）。
         
@@ -657,23 +1357,10 @@ class RuleGenerationOrchestrator:
                 )
                 return
             
-            # 使用RuleConverter转换规则，这会处理我们支持的规则类型
+            # 使用RuleConverter转换规则，分派表已给出内容类型 (domain, ipv4, ipv6)
             mosdns_rule, content_type = RuleConverter.convert_single_rule(rule)
-            
-            # 如果转换成功，则处理转换后的规则
             if mosdns_rule and content_type:
-                # 根据内容类型确定要使用的聚合器
-                if content_type == "domain":
-                    aggregated_rules.setdefault(resolved_policy, {}).setdefault("domain", {}).setdefault("single_rules", set()).add(mosdns_rule)
-                elif content_type == "ipcidr":
-                    # 对于IP CIDR规则，需要进一步区分IPv4和IPv6
-                    if ":" in mosdns_rule and "." not in mosdns_rule:  # IPv6规则
-                        aggregated_rules.setdefault(resolved_policy, {}).setdefault("ipv6", {}).setdefault("single_rules", set()).add(mosdns_rule)
-                    else:  # IPv4规则
-                        aggregated_rules.setdefault(resolved_policy, {}).setdefault("ipv4", {}).setdefault("single_rules", set()).add(mosdns_rule)
-                elif content_type in ["ipv4", "ipv6"]:
-                    # 如果RuleConverter已经明确指定了IPv4或IPv6
-                    aggregated_rules.setdefault(resolved_policy, {}).setdefault(content_type, {}).setdefault("single_rules", set()).add(mosdns_rule)
+                aggregated_rules.add_rule(resolved_policy, content_type, mosdns_rule)
             
             self.logger.debug(
                 f"已处理单个规则: 类型={rule.get('type', '')}, 策略={resolved_policy}",
@@ -1,11 +1,18 @@
 import logging
 import os
 import shutil
-from typing import Set
+from itertools import islice
+from typing import Iterable, Set
+from mihomo_sync.modules.rule_store import RuleStore
 
 
 class RuleMerger:
-    """将中间文件合并为最终Mosdns规则文件的合并器。"""
+    """将聚合规则（或中间文件）合并为最终Mosdns规则文件的合并器。"""
+    
+    # 按写入顺序排列的内容类型
+    CONTENT_TYPES = ("domain", "ipv4", "ipv6")
+    # 流式写入时每批拼接的行数
+    WRITE_BATCH_SIZE = 4096
     
     def __init__(self):
         """初始化RuleMerger。"""
@@ -67,6 +74,122 @@ class RuleMerger:
         os.makedirs(final_output_path)
         self.logger.debug(f"已清理并创建最终输出目录: {final_output_path}")
     
+    def merge_from_store(self, store: RuleStore, final_output_path: str) -> None:
+        """
+        将协调器在内存中聚合的规则直接写入最终的Mosdns规则文件。
+
+        与merge_from_intermediate的输出完全一致，但省去了中间文件的序列化、
+        回读和重复排序；每个文件由各提供者的已排序列流式归并得到。
+
+        Args:
+            store: 协调器返回的RuleStore
+            final_output_path (str): 最终输出目录路径
+        """
+        try:
+            self._prepare_workspace(final_output_path)
+
+            for policy in store.policies():
+                for content_type in self.CONTENT_TYPES:
+                    self._write_lines(policy.lower(), content_type,
+                                      store.iter_lines(policy, content_type), final_output_path)
+
+            self.logger.info(
+                "规则已成功合并",
+                extra={
+                    "final_output_path": final_output_path,
+                    "文件数量": len(os.listdir(final_output_path))
+                }
+            )
+        except Exception as e:
+            self.logger.error(
+                "合并规则失败",
+                extra={
+                    "final_output_path": final_output_path,
+                    "error": str(e)
+                }
+            )
+            raise
+
+    def _write_lines(self, policy: str, content_type: str, lines: Iterable[bytes], final_output_path: str) -> int:
+        """
+        将已排序去重的规则行流式写入最终规则文件，行之间以换行分隔，空输入不生成文件。
+
+        Args:
+            policy (str): 小写的策略名称
+            content_type (str): 内容类型 (domain, ipv4, ipv6)
+            lines: 已排序去重的规则行（bytes）
+            final_output_path (str): 最终输出目录路径
+
+        Returns:
+            int: 写入的规则数量
+        """
+        iterator = iter(lines)
+        batch = list(islice(iterator, self.WRITE_BATCH_SIZE))
+        if not batch:
+            return 0
+        output_filepath = os.path.join(final_output_path, f"{policy}_{content_type}.txt")
+        count = 0
+        with open(output_filepath, "wb") as f:
+            while batch:
+                if count:
+                    f.write(b"\n")
+                f.write(b"\n".join(batch))
+                count += len(batch)
+                batch = list(islice(iterator, self.WRITE_BATCH_SIZE))
+        self.logger.debug(
+            "写入最终规则文件",
+            extra={
+                "policy": policy,
+                "content_type": content_type,
+                "rules_count": count,
+                "output_file": output_filepath
+            }
+        )
+        return count
+
+    def _write_rule_file(self, policy: str, content_type: str, rules: Set[str], final_output_path: str) -> None:
+        """
+        将一组规则排序后写入最终规则文件，空集合不生成文件。
+
+        Args:
+            policy (str): 小写的策略名称
+            content_type (str): 内容类型 (domain, ipv4, ipv6)
+            rules (set): 去重后的规则集合
+            final_output_path (str): 最终输出目录路径
+        """
+        self._write_lines(policy, content_type, (rule.encode("utf-8") for rule in sorted(rules)),
+                          final_output_path)
+
+    def _read_rule_dir(self, rule_dir: str) -> Set[str]:
+        """
+        读取中间目录中某一内容类型下所有 .list 文件的规则。
+
+        Args:
+            rule_dir (str): 中间目录中的内容类型目录
+
+        Returns:
+            set: 去重后的规则集合
+        """
+        rules = set()
+        if not os.path.isdir(rule_dir):
+            return rules
+        for fname in os.listdir(rule_dir):
+            if not fname.endswith(".list"):
+                continue
+            fpath = os.path.join(rule_dir, fname)
+            try:
+                with open(fpath, "r", encoding="utf-8") as f:
+                    for line in f:
+                        rule = line.strip()
+                        if rule:
+                            rules.add(rule)
+            except Exception as e:
+                self.logger.warning(
+                    "读取规则文件失败",
+                    extra={"rule_file": fpath, "error": str(e)}
+                )
+        return rules
+
     def _process_intermediate_directory(self, intermediate_path: str, final_output_path: str) -> None:
         """
         处理中间目录并合并规则。
@@ -75,99 +198,10 @@ class RuleMerger:
             policy_dir = os.path.join(intermediate_path, policy)
             if not os.path.isdir(policy_dir):
                 continue
-            # 合并 domain 规则
-            domain_dir = os.path.join(policy_dir, "domain")
-            domain_rules = set()
-            if os.path.isdir(domain_dir):
-                for fname in os.listdir(domain_dir):
-                    if fname.endswith(".list"):
-                        fpath = os.path.join(domain_dir, fname)
-                        try:
-                            with open(fpath, "r", encoding="utf-8") as f:
-                                for line in f:
-                                    rule = line.strip()
-                                    if rule:
-                                        domain_rules.add(rule)
-                        except Exception as e:
-                            self.logger.warning(
-                                "读取域名规则文件失败",
-                                extra={"rule_file": fpath, "error": str(e)}
-                            )
-            if domain_rules:
-                output_filename = f"{policy}_domain.txt"
-                output_filepath = os.path.join(final_output_path, output_filename)
-                with open(output_filepath, "w", encoding="utf-8") as f:
-                    f.write("\n".join(sorted(domain_rules)))
-                self.logger.debug(
-                    "合并域名规则文件",
-                    extra={
-                        "policy": policy,
-                        "rules_count": len(domain_rules),
-                        "output_file": output_filepath
-                    }
-                )
-            # 合并 ipv4 规则
-            ipv4_dir = os.path.join(policy_dir, "ipv4")
-            ipv4_rules = set()
-            if os.path.isdir(ipv4_dir):
-                for fname in os.listdir(ipv4_dir):
-                    if fname.endswith(".list"):
-                        fpath = os.path.join(ipv4_dir, fname)
-                        try:
-                            with open(fpath, "r", encoding="utf-8") as f:
-                                for line in f:
-                                    rule = line.strip()
-                                    if rule:
-                                        ipv4_rules.add(rule)
-                        except Exception as e:
-                            self.logger.warning(
-                                "读取IPv4规则文件失败",
-                                extra={"rule_file": fpath, "error": str(e)}
-                            )
-            if ipv4_rules:
-                output_filename = f"{policy}_ipv4.txt"
-                output_filepath = os.path.join(final_output_path, output_filename)
-                with open(output_filepath, "w", encoding="utf-8") as f:
-                    f.write("\n".join(sorted(ipv4_rules)))
-                self.logger.debug(
-                    "合并IPv4规则文件",
-                    extra={
-                        "policy": policy,
-                        "rules_count": len(ipv4_rules),
-                        "output_file": output_filepath
-                    }
-                )
-            # 合并 ipv6 规则
-            ipv6_dir = os.path.join(policy_dir, "ipv6")
-            ipv6_rules = set()
-            if os.path.isdir(ipv6_dir):
-                for fname in os.listdir(ipv6_dir):
-                    if fname.endswith(".list"):
-                        fpath = os.path.join(ipv6_dir, fname)
-                        try:
-                            with open(fpath, "r", encoding="utf-8") as f:
-                                for line in f:
-                                    rule = line.strip()
-                                    if rule:
-                                        ipv6_rules.add(rule)
-                        except Exception as e:
-                            self.logger.warning(
-                                "读取IPv6规则文件失败",
-                                extra={"rule_file": fpath, "error": str(e)}
-                            )
-            if ipv6_rules:
-                output_filename = f"{policy}_ipv6.txt"
-                output_filepath = os.path.join(final_output_path, output_filename)
-                with open(output_filepath, "w", encoding="utf-8") as f:
-                    f.write("\n".join(sorted(ipv6_rules)))
-                self.logger.debug(
-                    "合并IPv6规则文件",
-                    extra={
-                        "policy": policy,
-                        "rules_count": len(ipv6_rules),
-                        "output_file": output_filepath
-                    }
-                )
+            # 合并 domain / ipv4 / ipv6 规则
+            for content_type in self.CONTENT_TYPES:
+                rules = self._read_rule_dir(os.path.join(policy_dir, content_type))
+                self._write_rule_file(policy, content_type, rules, final_output_path)
             # 合并 ipcidr 文件（保持原有逻辑）
             ipcidr_path = os.path.join(policy_dir, f"{policy}_ipcidr.txt")
             if os.path.isfile(ipcidr_path):
@@ -0,0 +1,514 @@
+import heapq
+import logging
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+
+# 匹配器类型代码。顺序与Mosdns前缀的字典序一致，保证按(类型, 值)排序等价于按完整规则文本排序。
+KIND_RAW = 0        # 无前缀（IP CIDR等）
+KIND_DOMAIN = 1     # domain:
+KIND_FULL = 2       # full:
+KIND_KEYWORD = 3    # keyword:
+KIND_REGEXP = 4     # regexp:
+
+KIND_PREFIXES = (b"", b"domain:", b"full:", b"keyword:", b"regexp:")
+_PREFIX_KINDS = {"domain": KIND_DOMAIN, "full": KIND_FULL, "keyword": KIND_KEYWORD, "regexp": KIND_REGEXP}
+
+
+def split_rule(rule: str) -> Tuple[int, str]:
+    """
+    将Mosdns格式的规则拆分为匹配器类型代码和去掉前缀的值。
+
+    Args:
+        rule (str): 例如 "domain:example.com" 或 "1.0.0.0/24"
+
+    Returns:
+        tuple: (类型代码, 值)
+    """
+    prefix, sep, value = rule.partition(":")
+    kind = _PREFIX_KINDS.get(prefix) if sep else None
+    if kind is None:
+        return KIND_RAW, rule
+    return kind, value
+
+
+def split_line(line: bytes) -> Tuple[int, bytes]:
+    """
+    split_rule的bytes版本，用于处理已打包的规则行。
+
+    Args:
+        line (bytes): 例如 b"domain:example.com"
+
+    Returns:
+        tuple: (类型代码, 值)
+    """
+    prefix, sep, value = line.partition(b":")
+    kind = _PREFIX_KINDS.get(prefix.decode("ascii", "replace")) if sep else None
+    if kind is None:
+        return KIND_RAW, line
+    return kind, value
+
+
+def _encode_values(values: Iterable[Union[str, bytes]]) -> Set[bytes]:
+    """将值去重并统一为UTF-8 bytes；解析路径产出的bytes原样保留，不做额外的编解码。"""
+    return {value if value.__class__ is bytes else value.encode("utf-8") for value in values}
+
+
+def _iter_split(blob: bytes, count: int, chunk_size: int = 65536) -> Iterator[bytes]:
+    """
+    分块切分以换行分隔的blob，避免一次性生成整个列表。
+
+    只含一个空值（例如匹配所有域名的 "keyword:"）的blob也是空串，需要用条目数与空blob区分。
+    """
+    if not blob:
+        if count:
+            yield b""
+        return
+    start = 0
+    length = len(blob)
+    while start < length:
+        end = blob.find(b"\n", min(start + chunk_size, length))
+        if end == -1:
+            end = length
+        yield from blob[start:end].split(b"\n")
+        start = end + 1
+
+
+class PackedRuleColumn:
+    """
+    一组去重并排序后的规则的紧凑存储。
+
+    同一匹配器类型的值（不含前缀）排序后以换行拼接成一个bytes段，各段按类型代码排列，
+    每条规则只占用 "值长度 + 1" 字节，而不是一个完整的Python字符串对象加集合槽位。
+    值可以是str或bytes；UTF-8编码保持码位顺序，两者的排序结果一致。
+    """
+
+    __slots__ = ("_segments", "_count")
+
+    def __init__(self, groups: Dict[int, Iterable[Union[str, bytes]]]):
+        """
+        Args:
+            groups: {类型代码: 值的集合}，重复项会被去除
+        """
+        groups = {kind: _encode_values(values) for kind, values in groups.items()}
+        # 无前缀的空值不是有效规则；带前缀的空值（"keyword:"匹配所有域名）保留
+        groups.get(KIND_RAW, set()).discard(b"")
+        groups = {kind: values for kind, values in groups.items() if values}
+        if KIND_RAW in groups and len(groups) > 1:
+            # 有无前缀混合时只能按完整文本排序，此时整体作为一个无前缀段存储
+            merged = groups.pop(KIND_RAW)
+            for kind, values in groups.items():
+                prefix = KIND_PREFIXES[kind]
+                merged.update(prefix + value for value in values)
+            groups = {KIND_RAW: merged}
+
+        segments = []
+        count = 0
+        for kind in sorted(groups):
+            values = sorted(groups[kind])
+            segments.append((kind, b"\n".join(values), len(values)))
+            count += len(values)
+        self._segments = tuple(segments)
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        """紧凑存储占用的字节数（不含对象头）。"""
+        return sum(len(blob) for _, blob, _ in self._segments)
+
+    def iter_entries(self) -> Iterator[Tuple[int, bytes]]:
+        """按规则文本顺序遍历 (类型代码, 值)。"""
+        for kind, blob, count in self._segments:
+            for value in _iter_split(blob, count):
+                yield kind, value
+
+    def iter_lines(self) -> Iterator[bytes]:
+        """按排序顺序遍历完整的Mosdns规则行（bytes，不含换行符）。"""
+        for kind, blob, count in self._segments:
+            prefix = KIND_PREFIXES[kind]
+            if prefix:
+                for value in _iter_split(blob, count):
+                    yield prefix + value
+            else:
+                yield from _iter_split(blob, count)
+
+
+class SpilledRuleColumn:
+    """
+    保存在磁盘文件中的已排序、去重的规则列，接口与PackedRuleColumn一致。
+
+    用于内存预算模式：规则行按完整文本字节序逐行写入文件，遍历时流式读取，
+    内存中只保留文件路径和条目数。
+    """
+
+    __slots__ = ("_path", "_count", "_buffer_size")
+
+    def __init__(self, path: str, count: int, buffer_size: int = 65536):
+        """
+        Args:
+            path: 每行一条规则的有序文件
+            count: 规则条数
+            buffer_size: 读取文件时的缓冲区大小
+        """
+        self._path = path
+        self._count = count
+        self._buffer_size = buffer_size
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def nbytes(self) -> int:
+        """占用的内存字节数，规则内容都在磁盘上，因此为0。"""
+        return 0
+
+    def iter_lines(self) -> Iterator[bytes]:
+        """按排序顺序遍历完整的Mosdns规则行（bytes，不含换行符）。"""
+        with open(self._path, "rb", buffering=self._buffer_size) as f:
+            for line in f:
+                yield line[:-1]
+
+
+class OrderedRuleColumn:
+    """
+    按给定顺序保存的规则列，用于输出顺序不是文本顺序的场景（例如按数值排序的CIDR）。
+
+    只应作为某策略某内容类型的唯一规则列使用，多列归并要求各列按文本排序。
+    """
+
+    __slots__ = ("_blob", "_count")
+
+    def __init__(self, lines: List[bytes]):
+        """
+        Args:
+            lines: 不含换行符且互不重复的规则行
+        """
+        self._blob = b"\n".join(lines)
+        self._count = len(lines)
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        """紧凑存储占用的字节数（不含对象头）。"""
+        return len(self._blob)
+
+    def iter_lines(self) -> Iterator[bytes]:
+        """按给定顺序遍历规则行。"""
+        yield from _iter_split(self._blob, self._count)
+
+
+RuleColumn = Union[PackedRuleColumn, SpilledRuleColumn, OrderedRuleColumn]
+# 对单个规则列做与某阶段相同处理的函数：(策略, 规则列) -> 规则列
+ColumnRewrite = Callable[[str, RuleColumn], RuleColumn]
+
+
+def merge_sorted_lines(columns: List[RuleColumn]) -> Iterator[bytes]:
+    """
+    对多个已排序的列做k路归并并去重，只需要常数级的额外内存。
+
+    Args:
+        columns: 已排序的规则列
+
+    Yields:
+        bytes: 全局有序且不重复的规则行
+    """
+    if len(columns) == 1:
+        yield from columns[0].iter_lines()
+        return
+    previous = None
+    for line in heapq.merge(*(column.iter_lines() for column in columns)):
+        if line != previous:
+            yield line
+            previous = line
+
+
+def filter_column(column: RuleColumn, removed: Set[bytes]) -> RuleColumn:
+    """
+    从规则列中去除指定的规则行。
+
+    Args:
+        column: 规则列
+        removed: 要去除的完整规则行
+
+    Returns:
+        RuleColumn: 去除后的新列；没有条目被删除时返回原列
+    """
+    if not removed or not any(line in removed for line in column.iter_lines()):
+        return column
+    groups: Dict[int, Set[bytes]] = {}
+    for line in column.iter_lines():
+        if line not in removed:
+            kind, value = split_line(line)
+            groups.setdefault(kind, set()).add(value)
+    return PackedRuleColumn(groups)
+
+
+class ProviderCorpus:
+    """
+    一次生成中某个规则提供者解析后的冻结规则集合。
+
+    每个提供者每次生成只解析一次；引用它的各条RULE-SET规则和各策略只持有该对象的引用，
+    内存和CPU开销随提供者的唯一内容增长，而不是随引用次数增长。
+    """
+
+    __slots__ = ("_name", "_columns")
+
+    def __init__(self, name: str, groups_by_type: Dict[str, Dict[int, Set[bytes]]]):
+        """
+        Args:
+            name: 提供者名称
+            groups_by_type: {内容类型: {类型代码: 去掉前缀的值的集合}}
+        """
+        self._name = name
+        self._columns = {
+            content_type: PackedRuleColumn(groups)
+            for content_type, groups in groups_by_type.items()
+            if any(groups.values())
+        }
+
+    @classmethod
+    def from_columns(cls, name: str, columns: Dict[str, RuleColumn]) -> "ProviderCorpus":
+        """
+        由已经构建好的规则列创建规则集合（例如内存预算模式下落盘的列）。
+
+        Args:
+            name: 提供者名称
+            columns: {内容类型: 规则列}，空列会被忽略
+        """
+        corpus = cls(name, {})
+        corpus._columns = {
+            content_type: column for content_type, column in columns.items() if len(column)
+        }
+        return corpus
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def __len__(self) -> int:
+        return sum(len(column) for column in self._columns.values())
+
+    def content_types(self) -> List[str]:
+        """返回包含规则的内容类型。"""
+        return list(self._columns)
+
+    def column(self, content_type: str) -> Optional[RuleColumn]:
+        """获取某内容类型的规则列，不存在时返回None。"""
+        return self._columns.get(content_type)
+
+    def count(self, content_type: str) -> int:
+        """返回某内容类型的规则数量。"""
+        column = self._columns.get(content_type)
+        return len(column) if column is not None else 0
+
+    @property
+    def nbytes(self) -> int:
+        """紧凑存储占用的字节数（不含对象头）。"""
+        return sum(column.nbytes for column in self._columns.values())
+
+
+class RuleStore:
+    """
+    规则聚合结果的紧凑存储，替代 {policy: {content_type: {provider: set(str)}}} 嵌套字典。
+
+    RULE-SET引用的提供者以共享的ProviderCorpus保存，按小整数ID记录在各策略的成员列表中；
+    单条规则按策略打包为PackedRuleColumn。写入最终文件时按策略对各列做流式归并去重，
+    不再为每个策略构建完整的集合。
+    """
+
+    # 单条规则使用的伪提供者名称
+    INLINE_PROVIDER = "single_rules"
+    # 成员列表中代表单条规则的ID
+    _INLINE_ID = -1
+
+    def __init__(self, policies: Iterable[str]):
+        """
+        初始化RuleStore。
+
+        Args:
+            policies: 需要聚合的策略名称，决定输出顺序
+        """
+        self.logger = logging.getLogger(__name__)
+        self._policies = list(policies)
+        self._corpus_ids: Dict[str, int] = {}
+        self._corpora: List[ProviderCorpus] = []
+        self._members: Dict[Tuple[str, str], List[int]] = {}
+        self._inline_columns: Dict[Tuple[str, str], PackedRuleColumn] = {}
+        self._pending: Dict[Tuple[str, str], Dict[int, Set[str]]] = {}
+        # 按规则顺序记录的认领：(策略, 内容类型, 成员ID, 单条规则)，RULE-SET的单条规则为None
+        self._claims: List[Tuple[str, str, int, Optional[str]]] = []
+        # 排他解析等阶段替换后的规则列：{(策略, 内容类型): [(提供者名称, 规则列)]}
+        self._overrides: Dict[Tuple[str, str], List[Tuple[str, RuleColumn]]] = {}
+        # 替换规则列时登记的逐列改写，按登记顺序应用到iter_claims产出的认领上：{内容类型: [改写函数]}
+        self._claim_rewrites: Dict[str, List[ColumnRewrite]] = {}
+        self._frozen = False
+
+    def _add_member(self, policy: str, content_type: str, member_id: int) -> None:
+        if self._frozen:
+            raise RuntimeError("RuleStore已冻结，不能再添加规则")
+        members = self._members.setdefault((policy, content_type), [])
+        if member_id not in members:
+            members.append(member_id)
+
+    def get_corpus(self, provider_name: str) -> Optional[ProviderCorpus]:
+        """获取本次生成中已解析的提供者规则集合，尚未解析时返回None。"""
+        corpus_id = self._corpus_ids.get(provider_name)
+        return self._corpora[corpus_id] if corpus_id is not None else None
+
+    def add_corpus(self, corpus: ProviderCorpus) -> None:
+        """
+        登记一个已解析的提供者规则集合。
+
+        Args:
+            corpus: 提供者规则集合，同名提供者只能登记一次
+        """
+        if corpus.name in self._corpus_ids:
+            raise ValueError(f"提供者已登记: {corpus.name}")
+        self._corpus_ids[corpus.name] = len(self._corpora)
+        self._corpora.append(corpus)
+
+    def attach(self, policy: str, provider_name: str) -> None:
+        """
+        让策略引用一个已登记的提供者规则集合（不复制规则）。
+
+        Args:
+            policy: 解析后的策略
+            provider_name: 已通过add_corpus登记的提供者名称
+        """
+        corpus_id = self._corpus_ids[provider_name]
+        for content_type in self._corpora[corpus_id].content_types():
+            self._add_member(policy, content_type, corpus_id)
+            self._claims.append((policy, content_type, corpus_id, None))
+
+    def add_rule(self, policy: str, content_type: str, rule: str) -> None:
+        """
+        添加单条规则，在freeze时统一打包。
+
+        Args:
+            policy: 解析后的策略
+            content_type: 内容类型 (domain, ipv4, ipv6)
+            rule: Mosdns格式的规则
+        """
+        self._add_member(policy, content_type, self._INLINE_ID)
+        self._claims.append((policy, content_type, self._INLINE_ID, rule))
+        kind, value = split_rule(rule)
+        self._pending.setdefault((policy, content_type), {}).setdefault(kind, set()).add(value)
+
+    def freeze(self) -> None:
+        """打包所有待处理的单条规则，此后存储只读。"""
+        for key, groups in self._pending.items():
+            self._inline_columns[key] = PackedRuleColumn(groups)
+        self._pending.clear()
+        self._frozen = True
+        self.logger.debug(
+            "规则存储已冻结",
+            extra={
+                "提供者数量": len(self._corpora),
+                "提供者条目数量": sum(len(corpus) for corpus in self._corpora),
+                "单条规则数量": sum(len(column) for column in self._inline_columns.values()),
+                "紧凑存储字节数": sum(corpus.nbytes for corpus in self._corpora)
+                + sum(column.nbytes for column in self._inline_columns.values())
+            }
+        )
+
+    def policies(self) -> List[str]:
+        """返回策略列表（按输出顺序）。"""
+        return list(self._policies)
+
+    def iter_claims(self, content_type: str) -> Iterator[Tuple[str, str, RuleColumn]]:
+        """
+        按Mihomo规则顺序遍历某内容类型的认领。
+
+        同一提供者被多次引用时每次引用都会产出一次；单条规则各自产出一个只含该规则的列。
+        之前的阶段通过replace_columns登记了逐列改写时，产出的规则列已经过这些改写；
+        同一策略对同一提供者的多次认领产出同一个改写后的列对象。
+
+        Yields:
+            tuple: (策略, 提供者名称, 规则列)
+        """
+        rewrites = self._claim_rewrites.get(content_type, [])
+        # {(策略, 成员ID): 改写后的规则列}
+        rewritten: Dict[Tuple[str, int], RuleColumn] = {}
+        for policy, claim_type, member_id, rule in self._claims:
+            if claim_type != content_type:
+                continue
+            if member_id == self._INLINE_ID:
+                kind, value = split_rule(rule)
+                yield policy, self.INLINE_PROVIDER, self._rewrite(rewrites, policy, PackedRuleColumn({kind: (value,)}))
+                continue
+            corpus = self._corpora[member_id]
+            column = corpus.column(content_type)
+            if rewrites and column is not None:
+                key = (policy, member_id)
+                if key not in rewritten:
+                    rewritten[key] = self._rewrite(rewrites, policy, column)
+                column = rewritten[key]
+            yield policy, corpus.name, column
+
+    @staticmethod
+    def _rewrite(rewrites: List[ColumnRewrite], policy: str, column: RuleColumn) -> RuleColumn:
+        """按登记顺序对规则列应用各阶段的改写。"""
+        for rewrite in rewrites:
+            column = rewrite(policy, column)
+        return column
+
+    def replace_columns(self, content_type: str, columns: Dict[str, List[Tuple[str, RuleColumn]]],
+                        rewrite: Optional[ColumnRewrite] = None) -> None:
+        """
+        用处理后的规则列替换各策略某内容类型的规则，共享的提供者规则集合本身不受影响。
+
+        iter_claims按认领遍历的是原始的提供者规则，后续按认领处理的阶段（如排他解析）
+        要看到本阶段的结果，本阶段需要提供对单个规则列做相同处理的rewrite。
+
+        Args:
+            content_type: 内容类型
+            columns: {策略: [(提供者名称, 规则列)]}
+            rewrite: 可选，(策略, 规则列) -> 处理后的规则列，此后由iter_claims应用到每个认领
+        """
+        if not self._frozen:
+            raise RuntimeError("RuleStore冻结后才能替换规则列")
+        for policy in self._policies:
+            self._overrides[(policy, content_type)] = list(columns.get(policy, []))
+        if rewrite is not None:
+            self._claim_rewrites.setdefault(content_type, []).append(rewrite)
+
+    def iter_provider_columns(self, policy: str, content_type: str) -> Iterator[Tuple[str, RuleColumn]]:
+        """
+        遍历某策略某内容类型下各提供者的规则列。
+
+        Yields:
+            tuple: (提供者名称, 规则列)，单条规则的提供者名称为INLINE_PROVIDER
+        """
+        overrides = self._overrides.get((policy, content_type))
+        if overrides is not None:
+            yield from overrides
+            return
+        for member_id in self._members.get((policy, content_type), []):
+            if member_id == self._INLINE_ID:
+                column = self._inline_columns.get((policy, content_type))
+                name = self.INLINE_PROVIDER
+            else:
+                corpus = self._corpora[member_id]
+                column = corpus.column(content_type)
+                name = corpus.name
+            if column is not None:
+                yield name, column
+
+    def iter_lines(self, policy: str, content_type: str) -> Iterator[bytes]:
+        """
+        按排序顺序遍历某策略某内容类型下去重后的全部规则行。
+
+        Yields:
+            bytes: Mosdns格式的规则行
+        """
+        columns = [column for _, column in self.iter_provider_columns(policy, content_type)]
+        if columns:
+            yield from merge_sorted_lines(columns)
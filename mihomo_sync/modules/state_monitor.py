@@ -46,6 +46,9 @@ class StateMonitor:
         self._last_state_snapshot = None
         self._last_state_changes = []  # 用于存储上一次的变更信息
         self._debounce_task = None
+        # 是否正在生成，以及生成期间是否收到了再生成一次的请求
+        self._generating = False
+        self._generation_requested = False
         self.policy_resolver = PolicyResolver()
         self.logger.info(
             "状态监控器初始化完成",
@@ -313,23 +316,7 @@ class StateMonitor:
                         }
                     )
                     
-                    # 取消任何现有的去抖动任务
-                    if self._debounce_task and not self._debounce_task.done():
-                        self._debounce_task.cancel()
-                        try:
-                            await self._debounce_task
-                        except asyncio.CancelledError:
-                            pass
-                        self.logger.debug("已取消之前的去抖动任务")
-                    
-                    # 创建新的去抖动任务
-                    self._debounce_task = asyncio.create_task(self._debounce_and_trigger())
-                    self.logger.debug(
-                        "已创建新的去抖动任务",
-                        extra={
-                            "debounce_interval": self.debounce_interval
-                        }
-                    )
+                    await self._schedule_generation()
                 elif self._last_state_hash is None:
                     self.logger.debug("首次状态检查完成，未检测到变化")
                 else:
@@ -366,6 +353,42 @@ class StateMonitor:
                 # 等待后重试
                 await asyncio.sleep(self.polling_interval)
 
+    async def _schedule_generation(self):
+        """取消尚未触发的去抖动任务，并创建新的去抖动任务。"""
+        self._generation_requested = False
+        # 取消任何现有的去抖动任务
+        if self._debounce_task and not self._debounce_task.done():
+            self._debounce_task.cancel()
+            try:
+                await self._debounce_task
+            except asyncio.CancelledError:
+                pass
+            self.logger.debug("已取消之前的去抖动任务")
+        
+        # 创建新的去抖动任务
+        self._debounce_task = asyncio.create_task(self._debounce_and_trigger())
+        self.logger.debug(
+            "已创建新的去抖动任务",
+            extra={
+                "debounce_interval": self.debounce_interval
+            }
+        )
+
+    async def trigger_generation(self, reason: str = "收到手动触发请求"):
+        """
+        在没有状态变化时也触发一次（经过去抖动的）规则生成。
+
+        正在生成时不打断当前生成，而是在它结束后再生成一次。
+
+        Args:
+            reason: 触发原因，用于日志
+        """
+        self.logger.info(f"{reason}，将重新生成规则")
+        if self._generating:
+            self._generation_requested = True
+            return
+        await self._schedule_generation()
+
     async def _debounce_and_trigger(self):
         """等待去抖动间隔，然后触发规则生成过程。"""
         self.logger.debug(
@@ -403,6 +426,7 @@ class StateMonitor:
         """使用新的两阶段方法基于Mihomo的状态生成Mosdns规则。"""
         self.logger.info("检测到状态变化，开始执行规则生成流程...")
         generation_start_time = time.time()
+        self._generating = True
         
         try:
             # 检查所需组件是否可用
@@ -410,24 +434,24 @@ class StateMonitor:
                 self.logger.error("Orchestrator或Merger未初始化")
                 return
                 
-            # 阶段一：分发。调用Orchestrator生成中间文件。
-            self.logger.debug("阶段一：正在生成中间规则文件...")
-            intermediate_start_time = time.time()
-            intermediate_path = await self.orchestrator.run()
-            intermediate_duration = time.time() - intermediate_start_time
+            # 阶段一：分发。调用Orchestrator在内存中聚合规则。
+            self.logger.debug("阶段一：正在聚合规则...")
+            aggregate_start_time = time.time()
+            aggregated_rules = await self.orchestrator.run()
+            aggregate_duration = time.time() - aggregate_start_time
             
             self.logger.debug(
-                f"中间文件成功生成于: {intermediate_path}",
+                "规则聚合完成",
                 extra={
-                    "阶段一耗时_秒": round(intermediate_duration, 3)
+                    "阶段一耗时_秒": round(aggregate_duration, 3)
                 }
             )
 
-            # 阶段二：合并。调用Merger生成最终文件。
-            self.logger.debug("阶段二：正在合并规则文件...")
+            # 阶段二：合并。聚合结果直接交给Merger生成最终文件。
+            self.logger.debug("阶段二：正在写入最终规则文件...")
             merge_start_time = time.time()
             final_path = self.mosdns_config_path
-            self.merger.merge_from_intermediate(intermediate_path, final_path)
+            self.merger.merge_from_store(aggregated_rules, final_path)
             merge_duration = time.time() - merge_start_time
             
             self.logger.debug(
@@ -481,4 +505,11 @@ class StateMonitor:
                     "总耗时_秒": round(total_duration, 3)
                 },
                 exc_info=True
-            )
\ No newline at end of file
+            )
+        finally:
+            self._generating = False
+
+        if self._generation_requested:
+            # 生成期间收到的触发请求在本次生成结束后执行
+            self._generation_requested = False
+            self._debounce_task = asyncio.create_task(self._debounce_and_trigger())
\ No newline at end of file
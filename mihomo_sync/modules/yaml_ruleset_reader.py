@@ -0,0 +1,126 @@
+import io
+import logging
+from typing import Iterator, List, TextIO
+
+import yaml
+
+from mihomo_sync.modules.cache_compression import open_decompressed
+
+try:
+    from yaml import CSafeLoader as _EventLoader  # libyaml加速的解析器
+except ImportError:  # 未编译libyaml时使用纯Python解析器
+    from yaml import SafeLoader as _EventLoader
+
+
+class YamlRulesetReader:
+    """
+    YAML格式规则集（Mihomo的 format: yaml）的流式读取器。
+
+    规则集文件的结构为顶层映射中的 payload 序列：
+
+        payload:
+          - 'DOMAIN-SUFFIX,example.com'
+          - '+.example.org'
+
+    这里只消费解析事件，逐条产出 payload 序列中的标量，不构建完整的文档对象，
+    内存占用与规则数量无关；压缩存储的缓存文件边读边解压。有libyaml时使用C实现的解析器，否则使用PyYAML的纯Python解析器。
+    payload 中嵌套的映射或序列不是有效的规则，直接跳过。
+    """
+
+    PAYLOAD_KEY = "payload"
+
+    def __init__(self):
+        """
+        初始化YamlRulesetReader。
+        """
+        self.logger = logging.getLogger(__name__)
+
+    @staticmethod
+    def is_accelerated() -> bool:
+        """当前是否使用libyaml加速的解析器。"""
+        return _EventLoader is not yaml.SafeLoader
+
+    @staticmethod
+    def looks_like_yaml(file_path: str) -> bool:
+        """
+        根据第一条有效内容判断文件是否为YAML规则集（以 "payload:" 开头）。
+
+        Args:
+            file_path: 规则集文件路径
+
+        Returns:
+            bool: 是否为YAML格式
+        """
+        try:
+            with io.TextIOWrapper(open_decompressed(file_path), encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line or line.startswith("#") or line == "---":
+                        continue
+                    return line.startswith(f"{YamlRulesetReader.PAYLOAD_KEY}:")
+        except OSError:
+            return False
+        return False
+
+    def iter_lines(self, file_path: str) -> Iterator[str]:
+        """
+        流式读取YAML规则集文件中的 payload 条目。
+
+        Args:
+            file_path: 规则集文件路径
+
+        Yields:
+            str: payload 中的每个条目，格式与文本规则集的行相同
+
+        Raises:
+            yaml.YAMLError: 文件不是合法的YAML
+        """
+        with io.TextIOWrapper(open_decompressed(file_path), encoding="utf-8", errors="replace") as f:
+            count = 0
+            for line in self.iter_payload(f):
+                count += 1
+                yield line
+        self.logger.debug(
+            f"已读取YAML规则集: {file_path}",
+            extra={"条目数": count, "libyaml": self.is_accelerated()}
+        )
+
+    def iter_payload(self, stream: TextIO) -> Iterator[str]:
+        """
+        从YAML流中逐条产出顶层 payload 序列的标量条目。
+
+        Args:
+            stream: YAML文本流
+
+        Yields:
+            str: payload 条目
+        """
+        # 每层集合记录 [是否为映射, 下一个标量是否为键]
+        stack: List[List[bool]] = []
+        key = None
+        payload_depth = 0
+        for event in yaml.parse(stream, Loader=_EventLoader):
+            if isinstance(event, yaml.ScalarEvent):
+                if payload_depth and len(stack) == payload_depth:
+                    yield event.value
+                elif stack and stack[-1][0] and stack[-1][1]:
+                    key = event.value
+                    stack[-1][1] = False
+                elif stack and stack[-1][0]:
+                    stack[-1][1] = True
+            elif isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+                is_mapping = isinstance(event, yaml.MappingStartEvent)
+                if len(stack) == 1 and stack[0][0] and not stack[0][1] and not is_mapping \
+                        and key == self.PAYLOAD_KEY:
+                    payload_depth = 2
+                if stack and stack[-1][0]:
+                    stack[-1][1] = not stack[-1][1]
+                stack.append([is_mapping, True])
+            elif isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+                stack.pop()
+                if payload_depth and len(stack) < payload_depth:
+                    # 顶层只有一个payload，读完即可结束，不再解析文件的剩余部分
+                    return
+            elif isinstance(event, yaml.AliasEvent):
+                if stack and stack[-1][0]:
+                    stack[-1][1] = not stack[-1][1]
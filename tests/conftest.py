@@ -0,0 +1,65 @@
+import pytest
+import yaml
+
+from mihomo_sync.config import ConfigManager
+
+
+DEFAULT_PROXIES = {
+    "DIRECT": {"type": "Direct"},
+    "REJECT": {"type": "Reject"},
+    "PROXY": {"type": "Selector", "now": "node"},
+    "node": {"type": "Shadowsocks"},
+}
+
+
+class FakeApiClient:
+    """返回固定规则、提供者和代理数据的Mihomo API客户端替身。"""
+
+    def __init__(self, rules, providers, proxies=None):
+        self.rules = rules
+        self.providers = providers
+        self.proxies = proxies or DEFAULT_PROXIES
+
+    async def get_rules(self):
+        return {"rules": [dict(rule) for rule in self.rules]}
+
+    async def get_rule_providers(self):
+        return {"providers": {name: dict(info) for name, info in self.providers.items()}}
+
+    async def get_proxies(self):
+        return {"proxies": dict(self.proxies)}
+
+
+def _reset_config():
+    ConfigManager._instance = None
+    ConfigManager._initialized = False
+
+
+@pytest.fixture
+def make_config(tmp_path):
+    """按给定的配置项创建ConfigManager（单例在每次创建前和测试结束后重置）。"""
+    def factory(**overrides):
+        _reset_config()
+        config = {
+            "mihomo_api_url": "http://127.0.0.1:9090",
+            "mihomo_api_timeout": 5,
+            "api_retry_config": {"max_retries": 0, "initial_backoff": 0.01, "max_backoff": 0.01, "jitter": False},
+            "polling_interval": 1,
+            "debounce_interval": 1,
+            "mosdns_rules_path": str(tmp_path / "rules"),
+            "mosdns_reload_command": "true",
+            "log_level": "WARNING",
+        }
+        config.update(overrides)
+        path = tmp_path / "config.yaml"
+        path.write_text(yaml.safe_dump(config), encoding="utf-8")
+        return ConfigManager(str(path))
+
+    yield factory
+    _reset_config()
+
+
+@pytest.fixture
+def fake_api_client():
+    """创建FakeApiClient的工厂。"""
+    return FakeApiClient
@@ -0,0 +1,95 @@
+"""
+重新生成本目录下的MRS夹具：python tests/fixtures/mrs/generate.py
+
+按Mihomo的 ConvertToMrs（魔数、行为、条目数、附加数据长度，整体zstd压缩）、
+DomainSet.WriteBin（反转域名排序后按广度优先构建的LOUDS字典树）和
+IpCidrSet.WriteBin（合并后的IP区间，IPv4为映射地址）的字节布局编码 *.list。
+用 `mihomo convert-ruleset domain text domain.list domain.mrs`（ipcidr同理）生成的文件可以直接替换，
+测试只比较解码结果与 *.list 的内容。
+"""
+import ipaddress
+import os
+import struct
+
+import zstandard
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MAGIC = b"MRS\x01"
+
+
+def _set_bit(bitmap, index, value):
+    while len(bitmap) <= index >> 6:
+        bitmap.append(0)
+    if value:
+        bitmap[index >> 6] |= 1 << (index & 63)
+
+
+def _header(behavior, count):
+    return MAGIC + bytes([behavior]) + struct.pack(">q", count) + struct.pack(">q", 0)
+
+
+def encode_domain(lines):
+    # DomainTrie把 "+.X" 同时存为 "X" 和 "+.X"
+    domains = set()
+    for line in lines:
+        if line.startswith("+."):
+            domains.add(line[2:])
+        domains.add(line)
+    keys = sorted(domain[::-1].encode() for domain in domains)
+
+    leaves, label_bitmap, labels = [], [], bytearray()
+    label_index = 0
+    queue = [(0, len(keys), 0)]
+    i = 0
+    while i < len(queue):
+        start, end, column = queue[i]
+        if column == len(keys[start]):
+            start += 1
+            _set_bit(leaves, i, 1)
+        j = start
+        while j < end:
+            first = j
+            while j < end and keys[j][column] == keys[first][column]:
+                j += 1
+            queue.append((first, j, column + 1))
+            labels.append(keys[first][column])
+            _set_bit(label_bitmap, label_index, 0)
+            label_index += 1
+        _set_bit(label_bitmap, label_index, 1)
+        label_index += 1
+        i += 1
+
+    body = bytes([1])
+    for words in (leaves, label_bitmap):
+        body += struct.pack(">q", len(words)) + b"".join(struct.pack(">Q", word) for word in words)
+    body += struct.pack(">q", len(labels)) + bytes(labels)
+    return _header(0, len(lines)) + body
+
+
+def encode_ipcidr(lines):
+    networks = [ipaddress.ip_network(line, strict=False) for line in lines]
+    ranges = []
+    for version in (4, 6):
+        for network in ipaddress.collapse_addresses(n for n in networks if n.version == version):
+            first, last = int(network.network_address), int(network.broadcast_address)
+            if version == 4:
+                first, last = first | 0xFFFF << 32, last | 0xFFFF << 32
+            if ranges and ranges[-1][1] + 1 == first:
+                ranges[-1] = (ranges[-1][0], last)
+            else:
+                ranges.append((first, last))
+    body = bytes([1]) + struct.pack(">q", len(ranges))
+    body += b"".join(first.to_bytes(16, "big") + last.to_bytes(16, "big") for first, last in ranges)
+    return _header(1, len(lines)) + body
+
+
+def main():
+    for behavior, encode in (("domain", encode_domain), ("ipcidr", encode_ipcidr)):
+        with open(os.path.join(HERE, f"{behavior}.list"), encoding="utf-8") as f:
+            lines = [line.strip() for line in f if line.strip()]
+        with open(os.path.join(HERE, f"{behavior}.mrs"), "wb") as f:
+            f.write(zstandard.ZstdCompressor().compress(encode(lines)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+from mihomo_sync.modules.exclusive_resolver import ExclusivePolicyResolver
+from mihomo_sync.modules.matcher_optimizer import MatcherOptimizer
+from mihomo_sync.modules.rule_merger import RuleMerger
+from mihomo_sync.modules.rule_store import KIND_DOMAIN, KIND_KEYWORD, KIND_REGEXP, ProviderCorpus, RuleStore
+
+
+def _read_rules(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read().split("\n")
+
+
+def _build_store():
+    store = RuleStore(["DIRECT", "PROXY", "REJECT"])
+    store.add_corpus(ProviderCorpus("proxy_set", {"domain": {
+        KIND_REGEXP: {b"^(.*\\.)?lowered\\.com$", b"^exact\\.org$", b"^dyn[0-9]+\\.net$"},
+        KIND_KEYWORD: {b"ads", b"badads"},
+    }}))
+    store.add_corpus(ProviderCorpus("direct_set", {"domain": {
+        KIND_DOMAIN: {b"sub.lowered.com", b"exact.org", b"direct.example"},
+    }}))
+    store.attach("PROXY", "proxy_set")
+    store.add_rule("DIRECT", "domain", "regexp:^(.*\\.)?inline\\.net$")
+    store.add_rule("DIRECT", "domain", "keyword:badads")
+    store.attach("DIRECT", "direct_set")
+    store.freeze()
+    return store
+
+
+def test_lowered_entries_reach_output(tmp_path):
+    store = _build_store()
+    MatcherOptimizer().optimize(store)
+    RuleMerger().merge_from_store(store, str(tmp_path))
+
+    proxy = _read_rules(tmp_path / "proxy_domain.txt")
+    assert "domain:lowered.com" in proxy
+    assert "full:exact.org" in proxy
+    assert "keyword:ads" in proxy
+    assert "keyword:badads" not in proxy
+    assert "regexp:^dyn[0-9]+\\.net$" in proxy
+    assert "domain:inline.net" in _read_rules(tmp_path / "direct_domain.txt")
+
+
+def test_exclusive_resolution_keeps_lowered_entries(tmp_path):
+    store = _build_store()
+    MatcherOptimizer().optimize(store)
+    shadowed = ExclusivePolicyResolver().resolve(store)
+    RuleMerger().merge_from_store(store, str(tmp_path))
+
+    proxy = _read_rules(tmp_path / "proxy_domain.txt")
+    assert "domain:lowered.com" in proxy
+    assert "full:exact.org" in proxy
+    assert "keyword:badads" not in proxy
+    assert not any(line.startswith("regexp:^(.*") or line == "regexp:^exact\\.org$" for line in proxy)
+
+    direct = _read_rules(tmp_path / "direct_domain.txt")
+    assert "domain:inline.net" in direct
+    assert "keyword:badads" in direct
+    assert "domain:direct.example" in direct
+    # 被PROXY改写出的 domain:lowered.com / full:exact.org 遮蔽
+    assert "domain:sub.lowered.com" not in direct
+    assert "domain:exact.org" in direct
+    assert shadowed["DIRECT"] == 1
@@ -0,0 +1,36 @@
+from mihomo_sync.modules.mirror_selector import MirrorSelector
+
+
+PATH = "/rules/ads.list"
+PREFIXES = ["https://origin.test", "https://fast.test", "https://slow.test", "https://new.test"]
+
+
+def _hosts(selector):
+    return [MirrorSelector.mirror_of(url) for url in selector.candidates(PREFIXES[0] + PATH)]
+
+
+def test_candidates_keep_config_order_without_history():
+    selector = MirrorSelector(prefix_groups=[PREFIXES])
+
+    assert _hosts(selector) == ["origin.test", "fast.test", "slow.test", "new.test"]
+
+
+def test_unknown_mirror_is_not_tried_before_proven_fast_mirrors():
+    selector = MirrorSelector(prefix_groups=[PREFIXES])
+    selector.record("https://fast.test" + PATH, 0.2, True)
+    selector.record("https://origin.test" + PATH, 1.0, True)
+    selector.record("https://slow.test" + PATH, 5.0, True)
+
+    # 没有记录的镜像按已知耗时的中位数排序，同分时排在已知镜像之后
+    assert _hosts(selector) == ["fast.test", "origin.test", "new.test", "slow.test"]
+
+
+def test_unknown_mirror_follows_single_measured_mirror():
+    selector = MirrorSelector(prefix_groups=[PREFIXES])
+    selector.record("https://slow.test" + PATH, 5.0, True)
+
+    assert _hosts(selector) == ["slow.test", "origin.test", "fast.test", "new.test"]
+
+    # 失败的镜像按惩罚耗时计分，没有记录的镜像取两者的中位数，排在它前面
+    selector.record("https://fast.test" + PATH, 0.0, False)
+    assert _hosts(selector) == ["slow.test", "origin.test", "new.test", "fast.test"]
@@ -0,0 +1,77 @@
+import ipaddress
+import os
+import struct
+
+import pytest
+
+from mihomo_sync.modules.mrs_reader import MrsReader
+
+pytestmark = pytest.mark.skipif(not MrsReader.is_available(), reason="需要zstandard")
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "mrs")
+
+
+def _read_list(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def _write_mrs(path, payload):
+    import zstandard
+    path.write_bytes(zstandard.ZstdCompressor().compress(payload))
+    return str(path)
+
+
+def _decompressed_fixture(name):
+    import zstandard
+    with open(os.path.join(FIXTURES, name), "rb") as f:
+        return zstandard.ZstdDecompressor().stream_reader(f).read()
+
+
+def test_domain_trie_decodes_to_source_rules():
+    lines = list(MrsReader().iter_lines(os.path.join(FIXTURES, "domain.mrs"), "domain"))
+
+    assert all(isinstance(line, bytes) for line in lines)
+    # "+.X" 在字典树中同时存为 "X" 和 "+.X"，解码时只还原一次
+    assert sorted(line.decode() for line in lines) == sorted(_read_list("domain.list"))
+
+
+def test_ipcidr_ranges_decode_to_minimal_cover():
+    lines = [line.decode() for line in MrsReader().iter_lines(os.path.join(FIXTURES, "ipcidr.mrs"), "ipcidr")]
+
+    expected = []
+    source = [ipaddress.ip_network(line) for line in _read_list("ipcidr.list")]
+    for version in (4, 6):
+        expected.extend(str(n) for n in ipaddress.collapse_addresses(n for n in source if n.version == version))
+    assert lines == expected
+    # 不是单个CIDR的区间拆分为多个前缀，IPv4映射地址还原为IPv4
+    assert "3.0.0.0/24" in lines and "3.0.1.0/25" in lines
+    assert "2400:cb00::/31" in lines
+
+
+def test_extra_data_is_skipped(tmp_path):
+    payload = _decompressed_fixture("ipcidr.mrs")
+    extended = payload[:13] + struct.pack(">q", 3) + b"xyz" + payload[21:]
+    path = _write_mrs(tmp_path / "extra.mrs", extended)
+
+    assert list(MrsReader().iter_lines(path, "ipcidr")) == \
+        list(MrsReader().iter_lines(os.path.join(FIXTURES, "ipcidr.mrs"), "ipcidr"))
+
+
+@pytest.mark.parametrize("mutate, message", [
+    (lambda data: b"MRS\x02" + data[4:], "不是有效的MRS文件"),
+    (lambda data: data[:21] + b"\x02" + data[22:], "不支持的MRS数据版本"),
+    (lambda data: data[:-10], "MRS文件意外结束"),
+])
+def test_malformed_files_raise_value_error(tmp_path, mutate, message):
+    path = _write_mrs(tmp_path / "bad.mrs", mutate(_decompressed_fixture("domain.mrs")))
+
+    with pytest.raises(ValueError, match=message):
+        list(MrsReader().iter_lines(path, "domain"))
+
+
+def test_behavior_mismatch_raises_value_error():
+    with pytest.raises(ValueError, match="行为"):
+        list(MrsReader().iter_lines(os.path.join(FIXTURES, "domain.mrs"), "ipcidr"))
+    with pytest.raises(ValueError, match="不支持的行为类型"):
+        list(MrsReader().iter_lines(os.path.join(FIXTURES, "domain.mrs"), "classical"))
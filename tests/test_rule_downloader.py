@@ -0,0 +1,60 @@
+import asyncio
+import hashlib
+import json
+import os
+
+import httpx
+
+from mihomo_sync.modules.rule_downloader import RuleDownloader
+
+
+URL = "https://rules.test/a.list"
+
+
+def _chunked(body: bytes, delay: float):
+    async def stream():
+        for start in range(0, len(body), 1024):
+            await asyncio.sleep(delay)
+            yield body[start:start + 1024]
+    return stream()
+
+
+def test_concurrent_writers_do_not_share_temp_files(tmp_path):
+    bodies = [b"".join(b"+.a%d.example\n" % i for i in range(2000)),
+              b"".join(b"+.bb%d.example\n" % i for i in range(2000))]
+    served = []
+
+    async def handler(request):
+        body = bodies[len(served) % 2]
+        served.append(body)
+        return httpx.Response(200, content=_chunked(body, 0.001))
+
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            downloader = RuleDownloader(client, str(tmp_path), max_retries=0)
+            return await asyncio.gather(
+                downloader._ensure_rule_updated(URL, 0, True),
+                downloader._ensure_rule_updated(URL, 0, True),
+            ), downloader
+
+    results, downloader = asyncio.run(main())
+    assert results == [RuleDownloader.RESULT_UPDATED] * 2
+
+    content_path = downloader.get_cache_path_for_url(URL)
+    with open(content_path, "rb") as f:
+        content = f.read()
+    with open(downloader.get_meta_path(content_path), encoding="utf-8") as f:
+        meta = json.load(f)
+    assert content in bodies
+    assert meta["sha256"] == hashlib.sha256(content).hexdigest()
+    assert meta["size"] == len(content)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(RuleDownloader.TEMP_SUFFIX)]
+
+
+def test_remove_stale_temp_files(tmp_path):
+    (tmp_path / "abc.list").write_bytes(b"x")
+    (tmp_path / "abc.list.k2j3.tmp").write_bytes(b"partial")
+    (tmp_path / "abc.meta.json.9f8e.tmp").write_bytes(b"{")
+
+    assert RuleDownloader.remove_stale_temp_files(str(tmp_path)) == 2
+    assert os.listdir(tmp_path) == ["abc.list"]
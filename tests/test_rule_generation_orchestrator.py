@@ -0,0 +1,347 @@
+import asyncio
+import os
+
+import httpx
+
+from mihomo_sync.modules.rule_downloader import RuleDownloader
+from mihomo_sync.modules.rule_generation_orchestrator import RuleGenerationOrchestrator
+from mihomo_sync.modules.rule_merger import RuleMerger
+from mihomo_sync.modules.rule_store import RuleStore, SpilledRuleColumn
+
+
+def _write_rulesets(directory, domain_count=2000):
+    """写出一组本地规则集文件，返回引用它们的 (规则, 提供者)。"""
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / "domains.list", "w", encoding="utf-8") as f:
+        f.write("# comment\n")
+        for i in range(domain_count):
+            f.write(("+.", "", ".")[i % 3] + f"d{i % 997}.s{i}.example\n")
+        f.write("+.shared.example\n")
+    with open(directory / "classical.yaml", "w", encoding="utf-8") as f:
+        f.write("payload:\n")
+        for i in range(200):
+            f.write(f"  - DOMAIN-SUFFIX,c{i}.example\n  - DOMAIN,www.d{i}.s{i}.example\n")
+            f.write(f"  - IP-CIDR,10.{i}.0.0/16,no-resolve\n")
+        f.write("  - DOMAIN-KEYWORD,tracker\n  - DOMAIN-SUFFIX,shared.example\n  - IP-CIDR6,2001:db8::/32\n")
+    with open(directory / "ip.list", "w", encoding="utf-8") as f:
+        for i in range(300):
+            f.write(f"{1 + i % 200}.{i}.0.0/16\n")
+        f.write("2400:cb00::/32\n::ffff:1.2.3.0/120\n")
+    with open(directory / "catchall.yaml", "w", encoding="utf-8") as f:
+        f.write("payload:\n  - DOMAIN-SUFFIX,*\n  - DOMAIN-SUFFIX,blocked.example\n")
+
+    providers = {
+        "domains": {"behavior": "domain", "format": "text", "path": str(directory / "domains.list")},
+        "classical": {"behavior": "classical", "format": "yaml", "path": str(directory / "classical.yaml")},
+        "ip": {"behavior": "ipcidr", "format": "text", "path": str(directory / "ip.list")},
+        "catchall": {"behavior": "classical", "format": "yaml", "path": str(directory / "catchall.yaml")},
+        "inline": {"type": "inline", "behavior": "domain", "payload": ["+.inline.example", "shared.example"]},
+    }
+    rules = [
+        {"type": "DomainSuffix", "payload": "single.example", "proxy": "PROXY"},
+        {"type": "RuleSet", "payload": "domains", "proxy": "DIRECT"},
+        {"type": "RuleSet", "payload": "classical", "proxy": "PROXY"},
+        {"type": "RuleSet", "payload": "inline", "proxy": "Ads"},
+        {"type": "RuleSet", "payload": "domains", "proxy": "PROXY"},
+        {"type": "RuleSet", "payload": "ip", "proxy": "DIRECT"},
+        {"type": "IPCIDR", "payload": "8.8.8.0/24", "proxy": "PROXY"},
+        {"type": "DomainKeyword", "payload": "ads", "proxy": "REJECT"},
+        {"type": "RuleSet", "payload": "catchall", "proxy": "REJECT"},
+        {"type": "Match", "payload": "", "proxy": "PROXY"},
+    ]
+    return rules, providers
+
+
+PROXIES_WITH_SELECTOR = {
+    "DIRECT": {"type": "Direct"},
+    "REJECT": {"type": "Reject"},
+    "PROXY": {"type": "Selector", "now": "node"},
+    "node": {"type": "Shadowsocks"},
+    "Ads": {"type": "Selector", "now": "REJECT"},
+}
+
+
+def _read_outputs(directory):
+    return {name: (directory / name).read_bytes() for name in sorted(os.listdir(directory))}
+
+
+def _create_orchestrator(api_client, config, transport=None):
+    orchestrator = RuleGenerationOrchestrator(api_client=api_client, config=config)
+    if transport is not None:
+        orchestrator._download_client._client = httpx.AsyncClient(transport=transport)
+    return orchestrator
+
+
+def test_forced_refresh_stops_background_revalidation(make_config, fake_api_client):
+    config = make_config(stale_while_revalidate=True)
+    api_client = fake_api_client(
+        rules=[{"type": "RuleSet", "payload": "remote", "proxy": "PROXY"}],
+        providers={"remote": {"behavior": "domain", "url": "https://rules.test/a.list", "format": "text"}},
+    )
+    state = {"version": 1, "hang": False}
+    release = asyncio.Event()
+
+    async def handler(request):
+        if state["hang"]:
+            await release.wait()
+        return httpx.Response(200, content=b"+.v%d.example\n" % state["version"])
+
+    async def main():
+        orchestrator = _create_orchestrator(api_client, config, httpx.MockTransport(handler))
+        try:
+            await orchestrator.run()
+
+            # 已有缓存：直接使用缓存生成，后台的重新验证挂起在请求上
+            state["hang"] = True
+            await orchestrator.run()
+            background = orchestrator._revalidation_task
+            await asyncio.sleep(0.05)
+            assert background is not None and not background.done()
+
+            # 强制刷新必须先停止后台验证，再在前台下载
+            state.update(hang=False, version=2)
+            store = await orchestrator.run(force_refresh=True)
+            assert background.cancelled()
+            return list(store.iter_lines("PROXY", "domain"))
+        finally:
+            await orchestrator.close()
+
+    assert asyncio.run(main()) == [b"domain:v2.example"]
+    cache_dir = os.path.join(config.get_mosdns_rules_path() + "_intermediate", ".cache")
+    assert not [name for name in os.listdir(cache_dir) if name.endswith(RuleDownloader.TEMP_SUFFIX)]
+
+
+def test_migrate_workspace_layout_removes_stale_workspaces(make_config, fake_api_client):
+    config = make_config()
+    intermediate_dir = config.get_mosdns_rules_path() + "_intermediate"
+    cache_file = os.path.join(intermediate_dir, ".cache", "kept.list")
+    stale_dirs = ["gen-1", "gen-2", ".trash-gen-0", "direct", "proxy"]
+    for name in stale_dirs:
+        os.makedirs(os.path.join(intermediate_dir, name, "domain"))
+    os.makedirs(os.path.dirname(cache_file))
+    with open(cache_file, "w", encoding="utf-8") as f:
+        f.write("+.example.com\n")
+
+    _create_orchestrator(fake_api_client([], {}), config).migrate_workspace_layout()
+
+    assert os.listdir(intermediate_dir) == [".cache"]
+    assert os.path.isfile(cache_file)
+
+
+def test_single_ip_rules_use_converter_content_type(make_config, fake_api_client):
+    orchestrator = _create_orchestrator(fake_api_client([], {}), make_config())
+    store = RuleStore(RuleGenerationOrchestrator.FIXED_POLICIES)
+    proxies = {"proxies": {}}
+    for rule_type, payload in (("IPCIDR", "1.2.3.0/24"), ("IPCIDR6", "::ffff:1.2.3.0/120"),
+                               ("IP-CIDR6", "2001:db8::/32"), ("DomainSuffix", "example.com")):
+        orchestrator._process_single_rule({"type": rule_type, "payload": payload, "proxy": "DIRECT"}, proxies, store)
+    store.freeze()
+
+    assert list(store.iter_lines("DIRECT", "ipv4")) == [b"1.2.3.0/24"]
+    assert list(store.iter_lines("DIRECT", "ipv6")) == [b"2001:db8::/32", b"::ffff:1.2.3.0/120"]
+    assert list(store.iter_lines("DIRECT", "domain")) == [b"domain:example.com"]
+
+
+def test_match_all_domain_rules_are_kept(tmp_path, make_config, fake_api_client):
+    ruleset = tmp_path / "catchall.yaml"
+    ruleset.write_text("payload:\n  - DOMAIN-SUFFIX,*\n", encoding="utf-8")
+    api_client = fake_api_client(
+        rules=[
+            {"type": "RuleSet", "payload": "catchall", "proxy": "PROXY"},
+            {"type": "DomainSuffix", "payload": "*", "proxy": "DIRECT"},
+            {"type": "DomainWildcard", "payload": "*", "proxy": "DIRECT"},
+        ],
+        providers={"catchall": {"behavior": "classical", "format": "yaml", "path": str(ruleset)}},
+    )
+
+    async def main():
+        orchestrator = _create_orchestrator(api_client, make_config())
+        try:
+            return await orchestrator.run()
+        finally:
+            await orchestrator.close()
+
+    store = asyncio.run(main())
+    column = store.get_corpus("catchall").column("domain")
+    assert len(column) == 1 and list(column.iter_lines()) == [b"keyword:"]
+    assert list(store.iter_lines("PROXY", "domain")) == [b"keyword:"]
+    assert list(store.iter_lines("DIRECT", "domain")) == [b"keyword:"]
+    RuleMerger().merge_from_store(store, str(tmp_path / "out"))
+    assert _read_outputs(tmp_path / "out")["proxy_domain.txt"].split(b"\n")[0] == b"keyword:"
+
+
+def test_provider_with_parse_error_is_dropped_not_truncated(tmp_path, make_config, fake_api_client):
+    ruleset = tmp_path / "classical.yaml"
+    ruleset.write_text("payload:\n  - DOMAIN-SUFFIX,good.example\n  - DOMAIN,ok.example\n  - [unclosed\n",
+                       encoding="utf-8")
+    config = make_config()
+    api_client = fake_api_client(
+        rules=[{"type": "RuleSet", "payload": "local", "proxy": "PROXY"}],
+        providers={"local": {"behavior": "classical", "format": "yaml", "path": str(ruleset)}},
+    )
+
+    async def main():
+        orchestrator = _create_orchestrator(api_client, config)
+        try:
+            broken = await orchestrator.run()
+            broken_cached = "local" in orchestrator._corpus_cache
+            ruleset.write_text("payload:\n  - DOMAIN-SUFFIX,good.example\n  - DOMAIN,ok.example\n",
+                               encoding="utf-8")
+            fixed = await orchestrator.run()
+            return broken, broken_cached, fixed
+        finally:
+            await orchestrator.close()
+
+    broken, broken_cached, fixed = asyncio.run(main())
+    assert broken.get_corpus("local") is None
+    assert list(broken.iter_lines("PROXY", "domain")) == []
+    assert not broken_cached
+    assert list(fixed.iter_lines("PROXY", "domain")) == [b"domain:good.example", b"full:ok.example"]
+
+
+def test_ip_aggregation_is_skipped_in_memory_budget_mode(tmp_path, caplog, make_config, fake_api_client):
+    ruleset = tmp_path / "ip.list"
+    ruleset.write_text("1.0.0.0/24\n1.0.1.0/24\n", encoding="utf-8")
+    api_client = fake_api_client(
+        rules=[{"type": "RuleSet", "payload": "ip", "proxy": "DIRECT"}],
+        providers={"ip": {"behavior": "ipcidr", "format": "text", "path": str(ruleset)}},
+    )
+
+    async def generate(config):
+        orchestrator = _create_orchestrator(api_client, config)
+        try:
+            return list((await orchestrator.run()).iter_lines("DIRECT", "ipv4"))
+        finally:
+            await orchestrator.close()
+
+    assert asyncio.run(generate(make_config(collapse_ip_outputs=True))) == [b"1.0.0.0/23"]
+    assert asyncio.run(generate(make_config(collapse_ip_outputs=True, resolve_ip_conflicts=True,
+                                            generation_memory_budget_mb=4))) == [b"1.0.0.0/24", b"1.0.1.0/24"]
+    assert "内存预算模式下不支持IP规则合并和冲突解析" in caplog.text
+
+
+def test_direct_write_matches_intermediate_file_merge(tmp_path, make_config, fake_api_client):
+    rules, providers = _write_rulesets(tmp_path / "rulesets")
+    api_client = fake_api_client(rules, providers, PROXIES_WITH_SELECTOR)
+    config = make_config(intermediate_debug_dump=True)
+
+    async def main():
+        orchestrator = _create_orchestrator(api_client, config)
+        try:
+            return await orchestrator.run(), orchestrator.workspace_dir
+        finally:
+            await orchestrator.close()
+
+    store, workspace_dir = asyncio.run(main())
+    merger = RuleMerger()
+    merger.merge_from_intermediate(workspace_dir, str(tmp_path / "from_intermediate"))
+    merger.merge_from_store(store, str(tmp_path / "from_store"))
+
+    expected = _read_outputs(tmp_path / "from_intermediate")
+    assert set(expected) == {"direct_domain.txt", "direct_ipv4.txt", "direct_ipv6.txt",
+                             "proxy_domain.txt", "proxy_ipv4.txt", "proxy_ipv6.txt", "reject_domain.txt"}
+    assert _read_outputs(tmp_path / "from_store") == expected
+    assert b"domain:single.example" in expected["proxy_domain.txt"].split(b"\n")
+    assert b"domain:inline.example" in expected["reject_domain.txt"].split(b"\n")
+
+
+def test_memory_budget_mode_output_matches_in_memory_mode(tmp_path, caplog, make_config, fake_api_client):
+    # 约40000条域名规则，1MB预算下外部排序会写出多个有序段
+    rules, providers = _write_rulesets(tmp_path / "rulesets", domain_count=40000)
+    api_client = fake_api_client(rules, providers, PROXIES_WITH_SELECTOR)
+
+    async def generate(config, output_dir):
+        orchestrator = _create_orchestrator(api_client, config)
+        try:
+            store = await orchestrator.run()
+            RuleMerger().merge_from_store(store, str(output_dir))
+            return store
+        finally:
+            await orchestrator.close()
+
+    asyncio.run(generate(make_config(), tmp_path / "in_memory"))
+    caplog.set_level("DEBUG", logger="mihomo_sync.modules.rule_generation_orchestrator")
+    store = asyncio.run(generate(make_config(generation_memory_budget_mb=1), tmp_path / "budget"))
+
+    assert isinstance(store.get_corpus("domains").column("domain"), SpilledRuleColumn)
+    assert max(record.__dict__.get("排序段数量", 0) for record in caplog.records) > 1
+    expected = _read_outputs(tmp_path / "in_memory")
+    assert _read_outputs(tmp_path / "budget") == expected
+    # DOMAIN-SUFFIX,* 产出的空值规则在两种模式下都要保留
+    assert b"keyword:" in expected["reject_domain.txt"].split(b"\n")
+
+
+def test_memory_budget_bounds_parse_chunks_and_batches(make_config, fake_api_client):
+    api_client = fake_api_client([], {})
+
+    def parse_sizes(config):
+        async def main():
+            orchestrator = _create_orchestrator(api_client, config)
+            try:
+                orchestrator._prepare_generation()
+                return orchestrator._parse_chunk_size, orchestrator._parse_batch_size
+            finally:
+                await orchestrator.close()
+
+        return asyncio.run(main())
+
+    default_chunk, default_batch = parse_sizes(make_config())
+    chunk_size, batch_size = parse_sizes(make_config(generation_memory_budget_mb=1))
+    # 1MB预算下分块和分批产生的临时对象都不应超过预算的一小部分
+    assert chunk_size < default_chunk and batch_size < default_batch
+    assert chunk_size * 6 <= 1024 * 1024 // 4 and batch_size * 128 <= 1024 * 1024 // 4
+    assert parse_sizes(make_config(generation_memory_budget_mb=1024)) == (default_chunk, default_batch)
+
+
+def test_reused_corpus_is_reparsed_after_cached_file_changes(tmp_path, make_config, fake_api_client):
+    url = "https://rules.test/remote.list"
+    api_client = fake_api_client(
+        rules=[{"type": "RuleSet", "payload": "remote", "proxy": "PROXY"}],
+        providers={"remote": {"behavior": "domain", "url": url, "format": "text", "interval": 3600}},
+    )
+    state = {"content": b"+.alpha.example\n", "requests": 0}
+
+    def handler(request):
+        state["requests"] += 1
+        if request.headers.get("If-None-Match") == '"%d"' % hash(state["content"]):
+            return httpx.Response(304)
+        return httpx.Response(200, content=state["content"], headers={"ETag": '"%d"' % hash(state["content"])})
+
+    async def main():
+        orchestrator = _create_orchestrator(api_client, make_config(), httpx.MockTransport(handler))
+        try:
+            store = await orchestrator.run()
+            first = store.get_corpus("remote")
+            assert orchestrator._reused_corpus_count == 0
+
+            # 缓存在有效期内且文件未变：不联网，直接复用上次的解析结果
+            store = await orchestrator.run()
+            assert state["requests"] == 1
+            assert orchestrator._reused_corpus_count == 1
+            assert store.get_corpus("remote") is first
+
+            # 缓存文件被原地改写（大小不变）：签名变化，必须重新解析
+            downloader = RuleDownloader(orchestrator._download_client.client, orchestrator._get_cache_dir())
+            cache_path = downloader.get_cache_path_for_url(url)
+            with open(cache_path, "wb") as f:
+                f.write(b"+.bravo.example\n")
+            stat = os.stat(cache_path)
+            os.utime(cache_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+            store = await orchestrator.run()
+            assert orchestrator._reused_corpus_count == 0
+            assert store.get_corpus("remote") is not first
+            RuleMerger().merge_from_store(store, str(tmp_path / "modified"))
+            outputs = b"".join(_read_outputs(tmp_path / "modified").values())
+            assert b"bravo.example" in outputs and b"alpha.example" not in outputs
+
+            # 强制刷新下载到新内容：下载结果为已更新，同样重新解析
+            state["content"] = b"+.charlie.example\n"
+            store = await orchestrator.run(force_refresh=True)
+            assert orchestrator._reused_corpus_count == 0
+            RuleMerger().merge_from_store(store, str(tmp_path / "updated"))
+            outputs = b"".join(_read_outputs(tmp_path / "updated").values())
+            assert b"charlie.example" in outputs and b"bravo.example" not in outputs
+        finally:
+            await orchestrator.close()
+
+    asyncio.run(main())